@@ -0,0 +1,116 @@
+# adding loci to an existing panel
+# new loci are added at the end of the intDBlocus_id order, so the codes of the loci
+# already in the panel keep their positions in the BLOB and the BLOBs of individuals
+# already genotyped only need missing codes appended for the new loci
+# this is done with one set-based UPDATE of the genotype table on the server, rather
+# than reading, decoding, and re-encoding the genotypes of each individual
+#   Multiallelic and Hyperallelic: append one (or ploidy) zero bytes per new locus
+#   Biallelic: the missing codes are packed starting at the first unused bit of the
+#     BLOB, so the last byte of each BLOB is rewritten (keeping the bits in use) when
+#     the old BLOB does not end on a byte boundary
+
+import numpy as np
+import mysql.connector as connector
+from .utils import getPanelInfo, numBits
+from .genotypeCodec import missingCode, codesPerInd, codesToBlob, blobLength
+from .genotypeSummaries import ensureSummaryTables
+from .lookupTables import populateLookupTable
+from .bulkLoad import stagingFile, loadStagingFile
+from .panelDefinition import panelColumnTypes, readDefinitionFile, maxLociInPanel, widenVarcharColumns
+
+# SQL expression for the genotypes column with nNew missing loci appended to a BLOB of nLoci loci
+# any bytes past the expected length of the old BLOB are dropped
+# returns (expression, tuple of parameters)
+def appendMissingSql(panelType : str, ploidy : int, nLoci : int, nNew : int):
+	oldLen = blobLength(panelType, ploidy, nLoci)
+	if panelType != "Biallelic":
+		return ("CONCAT(LEFT(genotypes, %s), %%s)" % oldLen, (bytes(codesPerInd(panelType, ploidy, nNew)),))
+	nb = numBits(2, ploidy)
+	used = (nLoci * nb) % 8 # bits in use in the last byte of the old BLOB
+	tail = codesToBlob(np.full(nNew, missingCode(panelType, ploidy)), panelType, ploidy)
+	if used == 0:
+		return ("CONCAT(LEFT(genotypes, %s), %%s)" % oldLen, (tail,))
+	# shift the missing codes right to start at the first unused bit of the last byte
+	bits = np.unpackbits(np.frombuffer(tail, dtype=np.uint8))[:(nNew * nb)]
+	packed = np.packbits(np.concatenate([np.zeros(used, dtype=np.uint8), bits]))
+	keepMask = (0xFF << (8 - used)) & 0xFF
+	sqlExpr = "CONCAT(LEFT(genotypes, %s), CHAR((ASCII(SUBSTRING(genotypes, %s, 1)) & %s) | %s USING binary), %%s)" % (
+		oldLen - 1, oldLen, keepMask, int(packed[0]))
+	return (sqlExpr, (packed[1:].tobytes(),))
+
+# add the loci in a panel definition file to an existing panel
+# the file must have the same columns, in the same order, as the file used to make the panel
+# genotypes of the new loci are missing for all individuals already in the panel
+# commits on success
+# returns the number of loci added
+# raises ValueError with a message for the user if the file can't be added
+def appendLoci(cnx : connector, userInfo : dict, panelName : str, fileName : str, batchSize : int = 10000) -> int:
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	ensureSummaryTables(cnx, panelName)
+	colNames, colTypes = panelColumnTypes(cnx, panelName)
+	staging = stagingFile()
+	try:
+		nNew, maxLen, newNames = readDefinitionFile(fileName, staging, colTypes)
+		if nNew == 0:
+			return 0
+		maxLoci = maxLociInPanel(panelType, ploidy)
+		if nLoci + nNew > maxLoci:
+			raise ValueError("Too many loci to store in one panel. The maximum number of loci for this type and ploidy is %s." % maxLoci)
+		# make sure none of the loci are already in the panel
+		newNames = list(newNames)
+		with cnx.cursor() as curs:
+			for i in range(0, len(newNames), batchSize):
+				batchNames = newNames[i:(i + batchSize)]
+				curs.execute("SELECT intDBlocus_name FROM `%s` WHERE intDBlocus_name IN (%s)" % (panelName, ",".join(["%s"] * len(batchNames))),
+					batchNames)
+				inPanel = curs.fetchall()
+				if len(inPanel) > 0:
+					raise ValueError("Locus \"%s\" is already in the panel" % inPanel[0][0])
+		del newNames
+		widenVarcharColumns(cnx, panelName, colNames, maxLen)
+		with cnx.cursor() as curs:
+			curs.execute("SELECT COALESCE(MAX(intDBlocus_id), 0) FROM `%s`" % panelName)
+			lastID = curs.fetchone()[0]
+		# end the transaction so rows loaded on another connection are visible
+		cnx.commit()
+		try:
+			loadStagingFile(cnx, userInfo, panelName, colNames, staging, batchSize)
+		except BaseException:
+			# the fallback inserts are uncommitted on cnx, rows loaded with LOAD DATA are already committed
+			cnx.rollback()
+			with cnx.cursor() as curs:
+				curs.execute("DELETE FROM `%s` WHERE intDBlocus_id > %%s" % panelName, (lastID,))
+			cnx.commit()
+			raise
+	finally:
+		staging.remove()
+
+	try:
+		with cnx.cursor() as curs:
+			# populate lookup table with user supplied values, if any
+			if panelType != "Biallelic" and "intDBalleles" in colNames:
+				tooMany = populateLookupTable(cnx, panelName, panelType, ploidy, batchSize, afterLocusID=lastID)
+				if tooMany is not None:
+					raise ValueError("%s alleles for locus %s is too many to be stored in a %s panel." % (tooMany[1], tooMany[0], panelType))
+			# extend the BLOBs of all individuals
+			sqlExpr, params = appendMissingSql(panelType, ploidy, nLoci, nNew)
+			curs.execute("UPDATE `intDB%s_gt` SET genotypes = %s" % (panelName, sqlExpr), params)
+			curs.execute("SELECT COUNT(*) FROM `intDB%s_gt`" % panelName)
+			nInds = curs.fetchone()[0]
+			# new loci are missing for every individual already genotyped
+			curs.execute("INSERT INTO `intDB{0}_ls` (locus_id, n_missing) SELECT intDBlocus_id, %s FROM `{0}` WHERE intDBlocus_id > %s".format(panelName),
+				(nInds, lastID))
+			curs.execute("UPDATE `intDB%s_iq` SET call_rate = n_called / (n_called + n_missing + %%s), n_missing = n_missing + %%s" % panelName,
+				(nNew, nNew))
+			curs.execute("UPDATE intDBgeno_overview SET number_of_loci = %s WHERE panel_name = %s", (nLoci + nNew, panelName))
+		cnx.commit()
+	except Exception:
+		cnx.rollback()
+		# remove the new loci, which are already committed if they were loaded with LOAD DATA
+		with cnx.cursor() as curs:
+			if panelType != "Biallelic":
+				curs.execute("DELETE FROM `intDB%s_lt` WHERE locus_id > %%s" % panelName, (lastID,))
+			curs.execute("DELETE FROM `%s` WHERE intDBlocus_id > %%s" % panelName, (lastID,))
+		cnx.commit()
+		raise
+	return nNew
@@ -0,0 +1,96 @@
+# bulk loading of rows from a local staging file into a table
+# rows are written to a tab delimited staging file as they are read and validated,
+# then loaded with LOAD DATA LOCAL INFILE if the server allows it, which is much
+# faster than INSERT statements for large tables (e.g., SNP panel manifests)
+# if the server (or connector) does not allow LOCAL loading, the staging file is read
+# back and inserted with parameterized executemany in batches
+# values in the staging file are escaped the way LOAD DATA expects (backslash as escape character),
+# values can't contain tabs or new lines b/c they come from tab delimited input files
+# None is written as \N, which LOAD DATA reads as NULL
+
+import os
+import tempfile
+import mysql.connector as connector
+from .utils import getConnection
+
+# errors that mean LOCAL loading is not allowed by the server or the client
+#  1148: ER_NOT_ALLOWED_COMMAND, 3948: ER_CLIENT_LOCAL_FILES_DISABLED, 2068: CR_LOAD_DATA_LOCAL_INFILE_REJECTED
+LOCAL_INFILE_ERRORS = (1148, 3948, 2068)
+
+class stagingFile:
+	def __init__(self):
+		fd, self.name = tempfile.mkstemp(prefix="dbdbs_", suffix=".tsv")
+		self.f = open(fd, "w", encoding="utf-8", newline="\n")
+		self.nRows = 0
+
+	# add a row (list of strings or None) to the file
+	def write(self, fields : list):
+		self.f.write("\t".join(["\\N" if x is None else x.replace("\\", "\\\\") for x in fields]) + "\n")
+		self.nRows += 1
+
+	def close(self):
+		if not self.f.closed:
+			self.f.close()
+
+	# generator of rows (lists of strings or None) in the file
+	def rows(self):
+		self.close()
+		with open(self.name, "r", encoding="utf-8", newline="\n") as f:
+			for l in f:
+				yield [None if x == "\\N" else x.replace("\\\\", "\\") for x in l.rstrip("\n").split("\t")]
+
+	# close and delete the file
+	def remove(self):
+		self.close()
+		if os.path.exists(self.name):
+			os.remove(self.name)
+
+# whether the server allows LOAD DATA LOCAL INFILE
+def localInfileEnabled(cnx : connector) -> bool:
+	with cnx.cursor() as curs:
+		curs.execute("SHOW GLOBAL VARIABLES LIKE 'local_infile'")
+		res = curs.fetchone()
+	return res is not None and str(res[1]).upper() in ("ON", "1")
+
+# load a staging file into a table
+# columns: names of the columns in the table, in the order of the fields in the staging file
+# LOAD DATA is run and committed on a separate connection that allows LOCAL loading, so the
+# table must already exist (CREATE TABLE commits). The fallback inserts are run on cnx and
+# NOT committed
+# values LOAD DATA LOCAL can't convert are only warnings (not errors as with INSERT), so
+# any warning rolls back the load and raises a ValueError
+# returns "LOAD DATA" or "INSERT" depending on the method used
+def loadStagingFile(cnx : connector, userInfo : dict, tableName : str, columns : list,
+					staging : stagingFile, batchSize : int = 10000) -> str:
+	staging.close()
+	colString = ",".join(["`%s`" % x for x in columns])
+	if localInfileEnabled(cnx):
+		cnxLocal = getConnection(userInfo, allowLocalInfile=True)
+		try:
+			with cnxLocal.cursor() as curs:
+				curs.execute("LOAD DATA LOCAL INFILE %%s INTO TABLE `%s` CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' (%s)" %
+					(tableName, colString), (staging.name,))
+				curs.execute("SHOW WARNINGS LIMIT 1")
+				warning = curs.fetchone()
+				if warning is not None:
+					cnxLocal.rollback()
+					raise ValueError("Error loading %s: %s" % (tableName, warning[2]))
+			cnxLocal.commit()
+			return "LOAD DATA"
+		except connector.Error as e:
+			cnxLocal.rollback()
+			if e.errno not in LOCAL_INFILE_ERRORS:
+				raise
+		finally:
+			cnxLocal.close()
+	sqlState = "INSERT INTO `%s` (%s) VALUES (%s)" % (tableName, colString, ",".join(["%s"] * len(columns)))
+	with cnx.cursor() as curs:
+		rows = []
+		for row in staging.rows():
+			rows += [row]
+			if len(rows) == batchSize:
+				curs.executemany(sqlState, rows)
+				rows = []
+		if len(rows) > 0:
+			curs.executemany(sqlState, rows)
+	return "INSERT"
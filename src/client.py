@@ -0,0 +1,213 @@
+# library interface to the database for analysis scripts (no windows)
+# a client holds one connection and caches the metadata of each panel (type, ploidy, loci, alleles)
+# so that repeated calls only fetch genotypes, which are fetched in batches and decoded a batch at a time
+# genotypes are returned as numpy masked arrays with missing genotypes masked
+#   Biallelic: alt allele copies (individuals x loci)
+#   Multiallelic and Hyperallelic: allele codes (individuals x loci x ploidy), each code is the index
+#     of the allele in the allele names of the locus (see alleles)
+# with useCache, genotypes are read through a local cache (genotypeCache) that only fetches rows
+# that are new or changed since the last read
+# example:
+#   with client(host="localhost", user="me", password="pw", database="hatchery") as cl:
+#       inds, loci, geno = cl.genotypes("snpPanel", inds=["fish1", "fish2"])
+
+import numpy as np
+from .utils import getConnection, getPanelInfo, getLocusIDsInBlob, getIndIDdict, getIndNames
+from .genotypeCodec import missingCode, codeDtype, codesPerInd, iterGenotypeBatches, getGenotypeCodes
+from .genotypeCache import genotypeCache
+
+class client:
+	# userInfo : dict with keys un, pw, host, db (as saved by the login window), or give
+	#   host, user, password, and database
+	# useCache : read genotypes through the local genotype cache
+	def __init__(self, userInfo : dict = None, host : str = None, user : str = None, password : str = None,
+				database : str = None, useCache : bool = False):
+		if userInfo is None:
+			userInfo = {"un" : user, "pw" : password, "host" : host, "db" : database}
+		self.userInfo = userInfo
+		self.cnx = getConnection(userInfo)
+		self.panelCache = {}
+		self.useCache = useCache
+		self.genotypeCaches = {}
+
+	def close(self):
+		self.cnx.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	# forget cached panel metadata (e.g., after loci are added to a panel)
+	def clearCache(self):
+		self.panelCache = {}
+		self.genotypeCaches = {}
+
+	# names of the genotype panels in the database
+	def panels(self) -> list:
+		with self.cnx.cursor() as curs:
+			curs.execute("SELECT panel_name FROM intDBgeno_overview")
+			return [x[0] for x in curs]
+
+	# cached metadata of a panel
+	# dict with keys type, ploidy, nLoci, loci (names in the order of the BLOB), locusPos (dict of name to position)
+	def panelInfo(self, panelName : str) -> dict:
+		if panelName not in self.panelCache:
+			info = getPanelInfo(self.cnx, panelName)
+			if info is None:
+				raise ValueError("%s is not a genotype panel" % panelName)
+			with self.cnx.cursor() as curs:
+				curs.execute("SELECT intDBlocus_name FROM `%s` ORDER BY intDBlocus_id" % panelName)
+				loci = [x[0] for x in curs]
+			self.panelCache[panelName] = {"type" : info[0], "ploidy" : info[1], "nLoci" : info[2], "loci" : loci,
+				"locusPos" : {loci[i] : i for i in range(0, len(loci))}}
+		return self.panelCache[panelName]
+
+	# locus names of a panel in the order of the BLOB
+	def loci(self, panelName : str) -> list:
+		return list(self.panelInfo(panelName)["loci"])
+
+	# allele names of each locus of a panel (list of lists, in the order of the BLOB)
+	# Biallelic: [ref, alt]
+	def alleles(self, panelName : str) -> list:
+		self.alleleTable(panelName)
+		return [list(x) for x in self.panelCache[panelName]["alleles"]]
+
+	# translation from the codes in the BLOB to allele indices, built once per panel
+	# returns array of allele index (-1 for missing) [locus, code] (Hyperallelic) or
+	#   [locus, genotype_id, allele] (Multiallelic), None for Biallelic
+	def alleleTable(self, panelName : str):
+		info = self.panelInfo(panelName)
+		if "alleles" in info:
+			return info["table"]
+		panelType = info["type"]
+		ploidy = info["ploidy"]
+		alleles = [[] for j in range(0, info["nLoci"])]
+		table = None
+		with self.cnx.cursor() as curs:
+			if panelType == "Biallelic":
+				curs.execute("SELECT intDBref_allele, intDBalt_allele FROM `%s` ORDER BY intDBlocus_id" % panelName)
+				alleles = [list(x) for x in curs]
+			else:
+				locusPos = {x : i for i, x in enumerate(getLocusIDsInBlob(self.cnx, panelName))}
+				if panelType == "Hyperallelic":
+					table = np.full((info["nLoci"], 256), -1, dtype=np.int16)
+					curs.execute("SELECT locus_id, allele_id, allele FROM `intDB%s_lt` ORDER BY locus_id, allele_id" % panelName)
+					for x in curs:
+						j = locusPos[x[0]]
+						table[j, x[1]] = len(alleles[j])
+						alleles[j] += [x[2]]
+				else:
+					table = np.full((info["nLoci"], 256, ploidy), -1, dtype=np.int16)
+					curs.execute("SELECT locus_id, genotype_id, %s FROM `intDB%s_lt` ORDER BY locus_id, genotype_id" %
+						(",".join(["allele_%s" % i for i in range(1, ploidy + 1)]), panelName))
+					alleleIndex = [{} for j in range(0, info["nLoci"])]
+					for x in curs:
+						j = locusPos[x[0]]
+						for k in range(0, ploidy):
+							if x[2 + k] not in alleleIndex[j]:
+								alleleIndex[j][x[2 + k]] = len(alleles[j])
+								alleles[j] += [x[2 + k]]
+							table[j, x[1], k] = alleleIndex[j][x[2 + k]]
+		info["alleles"] = alleles
+		info["table"] = table
+		return table
+
+	# names of individuals, all in the pedigree or only those genotyped in a panel
+	def individuals(self, panelName : str = None) -> list:
+		with self.cnx.cursor() as curs:
+			if panelName is None:
+				curs.execute("SELECT ind FROM intDBpedigree ORDER BY ind_id")
+			else:
+				curs.execute("SELECT p.ind FROM `intDB%s_gt` AS g INNER JOIN intDBpedigree AS p ON g.ind_id = p.ind_id ORDER BY g.ind_id" % panelName)
+			return [x[0] for x in curs]
+
+	# genotypes of a panel
+	# inds : individual names, rows are in this order and individuals that are not genotyped are
+	#   entirely masked; None for all genotyped individuals (in order of ind_id)
+	# loci : locus names, columns are in this order; None for all loci
+	# returns (list of individual names, list of locus names, masked array of genotypes)
+	def genotypes(self, panelName : str, inds : list = None, loci : list = None, batchSize : int = 1000):
+		info = self.panelInfo(panelName)
+		panelType = info["type"]
+		ploidy = info["ploidy"]
+		if loci is None:
+			loci = list(info["loci"])
+			locusIdx = None
+		else:
+			loci = list(loci)
+			unknown = [x for x in loci if x not in info["locusPos"]]
+			if len(unknown) > 0:
+				raise ValueError("Loci not in panel %s: %s" % (panelName, ", ".join(unknown[:10])))
+			locusIdx = np.array([info["locusPos"][x] for x in loci], dtype=np.int64)
+		table = self.alleleTable(panelName)
+		if inds is None:
+			ids = []
+			values = []
+			for batchIDs, codes in self.codeBatches(panelName, None, batchSize):
+				ids += batchIDs.tolist()
+				values += [self.decode(info, table, codes, locusIdx)]
+			names = getIndNames(self.cnx, ids)
+			inds = [names[x] for x in ids]
+			if len(values) == 0:
+				values = [self.decode(info, table, np.zeros((0, codesPerInd(panelType, ploidy, info["nLoci"])),
+					dtype=codeDtype(panelType, ploidy)), locusIdx)]
+			return (inds, loci, np.ma.concatenate(values))
+		inds = list(inds)
+		indID = getIndIDdict(self.cnx, inds)
+		unknown = [x for x in inds if x not in indID]
+		if len(unknown) > 0:
+			raise ValueError("Individuals not in the pedigree: %s" % ", ".join(unknown[:10]))
+		# all missing until filled in with the genotyped individuals
+		shape = (len(inds), len(loci)) if panelType == "Biallelic" else (len(inds), len(loci), ploidy)
+		result = np.ma.masked_all(shape, dtype=np.int16 if panelType != "Biallelic" else codeDtype(panelType, ploidy))
+		rowOf = {}
+		for i in range(0, len(inds)):
+			rowOf.setdefault(indID[inds[i]], []).append(i)
+		idList = sorted(rowOf.keys())
+		for batchIDs, codes in self.codeBatches(panelName, idList, batchSize):
+			decoded = self.decode(info, table, codes, locusIdx)
+			batchIDs = batchIDs.tolist()
+			src = [k for k in range(0, len(batchIDs)) for r in rowOf[batchIDs[k]]]
+			dest = [r for k in range(0, len(batchIDs)) for r in rowOf[batchIDs[k]]]
+			result[dest] = decoded[src]
+		return (inds, loci, result)
+
+	# codes of all genotyped individuals (or only indIDs) in batches, from the server or the local cache
+	# yields (array of ind_id, 2D array of codes)
+	def codeBatches(self, panelName : str, indIDs = None, batchSize : int = 1000):
+		if self.useCache:
+			if panelName not in self.genotypeCaches:
+				self.genotypeCaches[panelName] = genotypeCache(self.cnx, panelName)
+			ids, codes = self.genotypeCaches[panelName].read(indIDs, batchSize)
+			for i in range(0, len(ids), batchSize):
+				yield (ids[i:(i + batchSize)], codes[i:(i + batchSize)])
+		elif indIDs is None:
+			yield from iterGenotypeBatches(self.cnx, panelName, batchSize)
+		else:
+			for i in range(0, len(indIDs), batchSize):
+				yield getGenotypeCodes(self.cnx, panelName, indIDs[i:(i + batchSize)], batchSize)
+
+	# decode a batch of BLOB codes into a masked array, optionally selecting loci
+	@staticmethod
+	def decode(info : dict, table, codes, locusIdx = None):
+		panelType = info["type"]
+		ploidy = info["ploidy"]
+		n = codes.shape[0]
+		if panelType == "Biallelic":
+			if locusIdx is not None:
+				codes = codes[:, locusIdx]
+			return np.ma.masked_equal(codes, missingCode(panelType, ploidy), copy=False)
+		if panelType == "Hyperallelic":
+			codes = codes.reshape(n, info["nLoci"], ploidy)
+			if locusIdx is not None:
+				codes = codes[:, locusIdx, :]
+			lociIdx = np.arange(info["nLoci"]) if locusIdx is None else locusIdx
+			alleleIdx = table[lociIdx[None, :, None], codes]
+		else:
+			if locusIdx is not None:
+				codes = codes[:, locusIdx]
+			lociIdx = np.arange(info["nLoci"]) if locusIdx is None else locusIdx
+			alleleIdx = table[lociIdx[None, :], codes]
+		return np.ma.masked_less(alleleIdx, 0, copy=False)
@@ -0,0 +1,120 @@
+# reading of compressed input files
+# input files can be plain text, gzip (.gz), bgzip (.bgz, .gz), or zstandard (.zst)
+# compression is detected from the first bytes of the file, not the file name, and
+# files are decompressed as they are read rather than to a temporary file on disk
+# bgzip files are a series of independent gzip blocks, so several blocks are
+# decompressed at once in a thread pool (zlib releases the GIL while decompressing)
+
+import io
+import gzip
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# returns "bgzip", "gzip", "zstd", or "none"
+def detectCompression(fileName : str) -> str:
+	with open(fileName, "rb") as f:
+		head = f.read(16)
+	if head[:2] == GZIP_MAGIC:
+		# bgzip has the FEXTRA flag and a "BC" extra subfield at the start of the extra field
+		if len(head) >= 14 and head[3] & 4 and head[12:14] == b"BC":
+			return "bgzip"
+		return "gzip"
+	if head[:4] == ZSTD_MAGIC:
+		return "zstd"
+	return "none"
+
+# open an input file for reading as text, decompressing if needed
+# nThreads : number of threads used to decompress bgzip files
+def openInputFile(fileName : str, nThreads : int = 4):
+	compression = detectCompression(fileName)
+	if compression == "bgzip":
+		return io.TextIOWrapper(io.BufferedReader(bgzfReader(fileName, nThreads), 1048576))
+	elif compression == "gzip":
+		return gzip.open(fileName, "rt")
+	elif compression == "zstd":
+		# optional dependency, only needed for zstandard files
+		try:
+			import zstandard
+		except ImportError:
+			raise RuntimeError("The zstandard package is required to read zstandard compressed files")
+		# buffered, b/c the zstandard reader doesn't support readline (used on the binary buffer of the text stream)
+		return io.TextIOWrapper(io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(fileName, "rb"), closefd=True), 1048576))
+	return open(fileName, "r")
+
+# raw (binary) stream of the decompressed contents of a bgzip file
+# blocks are read in order and decompressed ahead of the reader in a thread pool
+class bgzfReader(io.RawIOBase):
+	def __init__(self, fileName : str, nThreads : int = 4):
+		self.f = open(fileName, "rb")
+		self.pool = ThreadPoolExecutor(max_workers=max(1, nThreads))
+		self.maxPending = max(1, nThreads) * 4 # blocks decompressing or waiting to be read
+		self.pending = deque()
+		self.buffer = b""
+		self.pos = 0
+		self.eof = False
+
+	def readable(self):
+		return True
+
+	# read the next compressed block from the file, returns None at end of file
+	def readBlock(self):
+		header = self.f.read(12)
+		if len(header) == 0:
+			return None
+		if len(header) < 12 or header[:2] != GZIP_MAGIC or not header[3] & 4:
+			raise RuntimeError("Invalid bgzip block in %s" % self.f.name)
+		xlen = struct.unpack("<H", header[10:12])[0]
+		extra = self.f.read(xlen)
+		# find BSIZE (total block size - 1) in the "BC" subfield
+		bsize = None
+		i = 0
+		while i + 4 <= len(extra):
+			slen = struct.unpack("<H", extra[(i + 2):(i + 4)])[0]
+			if extra[i:(i + 2)] == b"BC" and slen == 2:
+				bsize = struct.unpack("<H", extra[(i + 4):(i + 6)])[0]
+				break
+			i += 4 + slen
+		if bsize is None:
+			raise RuntimeError("Invalid bgzip block in %s" % self.f.name)
+		# compressed data followed by CRC32 and uncompressed size
+		return self.f.read(bsize + 1 - 12 - xlen)
+
+	@staticmethod
+	def inflate(block : bytes) -> bytes:
+		data = zlib.decompress(block[:-8], -15)
+		crc, size = struct.unpack("<II", block[-8:])
+		if zlib.crc32(data) != crc or len(data) != size:
+			raise RuntimeError("Corrupt bgzip block")
+		return data
+
+	# keep the thread pool busy with blocks ahead of the reader
+	def fill(self):
+		while not self.eof and len(self.pending) < self.maxPending:
+			block = self.readBlock()
+			if block is None:
+				self.eof = True
+			else:
+				self.pending.append(self.pool.submit(self.inflate, block))
+
+	def readinto(self, b):
+		while self.pos >= len(self.buffer):
+			self.fill()
+			if len(self.pending) == 0:
+				return 0
+			self.buffer = self.pending.popleft().result()
+			self.pos = 0
+		n = min(len(b), len(self.buffer) - self.pos)
+		b[:n] = self.buffer[self.pos:(self.pos + n)]
+		self.pos += n
+		return n
+
+	def close(self):
+		if not self.closed:
+			self.pool.shutdown(wait=False, cancel_futures=True)
+			self.f.close()
+		super().close()
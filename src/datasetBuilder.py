@@ -0,0 +1,185 @@
+# aligned datasets of pedigree, phenotypes, and genotypes for analysis
+# one row per genotyped individual of a panel with the individual name, sire and dam names,
+# chosen columns of a phenotype table, and the genotypes
+# the join is done by the server (genotype table joined to the pedigree, the pedigree again for
+# the parent names, and the phenotype table) and the result is streamed in batches of rows, with
+# the genotypes of each batch decoded at once (genotypeCodec.blobsToCodes)
+# datasets are written as
+#   text: one tab delimited file with a header line, genotypes as alt allele copies (Biallelic) or
+#     alleles separated by "/" (Multiallelic and Hyperallelic), missing values are NA
+#   binary: a .npy file of the codes stored in the BLOB (individuals x codes, see genotypeCodec) written
+#     through a memory map, and a tab delimited file (fileName + ".tsv") of the other columns in the same order
+
+import numpy as np
+import mysql.connector as connector
+from .utils import getPanelInfo, getLocusIDsInBlob
+from .genotypeCodec import missingCode, codeDtype, codesPerInd, blobsToCodes
+from .phenotypeTables import phenoColumnTypes, columnArray, formatColumn
+from .rowVersions import requireRowVersions, changedSince
+
+# SQL of the joined dataset, returns (select statement, count statement, parameters of the statements)
+# the statements end with a WHERE clause that further conditions can be added to with AND
+# since : only rows with genotypes, pedigree, or phenotypes changed since a watermark (see rowVersions)
+def datasetSql(panelName : str, phenoTable : str = None, phenoColumns : list = [], requirePheno : bool = False, since : str = None):
+	joins = """
+	FROM `intDB%s_gt` AS g
+	INNER JOIN intDBpedigree AS p ON g.ind_id = p.ind_id
+	""" % panelName
+	cols = "g.ind_id, p.ind, ps.ind, pd.ind"
+	if phenoTable is not None:
+		joins += "%s JOIN `%s` AS ph ON g.ind_id = ph.ind_id\n" % ("INNER" if requirePheno else "LEFT", phenoTable)
+		cols += "".join([", ph.`%s`" % x for x in phenoColumns])
+	where = "WHERE 1 = 1"
+	params = []
+	if since is not None:
+		condition, params = changedSince(["g", "p"] + (["ph"] if phenoTable is not None else []), since)
+		where += " AND " + condition
+	select = "SELECT %s, g.genotypes %s LEFT JOIN intDBpedigree AS ps ON p.sire = ps.ind_id LEFT JOIN intDBpedigree AS pd ON p.dam = pd.ind_id %s" % (cols, joins, where)
+	count = "SELECT COUNT(*) %s %s" % (joins, where)
+	return (select, count, params)
+
+# stream a joined dataset in batches
+# phenoTable, phenoColumns : phenotype table and its columns to include (all columns if None)
+# requirePheno : only include individuals in the phenotype table
+# indIDs : optional ind_id to include, otherwise all genotyped individuals
+# since : only individuals changed since a watermark (see datasetSql)
+# yields dicts with keys ind_id (array), ind, sire, dam (lists of names, None for unknown),
+#   phenotypes (dict of column name to array, see phenotypeTables.columnArray), phenoTypes (dict of
+#   column name to type), codes (2D array)
+def iterDataset(cnx : connector, panelName : str, phenoTable : str = None, phenoColumns : list = None,
+				requirePheno : bool = False, indIDs = None, batchSize : int = 1000, since : str = None):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	phenoTypes = []
+	if phenoTable is not None:
+		tableCols, tableTypes = phenoColumnTypes(cnx, phenoTable)
+		if phenoColumns is None:
+			phenoColumns = tableCols
+		for x in phenoColumns:
+			if x not in tableCols:
+				raise ValueError("%s is not a column of %s" % (x, phenoTable))
+		phenoTypes = [tableTypes[tableCols.index(x)] for x in phenoColumns]
+	else:
+		phenoColumns = []
+	if since is not None:
+		requireRowVersions(cnx, ["intDB%s_gt" % panelName, "intDBpedigree"] + ([phenoTable] if phenoTable is not None else []))
+	select, count, params = datasetSql(panelName, phenoTable, phenoColumns, requirePheno, since)
+	def toBatch(rows):
+		k = len(phenoColumns)
+		return {"ind_id" : np.array([x[0] for x in rows], dtype=np.int64), "ind" : [x[1] for x in rows],
+			"sire" : [x[2] for x in rows], "dam" : [x[3] for x in rows],
+			"phenotypes" : {phenoColumns[j] : columnArray([x[4 + j] for x in rows], phenoTypes[j]) for j in range(0, k)},
+			"phenoTypes" : {phenoColumns[j] : phenoTypes[j] for j in range(0, k)},
+			"codes" : blobsToCodes([x[4 + k] for x in rows], panelType, ploidy, nLoci)}
+	with cnx.cursor() as curs:
+		if indIDs is None:
+			curs.execute(select + " ORDER BY g.ind_id", params)
+			rows = curs.fetchmany(batchSize)
+			while rows:
+				yield toBatch(rows)
+				rows = curs.fetchmany(batchSize)
+		else:
+			indIDs = sorted(set([int(x) for x in indIDs]))
+			for i in range(0, len(indIDs), batchSize):
+				batch = indIDs[i:(i + batchSize)]
+				curs.execute(select + " AND g.ind_id IN (%s) ORDER BY g.ind_id" % ",".join(["%s"] * len(batch)), params + batch)
+				rows = curs.fetchall()
+				if len(rows) > 0:
+					yield toBatch(rows)
+
+# number of rows of a joined dataset (see iterDataset)
+def countDataset(cnx : connector, panelName : str, phenoTable : str = None, requirePheno : bool = False,
+				indIDs = None, batchSize : int = 10000, since : str = None) -> int:
+	select, count, params = datasetSql(panelName, phenoTable, [], requirePheno, since)
+	n = 0
+	with cnx.cursor() as curs:
+		if indIDs is None:
+			curs.execute(count, params)
+			n = curs.fetchone()[0]
+		else:
+			indIDs = sorted(set([int(x) for x in indIDs]))
+			for i in range(0, len(indIDs), batchSize):
+				batch = indIDs[i:(i + batchSize)]
+				curs.execute(count + " AND g.ind_id IN (%s)" % ",".join(["%s"] * len(batch)), params + batch)
+				n += curs.fetchone()[0]
+	return n
+
+# genotype strings for text output
+# returns (array of the locus index of each code, 2D str array [locus index, code])
+# for Hyperallelic panels each code is one allele (ploidy codes per locus)
+def genotypeStrings(cnx : connector, panelName : str):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	miss = missingCode(panelType, ploidy)
+	if panelType == "Biallelic":
+		table = np.array([[str(c) for c in range(0, ploidy + 1)] + ["NA"]] * nLoci, dtype=str)
+		return (np.arange(nLoci), table)
+	locusPos = {x : i for i, x in enumerate(getLocusIDsInBlob(cnx, panelName))}
+	entries = []
+	with cnx.cursor() as curs:
+		if panelType == "Multiallelic":
+			curs.execute("SELECT locus_id, genotype_id, %s FROM `intDB%s_lt`" % (",".join(["allele_%s" % i for i in range(1, ploidy + 1)]), panelName))
+			entries = [(locusPos[x[0]], x[1], "/".join(x[2:])) for x in curs]
+		else:
+			curs.execute("SELECT locus_id, allele_id, allele FROM `intDB%s_lt`" % panelName)
+			entries = [(locusPos[x[0]], x[1], x[2]) for x in curs]
+	width = max([1] + [len(x[2]) for x in entries])
+	table = np.full((nLoci, 256), "NA", dtype="<U%s" % max(2, width))
+	for x in entries:
+		table[x[0], x[1]] = x[2]
+	table[:, miss] = "NA"
+	return (np.repeat(np.arange(nLoci), ploidy) if panelType == "Hyperallelic" else np.arange(nLoci), table)
+
+# write a joined dataset (see iterDataset for arguments)
+# fileType : "text" or "binary"
+# since : only individuals changed since a watermark, for incremental exports (see rowVersions)
+# returns number of individuals written
+def writeDataset(cnx : connector, panelName : str, fileName : str, fileType : str = "text", phenoTable : str = None,
+				phenoColumns : list = None, requirePheno : bool = False, indIDs = None, batchSize : int = 1000, since : str = None) -> int:
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	if phenoTable is not None and phenoColumns is None:
+		phenoColumns = phenoColumnTypes(cnx, phenoTable)[0]
+	header = ["ind", "sire", "dam"] + (phenoColumns or [])
+	batches = iterDataset(cnx, panelName, phenoTable, phenoColumns, requirePheno, indIDs, batchSize, since)
+	n = 0
+	if fileType == "binary":
+		# count first (in the same transaction, so the same rows are seen) to size the memory map
+		nRows = countDataset(cnx, panelName, phenoTable, requirePheno, indIDs, since=since)
+		codes = np.lib.format.open_memmap(fileName, mode="w+", dtype=codeDtype(panelType, ploidy),
+			shape=(nRows, codesPerInd(panelType, ploidy, nLoci)))
+		with open(fileName + ".tsv", "w") as fout:
+			fout.write("\t".join(header) + "\n")
+			for batch in batches:
+				if n + len(batch["ind"]) > nRows:
+					raise RuntimeError("Individuals were added while the dataset was written")
+				codes[n:(n + len(batch["ind"]))] = batch["codes"]
+				fout.writelines(["\t".join(row) + "\n" for row in zip(*metaColumns(batch))])
+				n += len(batch["ind"])
+		codes.flush()
+		del codes
+		if n != nRows:
+			raise RuntimeError("Individuals were removed while the dataset was written")
+		return n
+	locusIndex, table = genotypeStrings(cnx, panelName)
+	with cnx.cursor() as curs:
+		curs.execute("SELECT intDBlocus_name FROM `%s` ORDER BY intDBlocus_id" % panelName)
+		header += [x[0] for x in curs]
+	with open(fileName, "w") as fout:
+		fout.write("\t".join(header) + "\n")
+		for batch in batches:
+			strings = table[locusIndex, batch["codes"]]
+			if panelType == "Hyperallelic":
+				# alleles of each locus joined with "/", missing genotypes have all alleles missing
+				strings = strings.reshape(strings.shape[0], nLoci, ploidy)
+				joined = strings[:, :, 0]
+				for k in range(1, ploidy):
+					joined = np.char.add(np.char.add(joined, "/"), strings[:, :, k])
+				strings = np.where(strings[:, :, 0] == "NA", "NA", joined)
+			meta = metaColumns(batch)
+			fout.writelines(["\t".join([meta[j][i] for j in range(0, len(meta))] + strings[i].tolist()) + "\n"
+				for i in range(0, len(batch["ind"]))])
+			n += len(batch["ind"])
+	return n
+
+# individual, sire, dam, and phenotype columns of a batch as lists of str, NA for missing
+def metaColumns(batch : dict) -> list:
+	cols = [batch["ind"], ["NA" if x is None else x for x in batch["sire"]], ["NA" if x is None else x for x in batch["dam"]]]
+	return cols + [formatColumn(v, batch["phenoTypes"][x]) for x, v in batch["phenotypes"].items()]
@@ -0,0 +1,188 @@
+# detection of duplicate individuals (sample swaps, duplicate tissue samples, etc.)
+# pairs of individuals are compared by the proportion of loci called in both
+# that have different genotypes (discordance)
+# genotypes are packed into bit fields of 64 bit words, fieldWidth bits per locus (the
+# number of bits per code rounded up to a power of 2 so fields don't cross words), along
+# with a matching mask of loci that are called. For a pair of individuals
+#   compared = popcount(called_1 & called_2)
+#   discordant = popcount(fold(genotypes_1 ^ genotypes_2) & called_1 & called_2)
+# where fold ORs the bits of each field into its lowest bit
+# all-vs-all comparisons are done in two stages so that they scale to many individuals
+#   screen: all pairs are compared at a subset of loci, in blocks of pairs spread over threads
+#     (numpy releases the GIL for the bitwise operations)
+#   verify: pairs passing the screen are compared at all loci
+# the screen is a heuristic: both thresholds are relaxed by screenMargin at the screening loci, but a
+# pair whose genotypes at the screening loci are unrepresentative of the panel can still be missed
+# (unless the screen uses all loci, in which case it is exact)
+# Biallelic and Multiallelic panels are supported
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as connector
+from .utils import getPanelInfo, numBits, getIndNames
+from .genotypeCodec import missingCode, iterGenotypeBatches, getGenotypeCodes
+
+# number of set bits in each element of a uint64 array
+if hasattr(np, "bitwise_count"):
+	def popcount(x):
+		return np.bitwise_count(x)
+else:
+	_POPCOUNT8 = np.array([bin(i).count("1") for i in range(0, 256)], dtype=np.uint8)
+	def popcount(x):
+		x = np.ascontiguousarray(x)
+		return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+# bits per locus in the packed words
+def fieldWidth(panelType : str, ploidy : int) -> int:
+	nb = numBits(2, ploidy) if panelType == "Biallelic" else 8
+	f = 1
+	while f < nb:
+		f *= 2
+	return f
+
+# pack codes (individuals x loci) into (genotype words, called words), each individuals x words uint64
+# missing genotypes are stored as 0 in the genotype words
+def packFields(codes, miss : int, f : int):
+	codes = np.asarray(codes)
+	perWord = 64 // f
+	nWords = -(-codes.shape[1] // perWord)
+	padded = np.zeros((codes.shape[0], nWords * perWord), dtype=np.uint64)
+	called = codes != miss
+	padded[:, :codes.shape[1]] = np.where(called, codes, 0)
+	shifts = (np.arange(perWord, dtype=np.uint64) * np.uint64(f))
+	genos = np.bitwise_or.reduce(padded.reshape(codes.shape[0], nWords, perWord) << shifts, axis=2)
+	padded[:] = 0
+	padded[:, :codes.shape[1]] = called
+	calledWords = np.bitwise_or.reduce(padded.reshape(codes.shape[0], nWords, perWord) << shifts, axis=2)
+	return (genos, calledWords)
+
+# OR the bits of each f bit field into its lowest bit
+# tmp: optional array of the same shape as x to fold x in place
+def fold(x, f : int, tmp = None):
+	s = 1
+	while s < f:
+		if tmp is None:
+			x = x | (x >> np.uint64(s))
+		else:
+			np.right_shift(x, np.uint64(s), out=tmp)
+			np.bitwise_or(x, tmp, out=x)
+		s *= 2
+	return x
+
+# discordant and compared loci for all pairs of rows of (g1, c1) and (g2, c2)
+# returns two arrays of shape (rows of g1, rows of g2)
+# operations are done in place on preallocated arrays, one word at a time, to limit memory traffic
+def discordance(g1, c1, g2, c2, f : int):
+	shape = (g1.shape[0], g2.shape[0])
+	# counts fit in 16 bits unless there are many words
+	countType = np.uint16 if g1.shape[1] * 64 < 65536 else np.int64
+	discord = np.zeros(shape, dtype=countType)
+	compared = np.zeros(shape, dtype=countType)
+	both = np.empty(shape, dtype=np.uint64)
+	x = np.empty(shape, dtype=np.uint64)
+	tmp = np.empty(shape, dtype=np.uint64)
+	for w in range(0, g1.shape[1]):
+		np.bitwise_and(c1[:, None, w], c2[None, :, w], out=both)
+		compared += popcount(both)
+		np.bitwise_xor(g1[:, None, w], g2[None, :, w], out=x)
+		fold(x, f, tmp)
+		np.bitwise_and(x, both, out=x)
+		discord += popcount(x)
+	return (discord.astype(np.int64), compared.astype(np.int64))
+
+# discordant and compared loci for pairs of rows (i[k] of (g1, c1) with j[k] of (g2, c2))
+def pairDiscordance(g1, c1, g2, c2, i, j, f : int, chunkSize : int = 10000):
+	discord = np.zeros(len(i), dtype=np.int64)
+	compared = np.zeros(len(i), dtype=np.int64)
+	for k in range(0, len(i), chunkSize):
+		a = i[k:(k + chunkSize)]
+		b = j[k:(k + chunkSize)]
+		both = c1[a] & c2[b]
+		compared[k:(k + chunkSize)] = popcount(both).sum(axis=1)
+		discord[k:(k + chunkSize)] = popcount(fold(g1[a] ^ g2[b], f) & both).sum(axis=1)
+	return (discord, compared)
+
+# find pairs of individuals in a panel with discordance <= maxDiscordance
+# minCompared: minimum proportion of loci called in both individuals for a pair to be reported
+# nScreen: number of loci used to screen all pairs (evenly spaced along the panel)
+# screenMargin: pairs with discordance <= maxDiscordance + screenMargin and proportion compared
+#   >= minCompared - screenMargin at the screening loci are verified
+# returns list of (ind name, ind name, discordant loci, compared loci, discordance), lowest discordance first
+def findDuplicates(cnx : connector, panelName : str, maxDiscordance : float = 0.01, minCompared : float = 0.5,
+					nScreen : int = 256, screenMargin : float = 0.05, blockSize : int = 1024, nThreads : int = 4,
+					batchSize : int = 1000):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	if panelType == "Hyperallelic":
+		raise ValueError("Duplicate detection is not available for Hyperallelic panels")
+	miss = missingCode(panelType, ploidy)
+	f = fieldWidth(panelType, ploidy)
+	screenLoci = np.unique(np.linspace(0, nLoci - 1, min(nScreen, nLoci)).astype(np.int64))
+	exact = len(screenLoci) == nLoci # screen is all loci, so no need to verify
+	screenMax = maxDiscordance if exact else maxDiscordance + screenMargin
+	screenMinCompared = minCompared if exact else max(0.0, minCompared - screenMargin)
+
+	# packed genotypes of all individuals at the screening loci
+	indIDs = []
+	genos = []
+	called = []
+	for ids, codes in iterGenotypeBatches(cnx, panelName, batchSize):
+		g, c = packFields(codes[:, screenLoci], miss, f)
+		indIDs += [ids]
+		genos += [g]
+		called += [c]
+	if len(indIDs) == 0:
+		return []
+	indIDs = np.concatenate(indIDs)
+	genos = np.concatenate(genos)
+	called = np.concatenate(called)
+
+	# screen tiles of blockSize x blockSize pairs (upper triangle) in a thread pool
+	def screenTile(tile):
+		rowStart, colStart = tile
+		rowEnd = min(rowStart + blockSize, len(indIDs))
+		colEnd = min(colStart + blockSize, len(indIDs))
+		discord, compared = discordance(genos[rowStart:rowEnd], called[rowStart:rowEnd], genos[colStart:colEnd], called[colStart:colEnd], f)
+		with np.errstate(invalid="ignore", divide="ignore"):
+			rate = discord / compared
+		# pairs with nothing compared at the screening loci can't be screened out by discordance
+		i, j = np.nonzero((compared >= screenMinCompared * len(screenLoci)) & ((rate <= screenMax) | (compared == 0)))
+		keep = j + colStart > i + rowStart # each pair once, not with itself
+		i = i[keep]
+		j = j[keep]
+		return (i + rowStart, j + colStart, discord[i, j], compared[i, j])
+	tiles = [(r, c) for r in range(0, len(indIDs), blockSize) for c in range(r, len(indIDs), blockSize)]
+	with ThreadPoolExecutor(max_workers=max(1, nThreads)) as pool:
+		results = list(pool.map(screenTile, tiles))
+	pairI = np.concatenate([x[0] for x in results])
+	pairJ = np.concatenate([x[1] for x in results])
+	discord = np.concatenate([x[2] for x in results])
+	compared = np.concatenate([x[3] for x in results])
+	del genos, called
+	if len(pairI) == 0:
+		return []
+
+	if not exact:
+		# verify with all loci
+		candidates = np.unique(np.concatenate([pairI, pairJ]))
+		ids, codes = getGenotypeCodes(cnx, panelName, indIDs[candidates], batchSize)
+		g, c = packFields(codes, miss, f)
+		rowOf = {ids[k] : k for k in range(0, len(ids))}
+		a = np.array([rowOf[x] for x in indIDs[pairI]], dtype=np.int64)
+		b = np.array([rowOf[x] for x in indIDs[pairJ]], dtype=np.int64)
+		discord, compared = pairDiscordance(g, c, g, c, a, b, f)
+		nCompared = nLoci
+	else:
+		nCompared = len(screenLoci)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		rate = discord / compared
+	keep = np.nonzero((compared >= minCompared * nCompared) & (rate <= maxDiscordance))[0]
+	keep = keep[np.argsort(rate[keep], kind="stable")]
+	names = getIndNames(cnx, np.concatenate([indIDs[pairI[keep]], indIDs[pairJ[keep]]]))
+	return [(names[indIDs[pairI[k]]], names[indIDs[pairJ[k]]], int(discord[k]), int(compared[k]), float(rate[k])) for k in keep]
+
+# write pairs returned by findDuplicates to a tab delimited file
+def writeDuplicateReport(pairs : list, fileName : str):
+	with open(fileName, "w") as fout:
+		fout.write("\t".join(["ind1", "ind2", "nDiscordant", "nCompared", "discordance"]) + "\n")
+		for x in pairs:
+			fout.write("\t".join([str(y) for y in x]) + "\n")
@@ -0,0 +1,141 @@
+# scanning one field of every line of a delimited text file
+# used to find the individuals or loci in large genotype files without splitting each line
+# uncompressed files are memory-mapped, compressed files are read as a stream of bytes, and
+# both are processed in chunks of whole lines with numpy:
+#   line ends are found with one comparison over the chunk
+#   the field is found within the first `window` bytes of each line (a 2D array of lines x window),
+#     lines where the field extends past the window are split individually (only as much
+#     of the line as is needed is read)
+# only the unique values are kept as Python objects, in the order they are first seen
+# blank lines are ignored
+
+import re
+import mmap
+import numpy as np
+from .compressedInput import detectCompression, openInputFile
+
+# scan field `column` (0 based) of every line of a file
+# delimiters: bytes of which each is a field delimiter (e.g., b"\t ")
+# skipHeader: skip the first line
+# returns (list of unique values as str in order first seen, True if any value occurs more than once)
+def scanField(fileName : str, column : int, delimiters : bytes = b"\t", skipHeader : bool = False,
+				chunkSize : int = 4194304, window : int = 64):
+	scan = fieldScan(column, delimiters, window)
+	if detectCompression(fileName) == "none":
+		with open(fileName, "rb") as f:
+			if f.seek(0, 2) == 0:
+				return ([], False) # can't memory-map an empty file
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+				start = mm.find(b"\n") + 1 if skipHeader else 0
+				if skipHeader and start == 0:
+					start = len(mm) # only a header
+				while start < len(mm):
+					end = mm.rfind(b"\n", start, start + chunkSize) + 1
+					if end == 0:
+						# line longer than chunkSize
+						end = mm.find(b"\n", start + chunkSize) + 1
+						if end == 0:
+							end = len(mm)
+					chunk = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+					scan.add(chunk, complete = end == len(mm))
+					del chunk # views must be released before the map is closed
+					start = end
+	else:
+		with openInputFile(fileName) as ft:
+			f = ft.buffer
+			if skipHeader:
+				f.readline()
+			leftover = b""
+			while True:
+				data = f.read(chunkSize)
+				if len(data) == 0:
+					if len(leftover) > 0:
+						scan.add(np.frombuffer(leftover, dtype=np.uint8), complete=True)
+					break
+				data = leftover + data
+				end = data.rfind(b"\n") + 1
+				leftover = data[end:]
+				if end > 0:
+					scan.add(np.frombuffer(data, dtype=np.uint8, count=end))
+	return ([x.decode("utf-8") for x in scan.seen], scan.dups)
+
+# accumulates the unique values of one field from chunks of lines
+class fieldScan:
+	def __init__(self, column : int, delimiters : bytes, window : int):
+		self.column = column
+		self.delimiters = np.frombuffer(delimiters, dtype=np.uint8)
+		self.delimRe = re.compile(b"|".join([re.escape(bytes([x])) for x in delimiters]))
+		self.window = window
+		self.seen = {} # key value (bytes), in order first seen
+		self.dups = False
+
+	# add a chunk (uint8 array) of whole lines
+	# complete: the chunk is the end of the file, so the last line may not end with a new line
+	def add(self, chunk, complete : bool = False):
+		ends = np.flatnonzero(chunk == 10)
+		if complete and (len(chunk) == 0 or chunk[-1] != 10):
+			ends = np.append(ends, len(chunk))
+		starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.int64)
+		lineLen = ends - starts
+		keep = lineLen > 0 # skip blank lines
+		starts = starts[keep]
+		lineLen = lineLen[keep]
+		if len(starts) == 0:
+			return
+		# first window bytes of each line, delimiters found in them
+		w = np.arange(self.window)
+		inLine = w[None, :] < lineLen[:, None]
+		win = chunk[np.minimum(starts[:, None] + w, len(chunk) - 1)]
+		isDelim = np.isin(win, self.delimiters) & inLine
+		count = np.cumsum(isDelim, axis=1, dtype=np.int32)
+		if self.column == 0:
+			fieldStart = np.zeros(len(starts), dtype=np.int64)
+			startFound = np.ones(len(starts), dtype=bool)
+		else:
+			atStart = isDelim & (count == self.column)
+			fieldStart = atStart.argmax(axis=1) + 1
+			startFound = atStart.any(axis=1)
+		atEnd = isDelim & (count == self.column + 1)
+		fieldEnd = atEnd.argmax(axis=1)
+		endFound = atEnd.any(axis=1)
+		# last field of a line that fits in the window
+		lastField = startFound & ~endFound & (lineLen <= self.window)
+		fieldEnd[lastField] = lineLen[lastField]
+		fast = startFound & (endFound | lastField)
+		# copy each field to the start of a row, zero filled, then view rows as fixed width bytes
+		width = fieldEnd - fieldStart
+		cols = np.minimum(fieldStart[:, None] + w, self.window - 1)
+		fields = np.where(w[None, :] < width[:, None], np.take_along_axis(win, cols, axis=1), 0).astype(np.uint8)
+		values = np.ascontiguousarray(fields).view("S%s" % self.window).ravel()
+		if fast.all():
+			self.addValues(values)
+			return
+		values = list(values)
+		for i in np.nonzero(~fast)[0]:
+			values[i] = self.slowField(chunk, starts[i], starts[i] + lineLen[i])
+		self.addValues(values)
+
+	# field of a line where it is not within the window
+	# reads increasing amounts of the line until the field is found
+	def slowField(self, chunk, start : int, end : int) -> bytes:
+		n = self.window * 4
+		while True:
+			fields = self.delimRe.split(chunk[start:min(end, start + n)].tobytes(), maxsplit=self.column + 1)
+			if len(fields) > self.column + 1 or start + n >= end:
+				break
+			n *= 16
+		if len(fields) <= self.column:
+			raise ValueError("Line with fewer than %s fields found" % (self.column + 1))
+		return fields[self.column]
+
+	def addValues(self, values):
+		values = np.asarray(values, dtype=bytes)
+		unique, first = np.unique(values, return_index=True)
+		if len(unique) < len(values):
+			self.dups = True
+		for x in unique[np.argsort(first)]:
+			x = bytes(x)
+			if x in self.seen:
+				self.dups = True
+			else:
+				self.seen[x] = None
@@ -0,0 +1,184 @@
+# genetic groups (e.g., hatchery stocks, populations)
+# a grouping assigns individuals to groups and is stored as a table with one row per individual,
+# keyed by ind_id (linked to the pedigree), with the name of its group. Groupings are listed in
+# intDBgen_group_overview.
+# grouping files are tab delimited with a header line and two columns: individual name and group name
+# allele frequencies and missingness of every group are computed in one pass over the genotypes of a
+# panel joined (by the server) to the grouping, with the counts of each batch aggregated by group
+# with vectorized operations:
+#   Biallelic: alt allele copies and called genotypes are summed by group with a matrix multiply
+#     of a one-hot (individuals x groups) matrix
+#   Multiallelic and Hyperallelic: codes are counted by (group, locus, code) with np.unique on a combined key,
+#     into a flat array with only as many code columns for each locus as the locus has codes (from the
+#     lookup table), then genotype counts (Multiallelic) are converted to allele counts with the lookup table
+
+import numpy as np
+import mysql.connector as connector
+from .utils import identifier_syntax_check, getPanelInfo, getLocusIDsInBlob, removeIndsNotInTable
+from .genotypeCodec import missingCode, blobsToCodes
+from .bulkLoad import stagingFile, loadStagingFile
+from .phenotypeTables import readPhenoFile, reconcileIndividuals
+from .rowVersions import MODIFIED_COLUMN, MODIFIED_DEFINITION
+
+# groupings in the database
+def getGroupings(cnx : connector) -> list:
+	with cnx.cursor() as curs:
+		curs.execute("SELECT grouping_name FROM intDBgen_group_overview")
+		return [x[0] for x in curs]
+
+# make a new grouping from a grouping file
+# returns (number of individuals, number of groups)
+def createGrouping(cnx : connector, userInfo : dict, groupingName : str, fileName : str, description : str = "",
+					batchSize : int = 10000):
+	if not identifier_syntax_check(groupingName):
+		raise ValueError("Invalid grouping name")
+	with cnx.cursor() as curs:
+		curs.execute("SHOW TABLES LIKE %s", (groupingName,))
+		if curs.fetchone() is not None:
+			raise ValueError("A table with that name already exists, please pick a different grouping name")
+	colTypes = ["Individual", "VARCHAR"]
+	indIDlookup, newIDs = reconcileIndividuals(cnx, fileName, 0)
+	staging = stagingFile()
+	try:
+		maxLen = readPhenoFile(fileName, staging, colTypes, indIDlookup)
+		with cnx.cursor() as curs:
+			curs.execute("CREATE TABLE `%s` (ind_id INTEGER UNSIGNED PRIMARY KEY, group_name VARCHAR(%s) NOT NULL, %s, INDEX (group_name), INDEX (%s), FOREIGN KEY (ind_id) REFERENCES intDBpedigree(ind_id))" %
+				(groupingName, max(1, maxLen[1]), MODIFIED_DEFINITION, MODIFIED_COLUMN))
+			try:
+				loadStagingFile(cnx, userInfo, groupingName, ["ind_id", "group_name"], staging, batchSize)
+				curs.execute("SELECT COUNT(DISTINCT group_name) FROM `%s`" % groupingName)
+				nGroups = curs.fetchone()[0]
+				curs.execute("INSERT INTO intDBgen_group_overview VALUES (%s, %s, %s)", (groupingName, nGroups, description))
+				cnx.commit()
+			except BaseException:
+				cnx.rollback()
+				curs.execute("DROP TABLE `%s`" % groupingName)
+				raise
+	except BaseException:
+		# the grouping was not made, so none of the individuals added to the pedigree are used
+		cnx.rollback()
+		removeIndsNotInTable(cnx, None, newIDs)
+		cnx.commit()
+		raise
+	finally:
+		staging.remove()
+	return (len(indIDlookup), nGroups)
+
+# count alleles and called genotypes of each group in one pass over the genotypes of a panel
+# returns dict with keys
+#   groups : list of group names
+#   nGenotyped : array (groups) of genotyped individuals in each group
+#   called : array (groups x loci) of called genotypes
+#   counts : Biallelic: array (groups x loci) of alt allele copies
+#     otherwise: array (groups x codes of all loci) of counts of each code (genotype_id for Multiallelic,
+#     allele_id for Hyperallelic), the count of code c at locus j is counts[:, codeOffsets[j] + c]
+#   codeOffsets : (not Biallelic) array (loci + 1) of the first column of each locus in counts
+def groupCounts(cnx : connector, panelName : str, groupingName : str, batchSize : int = 1000) -> dict:
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	miss = missingCode(panelType, ploidy)
+	with cnx.cursor() as curs:
+		curs.execute("SELECT DISTINCT group_name FROM `%s` ORDER BY group_name" % groupingName)
+		groups = [x[0] for x in curs]
+	if panelType != "Biallelic":
+		# each locus has columns for codes 0 (missing) to its largest code
+		nCodes = np.ones(nLoci, dtype=np.int64)
+		locusPos = {x : i for i, x in enumerate(getLocusIDsInBlob(cnx, panelName))}
+		with cnx.cursor() as curs:
+			curs.execute("SELECT locus_id, MAX(%s) FROM `intDB%s_lt` GROUP BY locus_id" %
+				("genotype_id" if panelType == "Multiallelic" else "allele_id", panelName))
+			for x in curs:
+				nCodes[locusPos[x[0]]] = x[1] + 1
+		codeOffsets = np.concatenate([[0], np.cumsum(nCodes)])
+	groupIndex = {groups[i] : i for i in range(0, len(groups))}
+	nG = len(groups)
+	nGenotyped = np.zeros(nG, dtype=np.int64)
+	called = np.zeros((nG, nLoci), dtype=np.int64)
+	if panelType == "Biallelic":
+		counts = np.zeros((nG, nLoci), dtype=np.int64)
+	else:
+		counts = np.zeros(nG * codeOffsets[-1], dtype=np.int64)
+		# first column of the locus of each code
+		codeOffset = codeOffsets[np.repeat(np.arange(nLoci), ploidy) if panelType == "Hyperallelic" else np.arange(nLoci)]
+	with cnx.cursor() as curs:
+		curs.execute("SELECT gr.group_name, g.genotypes FROM `intDB%s_gt` AS g INNER JOIN `%s` AS gr ON g.ind_id = gr.ind_id" %
+			(panelName, groupingName))
+		rows = curs.fetchmany(batchSize)
+		while rows:
+			g = np.array([groupIndex[x[0]] for x in rows], dtype=np.int64)
+			codes = blobsToCodes([x[1] for x in rows], panelType, ploidy, nLoci)
+			# group by with a one-hot matrix, exact in float32 for a batch
+			oneHot = np.zeros((len(rows), nG), dtype=np.float32)
+			oneHot[np.arange(len(rows)), g] = 1
+			nGenotyped += np.rint(oneHot.sum(axis=0)).astype(np.int64)
+			isCalled = (codes[:, ::ploidy] if panelType == "Hyperallelic" else codes) != miss
+			called += np.rint(oneHot.T @ isCalled.astype(np.float32)).astype(np.int64)
+			if panelType == "Biallelic":
+				counts += np.rint(oneHot.T @ np.where(isCalled, codes, 0).astype(np.float32)).astype(np.int64)
+			else:
+				key = g[:, None] * codeOffsets[-1] + codeOffset[None, :] + codes
+				# only the (group, locus, code) combinations seen in the batch are added
+				keys, n = np.unique(key.ravel(), return_counts=True)
+				counts[keys] += n
+			rows = curs.fetchmany(batchSize)
+	if panelType == "Biallelic":
+		return {"groups" : groups, "nGenotyped" : nGenotyped, "called" : called, "counts" : counts}
+	return {"groups" : groups, "nGenotyped" : nGenotyped, "called" : called, "counts" : counts.reshape(nG, codeOffsets[-1]),
+		"codeOffsets" : codeOffsets}
+
+# allele names and counts of each group from the results of groupCounts
+# returns (list (one per locus) of allele names, list (one per locus) of arrays (groups x alleles) of allele counts)
+def groupAlleleCounts(cnx : connector, panelName : str, res : dict):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	counts = res["counts"]
+	nG = len(res["groups"])
+	with cnx.cursor() as curs:
+		if panelType == "Biallelic":
+			curs.execute("SELECT intDBref_allele, intDBalt_allele FROM `%s` ORDER BY intDBlocus_id" % panelName)
+			names = [list(x) for x in curs]
+			alleleCounts = [np.stack([ploidy * res["called"][:, j] - counts[:, j], counts[:, j]], axis=1) for j in range(0, nLoci)]
+			return (names, alleleCounts)
+		locusPos = {x : i for i, x in enumerate(getLocusIDsInBlob(cnx, panelName))}
+		names = [[] for j in range(0, nLoci)]
+		alleleCounts = [[] for j in range(0, nLoci)]
+		if panelType == "Hyperallelic":
+			curs.execute("SELECT locus_id, allele_id, allele FROM `intDB%s_lt` ORDER BY locus_id, allele_id" % panelName)
+			for x in curs:
+				j = locusPos[x[0]]
+				names[j] += [x[2]]
+				alleleCounts[j] += [counts[:, res["codeOffsets"][j] + x[1]]]
+		else:
+			# each genotype adds one count to each of its alleles (with multiplicity)
+			curs.execute("SELECT locus_id, genotype_id, %s FROM `intDB%s_lt`" % (",".join(["allele_%s" % i for i in range(1, ploidy + 1)]), panelName))
+			alleleIndex = [{} for j in range(0, nLoci)]
+			for x in curs:
+				j = locusPos[x[0]]
+				for a in x[2:]:
+					if a not in alleleIndex[j]:
+						alleleIndex[j][a] = len(names[j])
+						names[j] += [a]
+						alleleCounts[j] += [np.zeros(nG, dtype=np.int64)]
+					alleleCounts[j][alleleIndex[j][a]] = alleleCounts[j][alleleIndex[j][a]] + counts[:, res["codeOffsets"][j] + x[1]]
+	alleleCounts = [np.stack(x, axis=1) if len(x) > 0 else np.zeros((nG, 0), dtype=np.int64) for x in alleleCounts]
+	return (names, alleleCounts)
+
+# write allele frequencies and missingness of each group for a panel to a tab delimited file
+# one line per group and locus, allele frequencies as "allele:frequency" separated by commas
+# returns number of groups
+def writeGroupFrequencies(cnx : connector, panelName : str, groupingName : str, fileName : str, batchSize : int = 1000) -> int:
+	res = groupCounts(cnx, panelName, groupingName, batchSize)
+	names, alleleCounts = groupAlleleCounts(cnx, panelName, res)
+	with cnx.cursor() as curs:
+		curs.execute("SELECT intDBlocus_name FROM `%s` ORDER BY intDBlocus_id" % panelName)
+		loci = [x[0] for x in curs]
+	with open(fileName, "w") as fout:
+		fout.write("\t".join(["group", "locus", "nCalled", "nMissing", "callRate", "alleleFrequencies"]) + "\n")
+		for i in range(0, len(res["groups"])):
+			for j in range(0, len(loci)):
+				nCalled = res["called"][i, j]
+				nMissing = res["nGenotyped"][i] - nCalled
+				total = alleleCounts[j][i].sum()
+				freqs = ",".join(["%s:%s" % (names[j][k], alleleCounts[j][i, k] / total) for k in range(0, len(names[j]))
+					if alleleCounts[j][i, k] > 0]) if total > 0 else "NA"
+				callRate = "NA" if res["nGenotyped"][i] == 0 else str(nCalled / res["nGenotyped"][i])
+				fout.write("\t".join([res["groups"][i], loci[j], str(nCalled), str(nMissing), callRate, freqs]) + "\n")
+	return len(res["groups"])
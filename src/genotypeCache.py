@@ -0,0 +1,207 @@
+# local read-through cache of the genotypes of a panel
+# the decoded codes of each panel (see genotypeCodec) are kept in one memory mapped file in the
+# interface_db folder (rows x codes), with an index of ind_id, row in the file, and a checksum
+# (CRC32 of the BLOB, computed by the server) of each row
+# each read asks the server only for the checksums of the requested rows and fetches the BLOBs of
+# rows that are new or changed, so repeat reads only transfer 8 bytes per individual
+# rows are appended in order of ind_id, so reading all individuals (or a range) returns a view of the
+# memory mapped file without copying
+# the cache is reset if the panel changes (type, ploidy, or loci)
+
+import os
+import hashlib
+import numpy as np
+import mysql.connector as connector
+from . import PACKAGEDIR
+from .utils import getPanelInfo, getLocusIDsInBlob
+from .genotypeCodec import codeDtype, codesPerInd, blobsToCodes
+
+# files the genotypes of a panel are cached in, returns (codes file, index file)
+def genotypeCacheFiles(host : str, dbName : str, panelName : str):
+	base = os.path.join(PACKAGEDIR, "interface_db", "genotypes_%s" % hashlib.sha1(("%s/%s/%s" % (host, dbName, panelName)).encode()).hexdigest())
+	return (base + ".codes", base + ".npz")
+
+class genotypeCache:
+	def __init__(self, cnx : connector, panelName : str):
+		self.cnx = cnx
+		self.panelName = panelName
+		self.panelType, self.ploidy, self.nLoci = getPanelInfo(cnx, panelName)
+		self.width = codesPerInd(self.panelType, self.ploidy, self.nLoci)
+		self.dtype = np.dtype(codeDtype(self.panelType, self.ploidy))
+		self.codesFile, self.indexFile = genotypeCacheFiles(cnx.server_host, cnx.database, panelName)
+		# the layout of the cached codes
+		self.panelKey = "%s,%s,%s" % (self.panelType, self.ploidy,
+			hashlib.sha1(",".join([str(x) for x in getLocusIDsInBlob(cnx, panelName)]).encode()).hexdigest())
+		self.indIDs = np.zeros(0, dtype=np.int64) # sorted
+		self.crc = np.zeros(0, dtype=np.int64)
+		self.rows = np.zeros(0, dtype=np.int64)
+		self.nRows = 0 # rows in the codes file (including rows no longer used)
+		self.data = None
+		if os.path.exists(self.indexFile) and os.path.exists(self.codesFile):
+			with np.load(self.indexFile) as f:
+				if str(f["panel"]) == self.panelKey:
+					self.indIDs = f["ind_id"]
+					self.crc = f["crc"]
+					self.rows = f["row"]
+					self.nRows = int(f["nRows"])
+			if os.path.getsize(self.codesFile) < self.nRows * self.width * self.dtype.itemsize:
+				self.reset()
+		self.remap()
+
+	# forget all cached rows
+	def reset(self):
+		self.indIDs = np.zeros(0, dtype=np.int64)
+		self.crc = np.zeros(0, dtype=np.int64)
+		self.rows = np.zeros(0, dtype=np.int64)
+		self.nRows = 0
+		self.data = None
+		if os.path.exists(self.codesFile):
+			os.remove(self.codesFile)
+
+	# memory map the codes file, resizing it to nRows
+	def remap(self):
+		self.data = None
+		if self.nRows == 0:
+			return
+		if not os.path.isdir(os.path.dirname(self.codesFile)):
+			os.mkdir(os.path.dirname(self.codesFile))
+		with open(self.codesFile, "ab") as f:
+			f.truncate(self.nRows * self.width * self.dtype.itemsize)
+		self.data = np.memmap(self.codesFile, dtype=self.dtype, mode="r+", shape=(self.nRows, self.width))
+
+	# write the index (after the codes, so an interrupted update at worst leaves rows that are fetched again)
+	def save(self):
+		if not os.path.isdir(os.path.dirname(self.indexFile)):
+			os.mkdir(os.path.dirname(self.indexFile))
+		if self.data is not None:
+			self.data.flush()
+		tempFile = self.indexFile + ".tmp.npz"
+		np.savez(tempFile, ind_id=self.indIDs, crc=self.crc, row=self.rows, nRows=np.array(self.nRows), panel=np.array(self.panelKey))
+		os.replace(tempFile, self.indexFile)
+
+	# checksums of the rows in the server, for all individuals or only indIDs
+	# returns (sorted array of ind_id, array of checksums)
+	def serverChecksums(self, indIDs = None, batchSize : int = 10000):
+		rows = []
+		with self.cnx.cursor() as curs:
+			if indIDs is None:
+				curs.execute("SELECT ind_id, CRC32(genotypes) FROM `intDB%s_gt` ORDER BY ind_id" % self.panelName)
+				rows = curs.fetchall()
+			else:
+				for i in range(0, len(indIDs), batchSize):
+					batch = [int(x) for x in indIDs[i:(i + batchSize)]]
+					curs.execute("SELECT ind_id, CRC32(genotypes) FROM `intDB%s_gt` WHERE ind_id IN (%s) ORDER BY ind_id" %
+						(self.panelName, ",".join(["%s"] * len(batch))), batch)
+					rows += curs.fetchall()
+		x = np.array(rows, dtype=np.int64).reshape(-1, 2)
+		return (x[:, 0], x[:, 1])
+
+	# bring the cached rows of all individuals (or only indIDs) up to date with the server
+	# returns number of rows fetched
+	def refresh(self, indIDs = None, batchSize : int = 1000) -> int:
+		if indIDs is not None:
+			indIDs = np.unique(np.asarray(indIDs, dtype=np.int64))
+		ids, crc = self.serverChecksums(indIDs)
+		# drop rows deleted from the server
+		checked = np.isin(self.indIDs, indIDs) if indIDs is not None else np.ones(len(self.indIDs), dtype=bool)
+		keep = ~checked | np.isin(self.indIDs, ids)
+		if not keep.all():
+			self.indIDs = self.indIDs[keep]
+			self.crc = self.crc[keep]
+			self.rows = self.rows[keep]
+		# new and changed rows
+		pos = np.searchsorted(self.indIDs, ids)
+		cached = pos < len(self.indIDs)
+		cached[cached] = self.indIDs[pos[cached]] == ids[cached]
+		stale = np.ones(len(ids), dtype=bool)
+		stale[cached] = self.crc[pos[cached]] != crc[cached]
+		if not stale.any():
+			if not keep.all():
+				self.finish()
+			return 0
+		# changed rows are rewritten in place, new rows are appended
+		staleIDs = ids[stale]
+		staleRows = np.full(len(staleIDs), -1, dtype=np.int64)
+		isNew = ~cached[stale]
+		staleRows[~isNew] = self.rows[pos[stale][~isNew]]
+		staleRows[isNew] = self.nRows + np.arange(isNew.sum())
+		self.nRows += int(isNew.sum())
+		self.remap()
+		rowOf = dict(zip(staleIDs.tolist(), staleRows.tolist()))
+		fetchedIDs = []
+		with self.cnx.cursor() as curs:
+			for i in range(0, len(staleIDs), batchSize):
+				batch = staleIDs[i:(i + batchSize)].tolist()
+				curs.execute("SELECT ind_id, genotypes FROM `intDB%s_gt` WHERE ind_id IN (%s)" % (self.panelName, ",".join(["%s"] * len(batch))), batch)
+				fetched = curs.fetchall()
+				if len(fetched) > 0:
+					self.data[[rowOf[x[0]] for x in fetched]] = blobsToCodes([x[1] for x in fetched], self.panelType, self.ploidy, self.nLoci)
+					fetchedIDs += [x[0] for x in fetched]
+		# merge into the index with the checksums read before the fetch (a row changed during the
+		# fetch has a checksum that doesn't match and is fetched again next time)
+		# rows deleted from the server after their checksums were read were not fetched and are dropped
+		got = np.isin(staleIDs, fetchedIDs)
+		stalePos = pos[stale]
+		staleCRC = crc[stale]
+		self.crc[stalePos[~isNew & got]] = staleCRC[~isNew & got]
+		if not got[~isNew].all():
+			keep = np.ones(len(self.indIDs), dtype=bool)
+			keep[stalePos[~isNew & ~got]] = False
+			self.indIDs = self.indIDs[keep]
+			self.crc = self.crc[keep]
+			self.rows = self.rows[keep]
+		added = isNew & got
+		allIDs = np.concatenate([self.indIDs, staleIDs[added]])
+		order = np.argsort(allIDs, kind="stable")
+		self.indIDs = allIDs[order]
+		self.crc = np.concatenate([self.crc, staleCRC[added]])[order]
+		self.rows = np.concatenate([self.rows, staleRows[added]])[order]
+		self.finish()
+		return len(fetchedIDs)
+
+	# save the index after an update, first rewriting the codes file in order of ind_id if many
+	# rows were dropped or rows were added out of order
+	def finish(self):
+		if self.nRows > len(self.rows) * 2 or (len(self.rows) > 1 and (np.diff(self.rows) < 0).any()):
+			self.compact()
+		self.save()
+
+	# rewrite the codes file with rows in order of ind_id and no unused rows
+	def compact(self):
+		if len(self.rows) == 0:
+			self.reset()
+			return
+		tempFile = self.codesFile + ".tmp"
+		out = np.memmap(tempFile, dtype=self.dtype, mode="w+", shape=(len(self.rows), self.width))
+		for i in range(0, len(self.rows), 10000):
+			out[i:(i + 10000)] = self.data[self.rows[i:(i + 10000)]]
+		out.flush()
+		del out
+		self.data = None
+		# the old index doesn't match the new row order
+		if os.path.exists(self.indexFile):
+			os.remove(self.indexFile)
+		os.replace(tempFile, self.codesFile)
+		self.rows = np.arange(len(self.rows), dtype=np.int64)
+		self.nRows = len(self.rows)
+		self.remap()
+
+	# codes of all genotyped individuals (or only indIDs), refreshed from the server first
+	# returns (sorted array of ind_id, 2D array of codes) for the individuals that are genotyped
+	# when the rows are consecutive in the codes file, the array is a view of the memory map (read only)
+	def read(self, indIDs = None, batchSize : int = 1000):
+		self.refresh(indIDs, batchSize)
+		if indIDs is None:
+			sel = np.arange(len(self.indIDs))
+		else:
+			sel = np.searchsorted(self.indIDs, np.intersect1d(np.asarray(indIDs, dtype=np.int64), self.indIDs))
+		rows = self.rows[sel]
+		if len(rows) == 0:
+			return (self.indIDs[sel], np.zeros((0, self.width), dtype=self.dtype))
+		if (np.diff(rows) == 1).all():
+			codes = self.data[rows[0]:(rows[-1] + 1)]
+		else:
+			codes = self.data[rows]
+		codes = codes.view(np.ndarray)
+		codes.flags.writeable = False
+		return (self.indIDs[sel], codes)
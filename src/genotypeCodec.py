@@ -0,0 +1,255 @@
+# genotype codec
+# conversion between per-locus integer codes and the BLOB representation
+# stored in the genotypes column of intDB<panel>_gt
+#   Biallelic: code is the number of copies of the alt allele, missing is ploidy + 1
+#     each code is packed into numBits(2, ploidy) bits, most significant bit first,
+#     and the BLOB is zero padded on the right to a whole number of bytes
+#   Multiallelic: code is the genotype_id from the lookup table, one byte per locus, missing is 0
+#   Hyperallelic: code is the allele_id from the lookup table, one byte per allele
+#     (ploidy bytes per locus), missing is 0
+# codes for many individuals are handled as 2D arrays (individuals x codes) so that
+# whole batches are packed and unpacked without per-genotype Python objects
+
+import numpy as np
+from math import comb
+import mysql.connector as connector
+from .utils import numBits, getPanelInfo
+
+# value used for a missing genotype (Biallelic, Multiallelic) or allele (Hyperallelic)
+def missingCode(panelType : str, ploidy : int) -> int:
+	if panelType == "Biallelic":
+		return ploidy + 1
+	return 0
+
+# smallest unsigned integer type that holds all codes for a panel
+def codeDtype(panelType : str, ploidy : int):
+	if panelType == "Biallelic" and ploidy + 1 > 255:
+		return np.uint16
+	return np.uint8
+
+# number of codes stored for one individual
+def codesPerInd(panelType : str, ploidy : int, nLoci : int) -> int:
+	if panelType == "Hyperallelic":
+		return nLoci * ploidy
+	return nLoci
+
+# number of bytes in the BLOB of one individual
+def blobLength(panelType : str, ploidy : int, nLoci : int) -> int:
+	if panelType == "Biallelic":
+		return -(-(nLoci * numBits(2, ploidy)) // 8) # ceiling division
+	return codesPerInd(panelType, ploidy, nLoci)
+
+# convert a 2D array of codes (individuals x codes) into a list of BLOBs (bytes)
+def codesToBlobs(codes, panelType : str, ploidy : int) -> list:
+	codes = np.asarray(codes)
+	if codes.ndim == 1:
+		codes = codes.reshape(1, -1)
+	if panelType == "Biallelic":
+		nb = numBits(2, ploidy)
+		shifts = np.arange(nb - 1, -1, -1, dtype=codes.dtype)
+		# expand each code into its bits, most significant first, then pack 8 bits per byte
+		# packbits pads the last byte of each row with zeros
+		bits = ((codes[:, :, None] >> shifts) & 1).astype(np.uint8)
+		packed = np.packbits(bits.reshape(codes.shape[0], -1), axis=1)
+	else:
+		packed = codes.astype(np.uint8, copy=False)
+	return [row.tobytes() for row in packed]
+
+# convert the codes of one individual into a BLOB
+def codesToBlob(codes, panelType : str, ploidy : int) -> bytes:
+	return codesToBlobs(codes, panelType, ploidy)[0]
+
+# convert a sequence of BLOBs into a 2D array of codes (individuals x codes)
+# any bytes past the expected length of the BLOB are ignored
+def blobsToCodes(blobs, panelType : str, ploidy : int, nLoci : int):
+	nBytes = blobLength(panelType, ploidy, nLoci)
+	packed = np.frombuffer(b"".join([bytes(b[:nBytes]) for b in blobs]), dtype=np.uint8)
+	packed = packed.reshape(-1, nBytes)
+	if panelType != "Biallelic":
+		return packed
+	nb = numBits(2, ploidy)
+	dtype = codeDtype(panelType, ploidy)
+	bits = np.unpackbits(packed, axis=1)[:, :(nLoci * nb)].reshape(packed.shape[0], nLoci, nb)
+	weights = (1 << np.arange(nb - 1, -1, -1)).astype(dtype)
+	return (bits.astype(dtype) * weights).sum(axis=2, dtype=dtype)
+
+# convert the BLOB of one individual into a 1D array of codes
+def blobToCodes(blob, panelType : str, ploidy : int, nLoci : int):
+	return blobsToCodes([blob], panelType, ploidy, nLoci)[0]
+
+# translates batches of genotypes read from a file (genotypeFileIterators.genoBatch)
+# into the codes stored in the BLOB
+# the lookup tables are built once per import as sorted arrays of integer keys, and
+# whole batches are translated with array indexing (searchsorted) rather than dictionaries
+#   Biallelic: the interned codes of the ref and alt allele of each locus
+#   Hyperallelic: key (locus index, interned allele) -> allele_id
+#   Multiallelic: key (locus index, interned allele) -> rank of the allele within the locus, then
+#     key (locus index, rank of the sorted multiset of allele ranks) -> genotype_id
+#     multisets are ranked with the combinatorial number system, so the rank of a
+#     genotype is always less than the number of genotypes at the locus (<= 255)
+# alleles of a Hyperallelic genotype are stored in the order of their allele strings (as sorted by the file iterators)
+class alleleTranslator:
+	# table : the alleleTable of the iterator whose batches will be translated
+	def __init__(self, cnx : connector, panelName : str, table):
+		self.panelType, self.ploidy, nLoci = getPanelInfo(cnx, panelName)
+		self.table = table
+		self.miss = missingCode(self.panelType, self.ploidy)
+		self.dtype = codeDtype(self.panelType, self.ploidy)
+		self.locusPos = {} # key locus name, value index in BLOB order
+		self.posCache = {} # key tuple of locus names, value array of indices
+		with cnx.cursor() as curs:
+			if self.panelType == "Biallelic":
+				curs.execute("SELECT intDBlocus_name, intDBref_allele, intDBalt_allele FROM `%s` ORDER BY intDBlocus_id" % panelName)
+				rows = [x for x in curs]
+				for i in range(0, len(rows)):
+					self.locusPos[rows[i][0]] = i
+				self.refCode = self.internAlleles([x[1] for x in rows])
+				self.altCode = self.internAlleles([x[2] for x in rows])
+				return
+			curs.execute("SELECT intDBlocus_id, intDBlocus_name FROM `%s` ORDER BY intDBlocus_id" % panelName)
+			locusIDs = []
+			for x in curs:
+				self.locusPos[x[1]] = len(locusIDs)
+				locusIDs += [x[0]]
+			locusIDs = np.array(locusIDs, dtype=np.int64)
+			if self.panelType == "Hyperallelic":
+				curs.execute("SELECT locus_id, allele_id, allele FROM `intDB%s_lt`" % panelName)
+				rows = [x for x in curs]
+				keys = np.searchsorted(locusIDs, np.array([x[0] for x in rows], dtype=np.int64)) * 65536 + self.internAlleles([x[2] for x in rows])
+				order = np.argsort(keys)
+				self.alleleKeys = keys[order]
+				self.alleleIDs = np.array([x[1] for x in rows], dtype=np.int64)[order]
+				# rank of each allele string within its locus, alleles are stored in string order
+				byString = sorted(range(0, len(rows)), key=lambda i: (rows[i][0], rows[i][2]))
+				stringRank = np.zeros(len(rows), dtype=np.int64)
+				for k in range(0, len(byString)):
+					stringRank[byString[k]] = k
+				self.alleleStringRanks = stringRank[order]
+			else:
+				curs.execute("SELECT locus_id, genotype_id, %s FROM `intDB%s_lt`" % (",".join(["allele_%s" % i for i in range(1, self.ploidy + 1)]), panelName))
+				rows = [x for x in curs]
+				locIdx = np.searchsorted(locusIDs, np.array([x[0] for x in rows], dtype=np.int64))
+				codes = self.internAlleles([a for x in rows for a in x[2:]]).reshape(len(rows), self.ploidy)
+				# rank of each allele within its locus
+				self.alleleKeys = np.unique((locIdx[:, None] * 65536 + codes).ravel())
+				self.alleleRanks = np.arange(len(self.alleleKeys)) - np.searchsorted(self.alleleKeys, (self.alleleKeys // 65536) * 65536)
+				ranks = self.alleleRanks[np.searchsorted(self.alleleKeys, locIdx[:, None] * 65536 + codes)]
+				maxRank = int(ranks.max()) if len(rows) > 0 else 0
+				# table of binomial coefficients for ranking multisets
+				# only entries < 256 are ever summed, larger values are capped to avoid overflow
+				self.combTable = np.array([[min(comb(c, j), 1 << 40) for j in range(0, self.ploidy + 1)]
+					for c in range(0, maxRank + self.ploidy)], dtype=np.int64)
+				keys = locIdx * 256 + self.multisetRank(ranks)
+				order = np.argsort(keys)
+				self.genoKeys = keys[order]
+				self.genoIDs = np.array([x[1] for x in rows], dtype=np.int64)[order]
+
+	# interned codes for a list of allele strings, as int64
+	def internAlleles(self, alleles):
+		if len(alleles) == 0:
+			return np.zeros(0, dtype=np.int64)
+		return self.table.intern(alleles).astype(np.int64)
+
+	# rank of sorted multisets of allele ranks, last axis is the alleles of one genotype
+	def multisetRank(self, ranks):
+		c = np.sort(ranks, axis=-1) + np.arange(self.ploidy)
+		return self.combTable[c, np.arange(1, self.ploidy + 1)].sum(axis=-1)
+
+	# look up keys in a sorted key array
+	# returns (index of each key, boolean array of whether each key was found)
+	@staticmethod
+	def lookup(sortedKeys, keys):
+		idx = np.searchsorted(sortedKeys, keys)
+		idx[idx == len(sortedKeys)] = 0
+		found = sortedKeys[idx] == keys if len(sortedKeys) > 0 else np.zeros(keys.shape, dtype=bool)
+		return (idx, found)
+
+	# BLOB positions for the loci of a batch
+	def positions(self, loci):
+		pos = self.posCache.get(loci)
+		if pos is None:
+			pos = np.array([self.locusPos[x] for x in loci], dtype=np.int64)
+			self.posCache[loci] = pos
+		return pos
+
+	# translate a genoBatch into a 2D array of codes (individuals x codes) covering every locus in the panel
+	# loci that are not in the batch (or not present for an individual) are missing
+	# returns (codes, boolean array of the same shape that is True where the code came from the batch)
+	def toCodes(self, batch):
+		pos = self.positions(batch.loci)
+		nInd = len(batch)
+		nLoci = len(self.locusPos)
+		alleles = batch.alleles.astype(np.int64)
+		missing = (alleles == 0).any(axis=2) | ~batch.present
+		if self.panelType == "Biallelic":
+			isAlt = alleles == self.altCode[pos][None, :, None]
+			isRef = alleles == self.refCode[pos][None, :, None]
+			if ((~isAlt & ~isRef).any(axis=2) & ~missing).any():
+				raise ValueError("unrecognized allele")
+			genos = isAlt.sum(axis=2)
+			genos[missing] = self.miss
+			codes = np.full((nInd, nLoci), self.miss, dtype=self.dtype)
+			covered = np.zeros((nInd, nLoci), dtype=bool)
+			codes[:, pos] = genos
+			covered[:, pos] = batch.present
+		elif self.panelType == "Hyperallelic":
+			idx, found = self.lookup(self.alleleKeys, pos[None, :, None] * 65536 + alleles)
+			if (~found & (alleles != 0)).any():
+				raise ValueError("unrecognized allele")
+			genos = np.where(found, self.alleleIDs[idx], 0)
+			genos[missing] = 0
+			# same order as the allele strings
+			order = np.argsort(np.where(found, self.alleleStringRanks[idx], -1), axis=2, kind="stable")
+			genos = np.take_along_axis(genos, order, axis=2)
+			codes = np.zeros((nInd, nLoci, self.ploidy), dtype=self.dtype)
+			covered = np.zeros((nInd, nLoci, self.ploidy), dtype=bool)
+			codes[:, pos] = genos
+			covered[:, pos] = batch.present[:, :, None]
+			codes = codes.reshape(nInd, -1)
+			covered = covered.reshape(nInd, -1)
+		else:
+			idx, found = self.lookup(self.alleleKeys, pos[None, :, None] * 65536 + alleles)
+			if (~found & (alleles != 0)).any():
+				raise ValueError("unrecognized allele")
+			ranks = np.where(found, self.alleleRanks[idx], 0)
+			gIdx, gFound = self.lookup(self.genoKeys, pos[None, :] * 256 + self.multisetRank(ranks))
+			if (~gFound & ~missing).any():
+				raise ValueError("unrecognized genotype")
+			genos = np.where(gFound & ~missing, self.genoIDs[gIdx], 0)
+			codes = np.zeros((nInd, nLoci), dtype=self.dtype)
+			covered = np.zeros((nInd, nLoci), dtype=bool)
+			codes[:, pos] = genos
+			covered[:, pos] = batch.present
+		return (codes, covered)
+
+# stream genotypes of a panel from the database in batches
+# yields (array of ind_id, 2D array of codes) for up to batchSize individuals at a time
+# the cursor stays open while iterating, so the connection cannot be used
+# for anything else until the iteration is finished
+def iterGenotypeBatches(cnx : connector, panelName : str, batchSize : int = 1000):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	with cnx.cursor() as curs:
+		curs.execute("SELECT ind_id, genotypes FROM `intDB%s_gt` ORDER BY ind_id" % panelName)
+		rows = curs.fetchmany(batchSize)
+		while rows:
+			yield (np.array([x[0] for x in rows], dtype=np.int64),
+				blobsToCodes([x[1] for x in rows], panelType, ploidy, nLoci))
+			rows = curs.fetchmany(batchSize)
+
+# genotypes of selected individuals of a panel
+# returns (array of ind_id, 2D array of codes) for the individuals that are genotyped,
+# in order of ind_id
+def getGenotypeCodes(cnx : connector, panelName : str, indIDs, batchSize : int = 1000):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	indIDs = sorted(set([int(x) for x in indIDs]))
+	ids = []
+	blobs = []
+	with cnx.cursor() as curs:
+		for i in range(0, len(indIDs), batchSize):
+			batchIDs = indIDs[i:(i + batchSize)]
+			curs.execute("SELECT ind_id, genotypes FROM `intDB%s_gt` WHERE ind_id IN (%s) ORDER BY ind_id" % (panelName, ",".join(["%s"] * len(batchIDs))),
+				batchIDs)
+			for x in curs:
+				ids += [x[0]]
+				blobs += [x[1]]
+	return (np.array(ids, dtype=np.int64), blobsToCodes(blobs, panelType, ploidy, nLoci))
@@ -4,10 +4,15 @@
 # specifically returns tuple of (indName, {dict of genotypes, key locus name, value sorted tuple of alleles})
 # also make locus names (order of loci returned) available
 # note that for some formats locus names can change from one call to the next, for others it does not
+# all iterators also have nextBatch(n) and batches(n) that return genoBatch objects
+# holding many individuals as arrays, with the same layout for every file format
 
+import os
 import re
+import numpy as np
 from itertools import chain
 from .utils import dlgError
+from .compressedInput import openInputFile
 
 # basic multi-locus genotype structure to help readability
 # holds genotypes for one or more loci for one individual
@@ -16,12 +21,68 @@ class multLocGeno:
 		self.indName = indName
 		self.genoDict = genoDict # key is locus name, value is tuple of alleles e.g. ("AA", "AC", "CC") for a triploid microhap genotype
 
+# interned allele strings
+# each distinct allele in a file is given a small integer code, with 0 always the missing allele ("")
+# shared between an iterator and anything translating its batches, so codes are the same in all batches
+class alleleTable:
+	def __init__(self):
+		self.alleles = [""] # allele string for each code
+		self.index = {"" : 0} # key allele string, value code
+
+	# return code for each allele in an array of allele strings, adding new alleles to the table
+	# only the distinct alleles are looked up in Python
+	def intern(self, alleles):
+		alleles = np.asarray(alleles, dtype=str)
+		uniq, inverse = np.unique(alleles, return_inverse=True)
+		uniqCodes = np.empty(len(uniq), dtype=np.uint16)
+		for i in range(0, len(uniq)):
+			code = self.index.get(uniq[i])
+			if code is None:
+				code = len(self.alleles)
+				if code > 65535:
+					raise RuntimeError("Too many distinct alleles in input file")
+				self.index[str(uniq[i])] = code
+				self.alleles += [str(uniq[i])]
+			uniqCodes[i] = code
+		return uniqCodes[inverse].reshape(alleles.shape)
+
+# genotypes of several individuals from one file
+# names : array of individual names (n_ind)
+# loci : tuple of locus names (n_loci)
+# alleles : uint16 array (n_ind, n_loci, ploidy) of codes from alleleTable, alleles are NOT sorted
+# present : boolean array (n_ind, n_loci), False where a locus was not in the file for an individual
+#    (only happens for long format files), alleles for those are 0
+# table : the alleleTable the codes refer to
+class genoBatch:
+	def __init__(self, names, loci, alleles, present, table : alleleTable):
+		self.names = names
+		self.loci = loci
+		self.alleles = alleles
+		self.present = present
+		self.table = table
+
+	def __len__(self):
+		return len(self.names)
+
+	# new batch with only some individuals, idx is a boolean mask or array of indices
+	def subset(self, idx):
+		return genoBatch(self.names[idx], self.loci, self.alleles[idx], self.present[idx], self.table)
+
+# methods shared by all iterators for reading batches
+class batchReader:
+	# generator of genoBatch objects with up to n individuals each
+	def batches(self, n : int):
+		batch = self.nextBatch(n)
+		while batch is not None:
+			yield batch
+			batch = self.nextBatch(n)
+
 # iterator to read "2col" format genotype files
-class genoIter_2col:
+class genoIter_2col(batchReader):
 	# file path, whether to strip trailing .-aA1 from locus names, ploidy
 	def __init__(self, file : str, strip_a1 : bool, ploidy : int):
 		# open file
-		self.f = open(file, "r")
+		self.f = openInputFile(file)
         # get locus names from header and store in order of loci in file
 		self.line = self.f.readline()
 		self.loci = self.line.rstrip("\n").split("\t")
@@ -36,6 +97,7 @@ class genoIter_2col:
 		self.ploidy = ploidy
 		self.alleleCount = self.ploidy * len(self.loci) # number of alleles each line should have
 		self.indName = None
+		self.table = alleleTable()
 
 	def __iter__(self):
 		return self
@@ -55,6 +117,24 @@ class genoIter_2col:
 				self.genos[self.loci[i_locus]] = tuple(sorted(sep[i_geno:(i_geno + self.ploidy)]))
 			return multLocGeno(self.indName, self.genos)
 
+	# return a genoBatch with up to n individuals, or None at the end of the file
+	def nextBatch(self, n : int):
+		rows = []
+		while len(rows) < n:
+			self.readNextLine()
+			if self.line == "":
+				break
+			sep = self.line.rstrip("\n").split("\t")
+			if len(sep) != self.alleleCount + 1:
+				dlgError(parent=None, message="Incorrect number of alleles in input file at individual %s" % sep[0])
+				raise RuntimeError("Incorrect number of alleles in input file at individual %s" % sep[0])
+			rows += [sep]
+		if len(rows) == 0:
+			return None
+		rows = np.array(rows, dtype=str)
+		alleles = self.table.intern(rows[:, 1:]).reshape(len(rows), len(self.loci), self.ploidy)
+		return genoBatch(rows[:, 0], tuple(self.loci), alleles, np.ones(alleles.shape[:2], dtype=bool), self.table)
+
 	# read next line but skip blank lines
 	def readNextLine(self):
 		self.line = self.f.readline()
@@ -63,19 +143,21 @@ class genoIter_2col:
 
 # iterator to read plink text (ped + map) format genotype files
 # assumes map file has same base name as ped file
+# the ped and map files can be compressed (e.g., name.ped.gz with name.map.gz or name.map)
 # handles tabs and/or spaces as the field separator
-class genoIter_plinkPEDMAP:
+class genoIter_plinkPEDMAP(batchReader):
 	# file path to .ped file
 	def __init__(self, file : str):
 		# compile splitting expression
 		self.splitPattern = re.compile("\t| ")
 		# get loci names
 		self.loci = []
-		for mapLine in open(re.sub(r"\.ped$", ".map", file), "r"):
-			self.loci += [re.split(self.splitPattern, mapLine.rstrip("\n"))[1]]
+		with openInputFile(self.mapFileName(file)) as mapIn:
+			for mapLine in mapIn:
+				self.loci += [re.split(self.splitPattern, mapLine.rstrip("\n"))[1]]
 		self.alleleCount = len(self.loci) * 2
 		# detect number of loci and compound format or not based on first line of ped file
-		with open(file, "r") as pedIn:
+		with openInputFile(file) as pedIn:
 			firstLine = pedIn.readline()
 			firstLine = re.split(self.splitPattern, firstLine.rstrip("\n"))
 			if len(self.loci) + 6 == len(firstLine):
@@ -87,7 +169,7 @@ class genoIter_plinkPEDMAP:
 				raise RuntimeError("Incorrectly formatted PLINK files input")
 
 		# open ped file
-		self.ped = open(file, "r")
+		self.ped = openInputFile(file)
 
 		# dictionary: key is locus name, value is (allele1, allele2) for ploidy n
 		# saving as attribute so don't have to reallocate a dictionary each iteration
@@ -95,6 +177,15 @@ class genoIter_plinkPEDMAP:
 		for l in self.loci:
 			self.genos[l] = None
 		self.indName = None
+		self.table = alleleTable()
+
+	# name of the map file for a ped file, with the same compression suffix if that file exists
+	@staticmethod
+	def mapFileName(file : str) -> str:
+		mapFile = re.sub(r"\.ped(\.gz|\.bgz|\.zst)?$", ".map\\1", file)
+		if not os.path.exists(mapFile):
+			mapFile = re.sub(r"\.ped(\.gz|\.bgz|\.zst)?$", ".map", file)
+		return mapFile
 
 	def __iter__(self):
 		return self
@@ -123,6 +214,36 @@ class genoIter_plinkPEDMAP:
 				self.genos[self.loci[i_locus]] = tuple(sorted(sep[i_geno:(i_geno + 2)]))
 			return multLocGeno(self.indName, self.genos)
 
+	# return a genoBatch with up to n individuals, or None at the end of the file
+	def nextBatch(self, n : int):
+		names = []
+		rows = []
+		while len(rows) < n:
+			line = self.ped.readline()
+			if line == "":
+				break
+			sep = re.split(self.splitPattern, line.rstrip("\n"))
+			if len(sep) - 6 != (len(self.loci) if self.cmpGenos else self.alleleCount):
+				raise RuntimeError("Wrong number of alleles in PLINK file at individual %s" % sep[1])
+			names += [sep[1]]
+			rows += [sep[6:]]
+		if len(rows) == 0:
+			return None
+		if self.cmpGenos:
+			# split each two character genotype into its alleles
+			rows = np.array(rows, dtype=str)
+			badRows = np.flatnonzero((np.char.str_len(rows) != 2).any(axis=1))
+			if len(badRows) > 0:
+				raise RuntimeError("Wrong number of alleles in PLINK file at individual %s" % names[badRows[0]])
+			rows = rows.astype("U2").view("U1")
+		else:
+			rows = np.array(rows, dtype=str)
+		if rows.shape[1] != self.alleleCount:
+			raise RuntimeError("Wrong number of alleles in PLINK file")
+		rows[rows == "0"] = "" # missing allele
+		alleles = self.table.intern(rows).reshape(len(rows), len(self.loci), 2)
+		return genoBatch(np.array(names, dtype=str), tuple(self.loci), alleles, np.ones(alleles.shape[:2], dtype=bool), self.table)
+
 # TODO left off here changing from returning tuple to returning dict
 #    to use for insert and update, run through loci in panel in order needed
 #       with a .get() statemtne and have a default return of missing genotype value
@@ -135,11 +256,11 @@ class genoIter_plinkPEDMAP:
 # note that loci names are NOT saved to object b/c they change between iterations
 # loci names are instead returned as part of iterator
 # iterator returns (individual name, (allele1, allelel2, ...), (locusname1, locusname2, ...))
-class genoIter_long:
+class genoIter_long(batchReader):
 	# file path, maximum number of lines to read at once 
 	def __init__(self, file : str, nline : int):
 		# open file
-		self.f = open(file, "r")
+		self.f = openInputFile(file)
         # get ploidy from header
 		self.readNextLine()
 		self.ploidy = len(self.sep) - 2
@@ -148,6 +269,8 @@ class genoIter_long:
 			raise RuntimeError("Input genotype file did not have enough columns")
 		# define number of lines
 		self.nline = nline
+		self.table = alleleTable()
+		self.batchNames = set() # individuals in batches already returned by nextBatch
 		# load first genotype line in look-ahead variable
 		self.readNextLine()
 
@@ -180,6 +303,44 @@ class genoIter_long:
 				raise RuntimeError("Wrong number of columns on one or more lines with individual %s" % indID)
 			return (indID, tuple(genos), tuple(loci))
 	
+	# return a genoBatch with up to n individuals, or None at the end of the file
+	# a batch has one row per individual: lines of an individual that are not next to each other
+	# are combined if they are in the same batch, and an individual in an earlier batch is an error
+	# loci are all loci seen in the batch, in order of first appearance
+	def nextBatch(self, n : int):
+		if self.line == "":
+			return None
+		names = []
+		rowOf = {} # key individual name, value row in batch
+		locusIndex = {} # key locus name, value position in batch
+		indIdx = []
+		locIdx = []
+		alleles = []
+		while self.line != "":
+			row = rowOf.get(self.sep[0])
+			if row is None:
+				if self.sep[0] in self.batchNames:
+					dlgError(parent=None, message="Lines with individual %s are in more than one part of the file, the lines of each individual must be together" % self.sep[0])
+					raise RuntimeError("Lines with individual %s are in more than one part of the file, the lines of each individual must be together" % self.sep[0])
+				if len(names) == n:
+					break
+				row = rowOf[self.sep[0]] = len(names)
+				names += [self.sep[0]]
+			if len(self.sep) != self.ploidy + 2:
+				dlgError(parent=None, message="Wrong number of columns on one or more lines with individual %s" % self.sep[0])
+				raise RuntimeError("Wrong number of columns on one or more lines with individual %s" % self.sep[0])
+			indIdx += [row]
+			locIdx += [locusIndex.setdefault(self.sep[1], len(locusIndex))]
+			alleles += self.sep[2:]
+			self.readNextLine()
+		codes = self.table.intern(alleles).reshape(-1, self.ploidy)
+		batchAlleles = np.zeros((len(names), len(locusIndex), self.ploidy), dtype=np.uint16)
+		present = np.zeros((len(names), len(locusIndex)), dtype=bool)
+		batchAlleles[indIdx, locIdx] = codes
+		present[indIdx, locIdx] = True
+		self.batchNames.update(names)
+		return genoBatch(np.array(names, dtype=str), tuple(locusIndex), batchAlleles, present, self.table)
+
 	def readNextLine(self):
 		self.line = self.f.readline()
 		self.sep = self.line.rstrip("\n").split("\t")
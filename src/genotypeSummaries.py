@@ -0,0 +1,281 @@
+# summary tables maintained alongside the genotype tables
+# per-locus summaries for a panel are stored in two tables
+#   intDB<panel>_ls : one row per locus with number of individuals called,
+#     missing, and heterozygous
+#   intDB<panel>_lc : counts per locus of each code stored in the BLOB
+#     Biallelic: code_id is the number of copies of the alt allele (genotype counts)
+#     Multiallelic: code_id is the genotype_id (genotype counts)
+#     Hyperallelic: code_id is the allele_id (allele counts)
+#     missing genotypes/alleles are not counted
+# per-individual QC metrics for a panel are stored in
+#   intDB<panel>_iq : one row per genotyped individual with number of loci called,
+#     missing, and heterozygous, call rate, and observed heterozygosity
+# the tables are updated incrementally from the codes computed during import
+# so that summaries do not require a pass over the genotype table
+
+import numpy as np
+import mysql.connector as connector
+from .utils import getPanelInfo, getLocusIDsInBlob
+from .genotypeCodec import missingCode, iterGenotypeBatches
+
+# create the locus summary tables for a panel
+# this does not commit, but note that CREATE TABLE causes an implicit commit in MySQL
+def createLocusSummaryTables(cnx : connector, panelName : str):
+	with cnx.cursor() as curs:
+		curs.execute("""
+		CREATE TABLE `intDB{0}_ls` (
+		locus_id INTEGER UNSIGNED PRIMARY KEY,
+		n_called INTEGER NOT NULL DEFAULT 0,
+		n_missing INTEGER NOT NULL DEFAULT 0,
+		n_het INTEGER NOT NULL DEFAULT 0,
+		FOREIGN KEY (locus_id) REFERENCES `{0}` (intDBlocus_id))
+		""".format(panelName))
+		curs.execute("""
+		CREATE TABLE `intDB{0}_lc` (
+		locus_id INTEGER UNSIGNED NOT NULL,
+		code_id SMALLINT UNSIGNED NOT NULL,
+		n INTEGER NOT NULL DEFAULT 0,
+		PRIMARY KEY (locus_id, code_id),
+		FOREIGN KEY (locus_id) REFERENCES `{0}` (intDBlocus_id))
+		""".format(panelName))
+		# one row per locus, so updates never have to insert into _ls
+		curs.execute("INSERT INTO `intDB{0}_ls` (locus_id) SELECT intDBlocus_id FROM `{0}`".format(panelName))
+
+# create the individual QC table for a panel
+# this does not commit, but note that CREATE TABLE causes an implicit commit in MySQL
+def createIndividualQCTable(cnx : connector, panelName : str):
+	with cnx.cursor() as curs:
+		curs.execute("""
+		CREATE TABLE `intDB%s_iq` (
+		ind_id INTEGER UNSIGNED PRIMARY KEY,
+		n_called INTEGER UNSIGNED NOT NULL,
+		n_missing INTEGER UNSIGNED NOT NULL,
+		n_het INTEGER UNSIGNED NOT NULL,
+		call_rate DOUBLE NOT NULL,
+		heterozygosity DOUBLE,
+		FOREIGN KEY (ind_id) REFERENCES intDBpedigree(ind_id))
+		""" % panelName)
+
+# make sure the summary tables exist for a panel
+# panels created before summary tables were added have the tables created
+# and filled from the genotypes already stored
+# commits when tables are created
+def ensureSummaryTables(cnx : connector, panelName : str):
+	with cnx.cursor() as curs:
+		curs.execute("SHOW TABLES LIKE 'intdb%s_ls'" % panelName)
+		makeLocus = next(curs, [None])[0] is None
+		curs.execute("SHOW TABLES LIKE 'intdb%s_iq'" % panelName)
+		makeInd = next(curs, [None])[0] is None
+	if not makeLocus and not makeInd:
+		return
+	if makeLocus:
+		createLocusSummaryTables(cnx, panelName)
+	if makeInd:
+		createIndividualQCTable(cnx, panelName)
+	summary = locusSummary(cnx, panelName)
+	indQC = individualQC(panelName)
+	for indIDs, codes in iterGenotypeBatches(cnx, panelName):
+		called, het = summary.calledHet(codes)
+		if makeLocus:
+			summary.add(codes, calledHet = (called, het))
+		if makeInd:
+			indQC.add(indIDs, called, het)
+	with cnx.cursor() as curs:
+		summary.flush(curs)
+		indQC.flush(curs)
+	cnx.commit()
+
+# accumulates changes to the locus summary tables of one panel
+# add() the codes of individuals being inserted (sign = 1) or
+# the old codes of individuals being overwritten (sign = -1), and
+# flush() the accumulated changes within the same transaction as the genotypes
+class locusSummary:
+	def __init__(self, cnx : connector, panelName : str):
+		self.panelName = panelName
+		self.panelType, self.ploidy, nLoci = getPanelInfo(cnx, panelName)
+		self.locusIDs = np.array(getLocusIDsInBlob(cnx, panelName), dtype=np.int64)
+		self.miss = missingCode(self.panelType, self.ploidy)
+		# locus index of each code in the BLOB
+		if self.panelType == "Hyperallelic":
+			self.codeLocus = np.repeat(np.arange(len(self.locusIDs), dtype=np.int64), self.ploidy)
+		else:
+			self.codeLocus = np.arange(len(self.locusIDs), dtype=np.int64)
+		if self.panelType == "Multiallelic":
+			# homozygous genotypes have the first and last (sorted) alleles the same
+			# stored as keys of locus index * 65536 + genotype_id
+			with cnx.cursor() as curs:
+				curs.execute("SELECT locus_id, genotype_id FROM `intDB%s_lt` WHERE allele_1 = allele_%s" % (panelName, self.ploidy))
+				homs = np.array([x for x in curs], dtype=np.int64).reshape(-1, 2)
+			self.homKeys = np.searchsorted(self.locusIDs, homs[:, 0]) * 65536 + homs[:, 1]
+		self.reset()
+
+	def reset(self):
+		self.nCalled = np.zeros(len(self.locusIDs), dtype=np.int64)
+		self.nMissing = np.zeros(len(self.locusIDs), dtype=np.int64)
+		self.nHet = np.zeros(len(self.locusIDs), dtype=np.int64)
+		self.codeKeys = [] # arrays of locus index * 65536 + code
+		self.codeCounts = []
+		self.pending = 0
+
+	# returns boolean arrays (individuals x loci) of called and heterozygous genotypes
+	# codes is a 2D array (individuals x codes) as stored in the BLOB
+	def calledHet(self, codes):
+		if self.panelType == "Hyperallelic":
+			alleles = codes.reshape(codes.shape[0], -1, self.ploidy)
+			called = alleles[:, :, 0] != self.miss
+			het = called & (alleles.min(axis=2) != alleles.max(axis=2))
+		elif self.panelType == "Multiallelic":
+			called = codes != self.miss
+			keys = self.codeLocus * 65536 + codes
+			het = called & ~np.isin(keys, self.homKeys)
+		else:
+			called = codes != self.miss
+			het = (codes > 0) & (codes < self.ploidy)
+		return (called, het)
+
+	# add (sign = 1) or remove (sign = -1) individuals from the summary
+	# codes is a 2D array (individuals x codes) or 1D array for one individual
+	# calledHet is the result of calledHet(codes), if already computed
+	# returns boolean arrays (individuals x loci) of called and heterozygous genotypes
+	def add(self, codes, sign : int = 1, calledHet = None):
+		codes = np.asarray(codes)
+		if codes.ndim == 1:
+			codes = codes.reshape(1, -1)
+		if calledHet is None:
+			calledHet = self.calledHet(codes)
+		called, het = calledHet
+		nCalled = called.sum(axis=0)
+		self.nCalled += sign * nCalled
+		self.nMissing += sign * (codes.shape[0] - nCalled)
+		self.nHet += sign * het.sum(axis=0)
+		# counts of each non-missing code
+		keys = (self.codeLocus * 65536 + codes)[codes != self.miss]
+		keys, counts = np.unique(keys, return_counts=True)
+		self.codeKeys += [keys]
+		self.codeCounts += [sign * counts]
+		self.pending += len(keys)
+		if self.pending > 10000000:
+			self.merge()
+		return (called, het)
+
+	# combine pending code counts to limit memory use
+	def merge(self):
+		if len(self.codeKeys) < 2:
+			return
+		keys, inverse = np.unique(np.concatenate(self.codeKeys), return_inverse=True)
+		counts = np.bincount(inverse, weights=np.concatenate(self.codeCounts)).astype(np.int64)
+		self.codeKeys = [keys]
+		self.codeCounts = [counts]
+		self.pending = len(keys)
+
+	# write accumulated changes to the database and reset
+	# does not commit, call within the import transaction
+	def flush(self, curs, batchSize : int = 10000):
+		self.merge()
+		changed = np.nonzero((self.nCalled != 0) | (self.nMissing != 0) | (self.nHet != 0))[0]
+		rows = [(int(self.nCalled[i]), int(self.nMissing[i]), int(self.nHet[i]), int(self.locusIDs[i])) for i in changed]
+		sqlState = "UPDATE `intDB%s_ls` SET n_called = n_called + %%s, n_missing = n_missing + %%s, n_het = n_het + %%s WHERE locus_id = %%s" % self.panelName
+		for i in range(0, len(rows), batchSize):
+			curs.executemany(sqlState, rows[i:(i + batchSize)])
+		if len(self.codeKeys) > 0:
+			keys = self.codeKeys[0]
+			counts = self.codeCounts[0]
+			keep = counts != 0
+			rows = [(int(self.locusIDs[k // 65536]), int(k % 65536), int(n)) for k, n in zip(keys[keep], counts[keep])]
+			sqlState = "INSERT INTO `intDB%s_lc` (locus_id, code_id, n) VALUES (%%s, %%s, %%s) ON DUPLICATE KEY UPDATE n = n + VALUES(n)" % self.panelName
+			for i in range(0, len(rows), batchSize):
+				curs.executemany(sqlState, rows[i:(i + batchSize)])
+		self.reset()
+
+# accumulates rows for the individual QC table of one panel
+# metrics are computed from the called/heterozygous arrays returned by locusSummary.calledHet
+class individualQC:
+	def __init__(self, panelName : str):
+		self.panelName = panelName
+		self.rows = []
+
+	# calculate metrics without storing them
+	# returns arrays of call rate and observed heterozygosity (nan if no loci called)
+	@staticmethod
+	def metrics(called, het):
+		nCalled = called.sum(axis=1)
+		callRate = nCalled / called.shape[1]
+		with np.errstate(invalid="ignore", divide="ignore"):
+			obsHet = het.sum(axis=1) / nCalled
+		return (callRate, obsHet)
+
+	# check individuals against QC thresholds
+	# returns (boolean array of individuals passing, call rate, observed heterozygosity)
+	# individuals with no loci called have nan heterozygosity, which is not compared to maxHet
+	@staticmethod
+	def passes(called, het, minCallRate : float, maxHet : float):
+		callRate, obsHet = individualQC.metrics(called, het)
+		keep = (callRate >= minCallRate) & ~(obsHet > maxHet)
+		return (keep, callRate, obsHet)
+
+	# add individuals, indIDs is a sequence of ind_id matching the rows of called and het
+	def add(self, indIDs, called, het):
+		nCalled = called.sum(axis=1)
+		nHet = het.sum(axis=1)
+		callRate, obsHet = self.metrics(called, het)
+		for i in range(0, len(indIDs)):
+			self.rows += [(int(indIDs[i]), int(nCalled[i]), int(called.shape[1] - nCalled[i]), int(nHet[i]),
+				float(callRate[i]), None if nCalled[i] == 0 else float(obsHet[i]))]
+
+	# write accumulated rows to the database, replacing any previous values
+	# does not commit, call within the import transaction
+	def flush(self, curs, batchSize : int = 10000):
+		sqlState = "REPLACE INTO `intDB%s_iq` (ind_id, n_called, n_missing, n_het, call_rate, heterozygosity) VALUES (%%s, %%s, %%s, %%s, %%s, %%s)" % self.panelName
+		for i in range(0, len(self.rows), batchSize):
+			curs.executemany(sqlState, self.rows[i:(i + batchSize)])
+		self.rows = []
+
+# write a per-locus summary report for a panel
+# columns: locus name, number called, number missing, call rate,
+# observed heterozygosity, and counts of each allele
+def writeLocusSummary(cnx : connector, panelName : str, fileName : str):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	ensureSummaryTables(cnx, panelName)
+	# allele counts, key locus_id, value list of "allele:count"
+	alleleCounts = {}
+	with cnx.cursor() as curs:
+		if panelType == "Biallelic":
+			sqlState = """
+			SELECT lc.locus_id, p.intDBref_allele, p.intDBalt_allele, SUM((%s - lc.code_id) * lc.n), SUM(lc.code_id * lc.n)
+			FROM `intDB{0}_lc` AS lc INNER JOIN `{0}` AS p ON lc.locus_id = p.intDBlocus_id
+			GROUP BY lc.locus_id, p.intDBref_allele, p.intDBalt_allele
+			""" % ploidy
+			curs.execute(sqlState.format(panelName))
+			for x in curs:
+				alleleCounts[x[0]] = ["%s:%s" % (x[1], x[3]), "%s:%s" % (x[2], x[4])]
+		else:
+			if panelType == "Multiallelic":
+				# each genotype count contributes one count to each of its alleles
+				sqlState = " UNION ALL ".join(["""
+				SELECT lc.locus_id, lt.allele_%s AS allele, lc.n
+				FROM `intDB{0}_lc` AS lc INNER JOIN `intDB{0}_lt` AS lt
+				ON lc.locus_id = lt.locus_id AND lc.code_id = lt.genotype_id
+				""" % i for i in range(1, ploidy + 1)])
+			else:
+				sqlState = """
+				SELECT lc.locus_id, lt.allele, lc.n
+				FROM `intDB{0}_lc` AS lc INNER JOIN `intDB{0}_lt` AS lt
+				ON lc.locus_id = lt.locus_id AND lc.code_id = lt.allele_id
+				"""
+			sqlState = "SELECT locus_id, allele, SUM(n) FROM (%s) AS a GROUP BY locus_id, allele" % sqlState
+			curs.execute(sqlState.format(panelName))
+			for x in curs:
+				alleleCounts.setdefault(x[0], []).append("%s:%s" % (x[1], x[2]))
+
+		curs.execute("""
+		SELECT p.intDBlocus_id, p.intDBlocus_name, ls.n_called, ls.n_missing, ls.n_het
+		FROM `{0}` AS p INNER JOIN `intDB{0}_ls` AS ls ON p.intDBlocus_id = ls.locus_id
+		ORDER BY p.intDBlocus_id
+		""".format(panelName))
+		with open(fileName, "w") as fout:
+			fout.write("\t".join(["locus", "nCalled", "nMissing", "callRate", "obsHet", "alleleCounts"]) + "\n")
+			for x in curs:
+				total = x[2] + x[3]
+				callRate = "NA" if total == 0 else str(x[2] / total)
+				obsHet = "NA" if x[2] == 0 else str(x[4] / x[2])
+				fout.write("\t".join([x[1], str(x[2]), str(x[3]), callRate, obsHet, ",".join(alleleCounts.get(x[0], []))]) + "\n")
@@ -6,15 +6,22 @@ from PyQt6.QtWidgets import (
 	QMainWindow, QPushButton, QLabel, QLineEdit, QComboBox, 
 	 QGridLayout, QWidget, QCheckBox, QInputDialog,
 	 QFileDialog, QVBoxLayout, QSpinBox, QTextEdit, QDialog,
-	 QRadioButton, QHBoxLayout, QMessageBox
+	 QRadioButton, QHBoxLayout, QMessageBox, QDoubleSpinBox
 )
 from .utils import (dlgError, identifier_syntax_check, getCursLoci, 
-	getCursLociAlleles, getConnection, numBits, numGenotypes, indsInPedigree,
-	indsInTable, getIndsFromFile, addToPedigree, getIndIDdict, getGenoConvertDict,
-	genoToAltCopies, getLocusOrderInBlob
+	getConnection, numBits, indsInPedigree,
+	indsInTable, getIndsFromFile, addToPedigree, getIndIDdict,
+	genoToAltCopies, getLocusOrderInBlob, getIndNames, removeIndsNotInTable
 )
 from .genotypeFileIterators import *
-from itertools import combinations_with_replacement
+from .genotypeCodec import alleleTranslator, codesToBlobs, blobsToCodes
+from .importPipeline import importPipeline, readBatches, writerPool, genotypeInserter
+from .importJournal import importJournal
+from .fieldScanner import scanField
+from .lookupTables import addAllelesToLookupTable
+from .genotypeSummaries import locusSummary, individualQC, ensureSummaryTables
+from .parentage import mendelianCheck
+import numpy as np
 from statistics import fmean
 
 # using QDialog class and exec to block other windows - only one active window at a time
@@ -88,9 +95,45 @@ class importGenoWindow(QDialog):
 		self.genoConcordanceButton.clicked.connect(self.genoConcordance)
 
 		# batch size spinbox - number of lines to process at once
+		# each batch is one item passed between the reader, encoder, and writer threads,
+		# so batches need to be large enough that the threads aren't waiting on the queues
 		self.batchSizeSpinbox = QSpinBox()
 		self.batchSizeSpinbox.setRange(1,1000000)
-		self.batchSizeSpinbox.setValue(1) # default is one line at a time
+		self.batchSizeSpinbox.setValue(1000) # default is 1000 lines at a time
+
+		# number of threads converting genotypes while the file is read and the database is written
+		self.encoderSpinbox = QSpinBox()
+		self.encoderSpinbox.setRange(1, 64)
+		self.encoderSpinbox.setValue(2)
+
+		# number of connections inserting genotypes at once
+		self.writerSpinbox = QSpinBox()
+		self.writerSpinbox.setRange(1, 32)
+		self.writerSpinbox.setValue(1)
+
+		# number of individuals to import between commits, 0 commits once at the end
+		self.commitEverySpinbox = QSpinBox()
+		self.commitEverySpinbox.setRange(0, 100000000)
+		self.commitEverySpinbox.setValue(10000)
+
+		# individual QC thresholds - individuals outside these are not written
+		# defaults accept all individuals
+		self.minCallRateSpinbox = QDoubleSpinBox()
+		self.minCallRateSpinbox.setRange(0, 1)
+		self.minCallRateSpinbox.setSingleStep(0.01)
+		self.minCallRateSpinbox.setValue(0)
+		self.maxHetSpinbox = QDoubleSpinBox()
+		self.maxHetSpinbox.setRange(0, 1)
+		self.maxHetSpinbox.setSingleStep(0.01)
+		self.maxHetSpinbox.setValue(1)
+
+		# Mendelian check of new individuals against the genotypes of their parents in the pedigree
+		self.mendelianComboBox = QComboBox()
+		self.mendelianComboBox.addItems(["No Mendelian check", "Report Mendelian errors", "Reject Mendelian errors"])
+		self.maxMendelianSpinbox = QDoubleSpinBox()
+		self.maxMendelianSpinbox.setRange(0, 1)
+		self.maxMendelianSpinbox.setSingleStep(0.01)
+		self.maxMendelianSpinbox.setValue(0.02)
 
 		# start import button
 		self.importButton = QPushButton("Import genotypes")
@@ -111,8 +154,21 @@ class importGenoWindow(QDialog):
 		self.gridLayout.addWidget(QLabel("Number of loci"), 2, 2)
 		self.gridLayout.addWidget(self.panelSizeLabel, 2, 3)
 		self.gridLayout.addWidget(self.stripA1Checkbox, 3, 0)
+		self.gridLayout.addWidget(QLabel("Encoder threads"), 3, 2)
+		self.gridLayout.addWidget(self.encoderSpinbox, 3, 3)
 		self.gridLayout.addWidget(self.addNewRadio, 4, 0)
 		self.gridLayout.addWidget(self.updateRadio, 4, 1)
+		self.gridLayout.addWidget(QLabel("Commit every"), 4, 2)
+		self.gridLayout.addWidget(self.commitEverySpinbox, 4, 3)
+		self.gridLayout.addWidget(QLabel("Minimum call rate"), 5, 0)
+		self.gridLayout.addWidget(self.minCallRateSpinbox, 5, 1)
+		self.gridLayout.addWidget(QLabel("Maximum heterozygosity"), 5, 2)
+		self.gridLayout.addWidget(self.maxHetSpinbox, 5, 3)
+		self.gridLayout.addWidget(QLabel("Database connections"), 6, 2)
+		self.gridLayout.addWidget(self.writerSpinbox, 6, 3)
+		self.gridLayout.addWidget(self.mendelianComboBox, 6, 0, 1, 2)
+		self.gridLayout.addWidget(QLabel("Maximum Mendelian error rate"), 7, 0)
+		self.gridLayout.addWidget(self.maxMendelianSpinbox, 7, 1)
 
 		# layout for input file button and display of selected file name
 		self.fileSelectLayout = QHBoxLayout()
@@ -233,62 +289,17 @@ class importGenoWindow(QDialog):
 			dlgError(parent=self, message="Cannot add new alleles to loci in a biallelic panel")
 			return
 		
-		with self.cnx.cursor() as curs:
-			# for each locus with new alleles
-			for locName,newA in self.newAlleles.items():
-				# get alleles already defined
-				# could speed up by performing once for all loci and splitting and storing locally
-				if self.panelTypeLabel.text() == "Multiallelic":
-					sqlSub = "allele_1"
-				else:
-					sqlSub = "allele"
-				# get locus_id
-				# need to save value for later and may not be in lt if no alleles previously defined
-				# so running this as a separate command
-				curs.execute("SELECT intDBlocus_id FROM `%s` WHERE intDBlocus_name = '%s'" % (self.panelComboBox.currentText(), locName))
-				locus_id = curs.fetchone()[0]
-				# get currently defined alleles
-				sqlState = "SELECT DISTINCT %s FROM `intDB%s_lt` WHERE locus_id = %s" % (sqlSub, self.panelComboBox.currentText(), locus_id)
-				curs.execute(sqlState.format())
-				curAlleles = [x[0] for x in curs]
-				# check that there is space
-				if self.panelTypeLabel.text() == "Multiallelic" and numGenotypes(len(curAlleles) + len(newA), self.panelPloidy) > 255:
-					dlgError(parent=self, message="skipping locus %s: %s is too many alleles to be stored in a Multiallelic panel." % (locName, len(curAlleles) + len(newA)))
-					continue
-				if self.panelTypeLabel.text() == "Hyperallelic" and (len(curAlleles) + len(newA)) > 255:
-					dlgError(parent=self, message="skipping locus %s: %s is too many alleles to be stored in a Hyperallelic panel." % (locName, len(curAlleles) + len(newA)))
-					continue
-
-				# add
-				if self.panelTypeLabel.text() == "Multiallelic":
-					colNameString = "(" + ",".join(["locus_id", "genotype_id"] + ["allele_%s" % i for i in range(1, self.panelPloidy + 1)]) + ")"
-					sqlState = "INSERT INTO `%s` %s VALUES" % ("intDB" + self.panelComboBox.currentText() + "_lt", colNameString)
-					newGeno_id = numGenotypes(len(curAlleles), self.panelPloidy) + 1
-					for a in newA:
-						for i in range(0, self.panelPloidy):
-							copiesNewA = [a for x in range(0, self.panelPloidy - i)]
-							genos = [copiesNewA + list(x) for x in combinations_with_replacement(curAlleles, i)]
-							for j in range(0, len(genos)):
-								genos[j].sort() # make sure alleles in genotypes are sorted
-							genos.sort()
-							for j in range(0, len(genos)):
-								sqlState += "(%s,%s,%s)," % (locus_id, newGeno_id, ",".join(["'%s'" % x for x in genos[j]]))
-								newGeno_id += 1
-						curAlleles += [a]
-					curs.execute(sqlState.rstrip(","))
-				else:
-					# hyperallelic
-					newAllele_id = len(curAlleles) + 1
-					sqlState = "INSERT INTO `%s` (locus_id, allele_id, allele) VALUES" % ("intDB" + self.panelComboBox.currentText() + "_lt")
-					for a in newA:
-						sqlState += " (%s, %s, '%s')," % (locus_id, newAllele_id, a)
-						newAllele_id += 1
-					curs.execute(sqlState.rstrip(","))
-		
+		skipped = addAllelesToLookupTable(self.cnx, self.panelComboBox.currentText(), self.panelTypeLabel.text(), 
+			self.panelPloidy, self.newAlleles)
+		self.cnx.commit()
+		if len(skipped) > 0:
+			msgTxt = "Skipping %s loci with too many alleles to be stored in a %s panel: " % (len(skipped), self.panelTypeLabel.text())
+			msgTxt += ", ".join(["%s (%s alleles)" % x for x in skipped[:10]])
+			dlgError(parent=self, message=msgTxt)
 		
 		msgBox = QMessageBox(parent=self)
 		msgBox.setWindowTitle("Add new alleles")
-		msgBox.setText("Successfully added new alleles for %s loci." % len(self.newAlleles))
+		msgBox.setText("Successfully added new alleles for %s loci." % (len(self.newAlleles) - len(skipped)))
 		self.newAlleles = {} # zero out the newAlleles dictionary
 		msgBox.exec()
 
@@ -335,7 +346,9 @@ class importGenoWindow(QDialog):
 	def checkNewInds(self):
 		# get list of inds
 		inds = getIndsFromFile(self.inputFile.text(), self.fileFormat.currentText())
-		if inds[1]:
+		# names repeat on the lines of each individual in long files, the long
+		# iterator combines them into one row per individual instead
+		if inds[1] and self.fileFormat.currentText() != "long":
 			dlgError(parent=self, message="Dupliate individual names in the input file")
 			return
 		inds = inds[0]
@@ -375,11 +388,7 @@ class importGenoWindow(QDialog):
 	def checkLociNames(self, s = None, interact = True):
 		# get locus names from import file
 		if self.fileFormat.currentText() == "long":
-			h = set()
-			with open(self.inputFile.text(), "r") as fileIn:
-				header = fileIn.readline()
-				for line in fileIn:
-					h.add(line.rstrip("\n").split("\t")[1])
+			h = set(scanField(self.inputFile.text(), 1, b"\t", skipHeader=True)[0])
 		else:
 			genoIter = self.getGenoIter()
 			h = genoIter.loci
@@ -645,9 +654,26 @@ class importGenoWindow(QDialog):
 			if proceed == QMessageBox.StandardButton.No:
 				return
 		
+		# create summary tables for panels made before they existed
+		# this commits, so it is done before any changes are made for this import
+		ensureSummaryTables(self.cnx, self.panelComboBox.currentText())
+
+		# check for an unfinished import of this file into this panel
+		journal = importJournal(self.userInfo, self.panelComboBox.currentText(), self.inputFile.text(), 
+			"add" if self.addNewRadio.isChecked() else "update")
+		resume = False
+		if journal.previousDone > 0:
+			askBox = QMessageBox(parent=self)
+			askBox.setWindowTitle("Resume import")
+			askBox.setText("A previous import of this file into this panel stopped after %s individuals were committed. Do you want to resume from that point?" % journal.previousDone)
+			askBox.setStandardButtons(QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+			resume = askBox.exec() == QMessageBox.StandardButton.Yes
+
 		# check for duplicate inds and add inds to pedigree if needed
 		inds = getIndsFromFile(self.inputFile.text(), self.fileFormat.currentText())
-		if inds[1]:
+		# names repeat on the lines of each individual in long files, the long
+		# iterator combines them into one row per individual instead
+		if inds[1] and self.fileFormat.currentText() != "long":
 			dlgError(parent=self, message="Duplicate individual names in the input file")
 			return
 		inds = inds[0]
@@ -658,84 +684,196 @@ class importGenoWindow(QDialog):
 			dlgError(parent=self, message="You are trying to update genotypes but one or more individuals is not in the pedigree")
 			return
 		
-		retValue = addToPedigree(self.cnx, indsInPed[1], sire = None, dam = None)
-		if retValue != 0:
-			raise Exception("Internal error") 
-		
 		# check for presence of individuals in the genotype table
 		tableCheck = indsInTable(self.cnx, inds, "intDB" + self.panelComboBox.currentText() + "_gt")
-		if self.addNewRadio.isChecked() and len(tableCheck[0]) > 0:
+		# when resuming, individuals committed by the previous import are skipped
+		skipNames = set(tableCheck[0]) if resume else set()
+		if self.addNewRadio.isChecked() and len(tableCheck[0]) > 0 and not resume:
 			dlgError(parent=self, message="You are trying to add new genotypes but one or more individuals is already in the genotype table")
 			return
 		elif self.updateRadio.isChecked() and len(tableCheck[1]) > 0:
 			dlgError(parent=self, message="You are trying to update genotypes but one or more individuals is not already in the genotype table")
 			return
-		
-		# build dictionary of ind names and ind_id
-		indIDlookup = getIndIDdict(self.cnx, inds)
-
-		# build dictionary of key = locus name, 
-		# value = dict with key = genotype/allele, value of genotype/allele id
-		# OR
-		# value = tuple(ref allele, alt allele)
-		genoConvertDict = getGenoConvertDict(self.cnx, self.panelComboBox.currentText(), allLociInFile)
-		
-		# initiate iterator for selected file type
-		genoIter = self.getGenoIter()
 
-		if self.addNewRadio.isChecked():
-			# add new genotypes
-			if self.fileFormat.currentText() == "long":
-				self.addNewGenos_long(indIDlookup, genoIter)
-			else:
-				self.addNewGenos(indIDlookup, genoIter, genoConvertDict)
-		else:
-			# update existing genotypes
-			self.updateGenos(indIDlookup, genoIter)
+		# read the genotypes of the parents of the individuals for the Mendelian check
+		# only individuals already in the pedigree can have recorded parents
+		mendelian = None
+		if self.mendelianComboBox.currentIndex() > 0:
+			if not self.addNewRadio.isChecked() or self.fileFormat.currentText() == "long":
+				dlgError(parent=self, message="Mendelian checks are only available when adding new genotypes from 2col or PLINK ped files")
+				return
+			try:
+				mendelian = mendelianCheck(self.cnx, self.panelComboBox.currentText(), list(getIndIDdict(self.cnx, indsInPed[0]).values()))
+			except ValueError as e:
+				dlgError(parent=self, message=str(e))
+				return
+
+		retValue = addToPedigree(self.cnx, indsInPed[1], sire = None, dam = None)
+		if retValue != 0:
+			raise Exception("Internal error") 
+		# commit new individuals now so they are not left pending if the import fails
+		self.cnx.commit()
+
+		# individuals added to the pedigree above are removed again if they are not imported
+		# (failed QC thresholds, including those skipped when resuming, or the import stopped)
+		try:
+			# build dictionary of ind names and ind_id
+			indIDlookup = getIndIDdict(self.cnx, inds)
+
+			# initiate iterator for selected file type
+			genoIter = self.getGenoIter()
+
+			# build lookup tables to translate alleles read by the iterator into the codes stored in the BLOB
+			translator = alleleTranslator(self.cnx, self.panelComboBox.currentText(), genoIter.table)
+
+			# individuals failing QC thresholds, list of (ind name, call rate, heterozygosity)
+			self.rejectedInds = []
+			# individuals with a genotyped parent, list of (ind name, sire ind_id, dam ind_id, 
+			# counts from mendelianCheck.count, error rate, True if error rate is above the maximum)
+			self.mendelianRows = []
+			journal.start(resume)
+			try:
+				if self.addNewRadio.isChecked():
+					# add new genotypes
+					if self.fileFormat.currentText() == "long":
+						self.addNewGenos_long(indIDlookup, genoIter)
+					else:
+						self.addNewGenos(indIDlookup, genoIter, translator, journal, skipNames, mendelian)
+				else:
+					# update existing genotypes
+					self.updateGenos(indIDlookup, genoIter, translator, journal)
+			except Exception as e:
+				self.cnx.rollback()
+				journal.fail()
+				msgTxt = "Genotype import stopped with an error (%s). " % e
+				msgTxt += "%s individuals were committed. Import the same file again to resume from that point." % journal.nDone
+				dlgError(parent=self, message=msgTxt)
+				return
+		finally:
+			removeIndsNotInTable(self.cnx, "intDB" + self.panelComboBox.currentText() + "_gt",
+				list(getIndIDdict(self.cnx, indsInPed[1]).values()))
+			self.cnx.commit()
+		journal.finish()
 		
 		messageBox = QMessageBox(parent=self)
 		messageBox.setWindowTitle("Genotype import")
-		messageBox.setText("Genotype import complete")
+		msgTxt = "Genotype import complete"
+		if len(self.rejectedInds) > 0:
+			with open(self.inputFile.text() + "_rejectedReport.txt", "w") as fout:
+				fout.write("ind\tcallRate\theterozygosity\n") # write header line
+				for x in self.rejectedInds:
+					fout.write("\t".join([str(y) for y in x]) + "\n")
+			msgTxt += ". %s individuals failed QC thresholds and were not imported, see %s" % (len(self.rejectedInds), self.inputFile.text() + "_rejectedReport.txt")
+		if mendelian is not None:
+			names = getIndNames(self.cnx, [y for x in self.mendelianRows for y in x[1:3] if y is not None])
+			with open(self.inputFile.text() + "_mendelianReport.txt", "w") as fout:
+				fout.write("ind\tsire\tdam\tsireErrors\tsireCompared\tdamErrors\tdamCompared\ttrioErrors\ttrioCompared\terrorRate\texceedsMax\n")
+				for x in self.mendelianRows:
+					fout.write("\t".join([str(y) for y in [x[0], names.get(x[1], "NA"), names.get(x[2], "NA")] + list(x[3:])]) + "\n")
+			nFailed = len([x for x in self.mendelianRows if x[-1]])
+			msgTxt += ". %s individuals were checked against their parents and %s had a Mendelian error rate above the maximum" % (len(self.mendelianRows), nFailed)
+			if nFailed > 0 and self.mendelianComboBox.currentIndex() == 2:
+				msgTxt += " and were not imported"
+			msgTxt += ", see %s" % (self.inputFile.text() + "_mendelianReport.txt")
+		messageBox.setText(msgTxt)
 		messageBox.exec()
 		self.close()
 	
 	# add new genotypes
-	def addNewGenos(self, indIDlookup, genoIter, genoConvertDict):
-		# get order that loci need to be in - returns tuple of locus names in order
-		locusOrder = getLocusOrderInBlob(self.cnx, self.panelComboBox.currentText())
-		with self.cnx.cursor() as curs:
-			sqlState = "INSERT INTO `intDB" + self.panelComboBox.currentText() + "_gt` (ind_id, genotypes) VALUES "
-			# for each individual, convert input to database representation, and add to database
-			for g in genoIter:
-				if self.panelTypeLabel.text() == "Biallelic":
-					# note that if memory becomes limiting, this can be done in a stream, converting to hex in chunks
-					binaryFormatString = "0%sb" % numBits(2, self.panelPloidy)
-					# convert to number of alt copies (missing is ploidy + 1) and binary (e.g. "01")
-					altCopies = [format(genoToAltCopies(g.genoDict[lname], genoConvertDict[lname]), binaryFormatString) for lname in locusOrder]
-					# join together into one long string
-					altCopies = "".join(altCopies)
-					# pad with zeros on the end to make complete bytes
-					altCopies += "0" * (8 - (len(altCopies) % 8))
-					# convert to hex string 4 digits at a time to make sure we keep all 0s
-					# and prevent any issues with large numbers
-					hexString = "".join([format(int(altCopies[x:(x+4)], 2), "01x") for x in range(0, len(altCopies), 4)])
-					del altCopies # save some memory
-				else:
-					if self.panelTypeLabel.text() == "Multiallelic":
-						# convert the sorted genotype tuple into an integer < 256
-						blobInts = [genoConvertDict[lname][g.genoDict[lname]] for lname in locusOrder]
-					else:
-						# Hyperallelic
-						# convert the alleles into integers < 256
-						blobInts = [genoConvertDict[lname][g.genoDict[lname][x]] for lname in locusOrder for x in range(0, self.panelPloidy)]
-					# convert ints into hex
-					hexString = "".join([format(x, "02x") for x in blobInts])
-					del blobInts # save a bit of memory for large panels
-				# add to database
-				curs.execute(sqlState + "(%s,X'%s')" % (indIDlookup[g.indName], hexString))
-		
-		# commit transaction after all individuals successfully added
+	# runs as a pipeline: the file is read in this thread while other threads
+	# encode batches and write them to the database
+	# batches are written on writerSpinbox connections at once (see importPipeline.writerPool)
+	# commits every commitEvery individuals and records progress in the journal
+	# individuals in skipNames are already in the table from a previous, unfinished import
+	# mendelian : optional mendelianCheck, individuals with a genotyped parent are checked in the
+	#   encoder stage and, if "Reject Mendelian errors" is chosen, not written if they fail
+	def addNewGenos(self, indIDlookup, genoIter, translator, journal, skipNames = set(), mendelian = None):
+		panelName = self.panelComboBox.currentText()
+		panelType = self.panelTypeLabel.text()
+		ploidy = self.panelPloidy
+		# per-locus summaries are updated from the same codes that are written to the BLOB
+		summary = locusSummary(self.cnx, panelName)
+		# read widget values here b/c the pipeline stages run in other threads
+		minCallRate = self.minCallRateSpinbox.value()
+		maxHet = self.maxHetSpinbox.value()
+		maxMendelian = self.maxMendelianSpinbox.value()
+		rejectMendelian = self.mendelianComboBox.currentIndex() == 2
+
+		commitEvery = self.commitEverySpinbox.value()
+
+		# encoder stage: translate a batch into codes, apply QC, and pack BLOBs
+		def encode(batch):
+			nBatch = len(batch)
+			if len(skipNames) > 0:
+				batch = batch.subset(~np.isin(batch.names, list(skipNames)))
+			if len(batch) == 0:
+				return (None, [], nBatch, [])
+			codes = translator.toCodes(batch)[0]
+			called, het = summary.calledHet(codes)
+			keep, callRate, obsHet = individualQC.passes(called, het, minCallRate, maxHet)
+			rejected = [(batch.names[i], callRate[i], obsHet[i]) for i in np.nonzero(~keep)[0]]
+			mendelianRows = []
+			if mendelian is not None:
+				# check individuals passing QC
+				kept = np.nonzero(keep)[0]
+				keptIDs = [indIDlookup[batch.names[i]] for i in kept]
+				res = mendelian.count(keptIDs, codes[kept])
+				rate = mendelianCheck.errorRate(res)
+				failed = res["checked"] & (rate > maxMendelian)
+				for k in np.nonzero(res["checked"])[0]:
+					mendelianRows += [(batch.names[kept[k]],) + mendelian.parents.get(keptIDs[k], (None, None)) + 
+						tuple(int(res[x][k]) for x in mendelian.statNames) + (rate[k], bool(failed[k]))]
+				if rejectMendelian:
+					keep[kept[failed]] = False
+			indIDs = [indIDlookup[batch.names[i]] for i in np.nonzero(keep)[0]]
+			codes = codes[keep]
+			if len(indIDs) == 0:
+				return (None, rejected, nBatch, mendelianRows)
+			return ((indIDs, codes, called[keep], het[keep], codesToBlobs(codes, panelType, ploidy)), rejected, nBatch, mendelianRows)
+
+		# one connection per writer, the first writer uses this window's connection
+		connections = [self.cnx] + [getConnection(self.userInfo) for i in range(1, self.writerSpinbox.value())]
+		pool = writerPool([genotypeInserter(x, panelName) for x in connections])
+		# number of individuals read from the file and committed
+		nRead = journal.nDone
+		nCommitted = journal.nDone
+		# writer stage: hand the batch to the writers
+		def write(encoded):
+			nonlocal nRead, nCommitted
+			toWrite, rejected, nBatch, mendelianRows = encoded
+			self.rejectedInds += rejected
+			self.mendelianRows += mendelianRows
+			if toWrite is not None:
+				pool.write(toWrite)
+			nRead += nBatch
+			if commitEvery > 0 and nRead - nCommitted >= commitEvery:
+				pool.commit()
+				journal.checkpoint(nRead)
+				nCommitted = nRead
+
+		try:
+			pipeline = importPipeline(encode, write, nEncoders = self.encoderSpinbox.value())
+			pipeline.run(readBatches(genoIter, self.batchSizeSpinbox.value(), skip = journal.nDone))
+			# commit after all individuals successfully added
+			pool.commit()
+			journal.checkpoint(nRead)
+			pool.close()
+		except BaseException:
+			pool.close(abort = True)
+			pool.rollback()
+			raise
+		finally:
+			for w in pool.writers:
+				w.close()
+			for x in connections[1:]:
+				x.close()
+	
+	# write summaries, commit, and record in the journal that the first nDone individuals are committed
+	def commitCheckpoint(self, curs, summary, indQC, journal, nDone):
+		summary.flush(curs)
+		indQC.flush(curs)
 		self.cnx.commit()
+		journal.checkpoint(nDone)
 	
 	def addNewGenos_long(self, indIDlookup, genoIter, genoConvertDict):
 		# get a tuple of locus names in order
@@ -822,42 +960,56 @@ class importGenoWindow(QDialog):
 
 
 	## TODO test long format adding new genotype (function above) and then continue here
-	# left off chagning to work with new blob and adding long format here
-	def updateGenos(self, indIDlookup, genoIter):
-		# overwrite existing genotypes
+	# overwrite existing genotypes
+	# loci that are not in the input file keep the genotypes already stored
+	# runs as a pipeline like addNewGenos, with the stored genotypes read by the writer
+	def updateGenos(self, indIDlookup, genoIter, translator, journal):
+		panelName = self.panelComboBox.currentText()
+		panelType = self.panelTypeLabel.text()
+		ploidy = self.panelPloidy
+		nLoci = len(translator.locusPos)
+		summary = locusSummary(self.cnx, panelName)
+		indQC = individualQC(panelName)
+		minCallRate = self.minCallRateSpinbox.value()
+		maxHet = self.maxHetSpinbox.value()
+		commitEvery = self.commitEverySpinbox.value()
+
+		# encoder stage: translate a batch into codes
+		# also returns which codes came from the file (the rest keep the stored genotypes)
+		def encode(batch):
+			codes, inFile = translator.toCodes(batch)
+			return (batch.names, [indIDlookup[x] for x in batch.names], codes, inFile)
+
+		nRead = journal.nDone
+		nCommitted = journal.nDone
 		with self.cnx.cursor() as curs:
-			sqlState = "UPDATE `intDB%s_gt` SET " % self.panelComboBox.currentText()
-			# the big list comprehensions here are a bit of a pain to read, but they are expected to run much faster than when split into for loops 
-			if self.panelTypeLabel.text() == "Multiallelic":
-				# list in order of genoIter.loci, values are dict[(allele_1,allele_2,...)] = genotype_id
-				genoListDict = getGenoDict_multi(self.cnx, self.panelComboBox.currentText(), genoIter.loci, self.panelPloidy)
-				for g in genoIter:
-					# change alleles to genotype codes
-					# have to sort alleles and then convert to tuple (b/c lists aren't hashable) for lookup
-					# then convert to str for the next line
-					genoIDs = [str(genoListDict[i // self.panelPloidy][tuple(sorted(g[1][i:(i+self.panelPloidy)]))]) for i in range(0, len(g[1]), self.panelPloidy)]
-					# build long SET section of the statement
-					# add WHERE statement (VERY important, otherwise all rows are overwritten)
-					# update table
-					curs.execute(sqlState + ",".join(["`" + genoIter.loci[i] + "`" + "=" + genoIDs[i] for i in range(0, len(genoIDs))]) + (" WHERE ind_id = %s" % indIDlookup[g[0]]))
-			elif self.panelTypeLabel.text() == "Hyperallelic":
-				# list in order of genoIter.loci
-				alleleListDict = getAlleleDict_hyper(self.cnx, self.panelComboBox.currentText(), genoIter.loci, self.panelPloidy)
-				setState = ["`{0}_a%s`=" % i for i in range(1, self.panelPloidy + 1)]
-				setState = [x.format(locus) for locus in genoIter.loci for x in setState]
-				for g in genoIter:
-					# change alleles to allele codes
-					# convert to str for the next line
-					# list comprehension equivalent to nested for loop for i in: for j in: list += [allele[i//ploidy][g[1][i+j]]]
-					alleleIDs = [str(alleleListDict[i // self.panelPloidy][g[1][i + j]]) for i in range(0, len(g[1]), self.panelPloidy) for j in range(0, self.panelPloidy) ]
-					curs.execute(sqlState + ",".join([setState[i] + alleleIDs[i] for i in range(0, len(alleleIDs))]) + (" WHERE ind_id = %s" % indIDlookup[g[0]]))
-			else:
-				# biallelic
-				# list in order of genoIter.loci, values are tuple (refAllele, altAllele)
-				refAltLookup = getRefAlt(self.cnx, self.panelComboBox.currentText(), genoIter.loci)
-				# generate format string with matching number of binary digits
-				binaryFormatString = "0%sb" % numBits(2, self.panelPloidy)
-				for g in genoIter:
-					# change genotypes to bit code
-					genoBitCodes = ["b'" + format(genoToAltCopies(g[1][i:(i+self.panelPloidy)], refAltLookup[i // self.panelPloidy]), binaryFormatString) + "'" for i in range(0, len(g[1]), self.panelPloidy)]
-					curs.execute(sqlState + ",".join(["`" + genoIter.loci[i] + "`" + "=" + genoBitCodes[i] for i in range(0, len(genoBitCodes))]) + (" WHERE ind_id = %s" % indIDlookup[g[0]]))
+			sqlSelect = "SELECT ind_id, genotypes FROM `intDB%s_gt` WHERE ind_id IN (%%s)" % panelName
+			sqlUpdate = "UPDATE `intDB%s_gt` SET genotypes = %%s WHERE ind_id = %%s" % panelName
+			# writer stage: merge with stored genotypes, apply QC, and update summaries and the database
+			def write(encoded):
+				nonlocal nRead, nCommitted
+				names, indIDs, codes, inFile = encoded
+				nRead += len(names)
+				curs.execute(sqlSelect % ",".join(["%s"] * len(indIDs)), indIDs)
+				oldBlobs = {x[0] : x[1] for x in curs}
+				oldCodes = blobsToCodes([oldBlobs[x] for x in indIDs], panelType, ploidy, nLoci)
+				codes = np.where(inFile, codes, oldCodes)
+				called, het = summary.calledHet(codes)
+				keep, callRate, obsHet = individualQC.passes(called, het, minCallRate, maxHet)
+				self.rejectedInds += [(names[i], callRate[i], obsHet[i]) for i in np.nonzero(~keep)[0]]
+				if keep.any():
+					indIDs = [indIDs[i] for i in np.nonzero(keep)[0]]
+					codes = codes[keep]
+					# remove the old genotypes from the summaries and add the new ones
+					summary.add(oldCodes[keep], sign = -1)
+					summary.add(codes, calledHet = (called[keep], het[keep]))
+					indQC.add(indIDs, called[keep], het[keep])
+					curs.executemany(sqlUpdate, list(zip(codesToBlobs(codes, panelType, ploidy), indIDs)))
+				if commitEvery > 0 and nRead - nCommitted >= commitEvery:
+					self.commitCheckpoint(curs, summary, indQC, journal, nRead)
+					nCommitted = nRead
+
+			pipeline = importPipeline(encode, write, nEncoders = self.encoderSpinbox.value())
+			pipeline.run(readBatches(genoIter, self.batchSizeSpinbox.value(), skip = journal.nDone))
+			# commit transaction after all individuals successfully updated
+			self.commitCheckpoint(curs, summary, indQC, journal, nRead)
@@ -0,0 +1,68 @@
+# journal of genotype import progress
+# imports commit every N individuals and record how many individuals from the start
+# of the input file are committed in the import_journal table of the local gui database
+# a failed import of the same file into the same panel can then resume after the last checkpoint
+# the journal is opened for each change so that it can be written from the pipeline writer thread
+
+import os
+import hashlib
+from datetime import datetime
+from .utils import getGuiDB
+from . import PACKAGEDIR
+
+# identify a file by its size and a hash of its first and last MiB
+# this is cheap for very large files and changes if the file is replaced or edited
+def fileFingerprint(fileName : str) -> str:
+	size = os.path.getsize(fileName)
+	h = hashlib.sha1(str(size).encode())
+	with open(fileName, "rb") as f:
+		h.update(f.read(1048576))
+		if size > 1048576:
+			f.seek(max(1048576, size - 1048576))
+			h.update(f.read())
+	return h.hexdigest()
+
+# open the gui database with the journal table present
+def getJournalDB():
+	gui_db = getGuiDB()
+	with open(os.path.join(PACKAGEDIR, "sql/import_journal.sql"), mode="r", encoding = "utf-8") as f:
+		gui_db.executescript(f.read())
+	return gui_db
+
+class importJournal:
+	# userInfo : connection information (host and db are used)
+	# mode : "add" or "update"
+	def __init__(self, userInfo : dict, panelName : str, fileName : str, mode : str):
+		self.key = (userInfo["host"], userInfo["db"], panelName, fileFingerprint(fileName), mode)
+		self.fileName = fileName
+		gui_db = getJournalDB()
+		curs = gui_db.execute("""SELECT n_done FROM import_journal WHERE host = ? AND db_name = ? 
+			AND panel_name = ? AND fingerprint = ? AND import_mode = ? AND status != 'complete'""", self.key)
+		# number of individuals committed by an unfinished previous import, 0 if none
+		self.previousDone = next(curs, [0])[0]
+		curs.close()
+		gui_db.close()
+		self.nDone = 0
+
+	# start (resume = False) or resume (resume = True) the import
+	def start(self, resume : bool):
+		self.nDone = self.previousDone if resume else 0
+		self.write("running")
+
+	# record that the first nDone individuals in the file are committed
+	def checkpoint(self, nDone : int):
+		self.nDone = nDone
+		self.write("running")
+
+	def fail(self):
+		self.write("failed")
+
+	def finish(self):
+		self.write("complete")
+
+	def write(self, status : str):
+		gui_db = getJournalDB()
+		gui_db.execute("REPLACE INTO import_journal VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+			self.key + (self.fileName, self.nDone, status, datetime.now().isoformat(timespec="seconds")))
+		gui_db.commit()
+		gui_db.close()
@@ -0,0 +1,249 @@
+# pipelined genotype import
+# reading the input file, encoding genotypes, and writing to the database
+# run as separate stages connected by bounded queues so that they overlap
+#   reader: runs in the calling thread and puts batches of individuals on the encode queue
+#     (the genotype iterators may open error dialogs, which must stay in the GUI thread)
+#   encoders: worker threads that convert batches into codes and BLOBs
+#   writer: one thread that executes the SQL for each batch, in the order read from the file
+# threads are used rather than processes b/c numpy and the MySQL connector release the GIL
+# for much of their work and the lookup dictionaries would otherwise have to be pickled
+# queues are bounded so memory use stays at a few batches no matter the file size
+# the writer can hand batches to a writerPool, which inserts them on several connections
+# at once so that more than one server thread does the inserts
+
+import threading
+import queue
+import numpy as np
+import mysql.connector as connector
+from .genotypeSummaries import locusSummary, individualQC
+
+# sentinel marking the end of a stage's input
+_DONE = object()
+
+# generator of genoBatch objects with up to batchSize individuals from a genotype iterator
+# skip: number of individuals at the start of the file to skip (e.g., when resuming an import)
+def readBatches(genoIter, batchSize : int, skip : int = 0):
+	for batch in genoIter.batches(batchSize):
+		if skip >= len(batch):
+			skip -= len(batch)
+			continue
+		if skip > 0:
+			batch = batch.subset(np.arange(skip, len(batch)))
+			skip = 0
+		yield batch
+
+class importPipeline:
+	# encodeFunc: called in an encoder thread with a batch, returns the encoded batch
+	# writeFunc: called in the writer thread with each encoded batch, in input order
+	# nEncoders: number of encoder threads
+	# queueSize: maximum number of batches waiting between stages
+	def __init__(self, encodeFunc, writeFunc, nEncoders : int = 2, queueSize : int = 4):
+		self.encodeFunc = encodeFunc
+		self.writeFunc = writeFunc
+		self.nEncoders = max(1, nEncoders)
+		self.encodeQueue = queue.Queue(maxsize=queueSize)
+		self.writeQueue = queue.Queue(maxsize=queueSize)
+		self.error = None
+		self.stop = threading.Event()
+
+	# record the first error from any stage and tell all stages to stop
+	def fail(self, e):
+		if self.error is None:
+			self.error = e
+		self.stop.set()
+
+	# put that gives up if another stage has failed
+	# returns True if the item was added to the queue
+	def put(self, q, item) -> bool:
+		while not self.stop.is_set():
+			try:
+				q.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	# get that gives up if another stage has failed
+	# returns (True, item) or (False, None) if stopped
+	def get(self, q):
+		while not self.stop.is_set():
+			try:
+				return (True, q.get(timeout=0.1))
+			except queue.Empty:
+				pass
+		return (False, None)
+
+	def encoder(self):
+		try:
+			while True:
+				ok, item = self.get(self.encodeQueue)
+				if not ok or item is _DONE:
+					break
+				seq, batch = item
+				if not self.put(self.writeQueue, (seq, self.encodeFunc(batch))):
+					break
+		except BaseException as e:
+			self.fail(e)
+		self.put(self.writeQueue, _DONE)
+
+	def writer(self):
+		try:
+			# encoders can finish out of order, so hold batches until their turn
+			pending = {}
+			nextSeq = 0
+			nDone = 0
+			while nDone < self.nEncoders:
+				ok, item = self.get(self.writeQueue)
+				if not ok:
+					return
+				if item is _DONE:
+					nDone += 1
+					continue
+				pending[item[0]] = item[1]
+				while nextSeq in pending:
+					self.writeFunc(pending.pop(nextSeq))
+					nextSeq += 1
+		except BaseException as e:
+			self.fail(e)
+
+	# run all batches through the pipeline, returns when all have been written
+	# re-raises the first error from any stage
+	def run(self, batches):
+		threads = [threading.Thread(target=self.encoder, daemon=True) for i in range(0, self.nEncoders)]
+		threads += [threading.Thread(target=self.writer, daemon=True)]
+		for t in threads:
+			t.start()
+		try:
+			seq = 0
+			for batch in batches:
+				if not self.put(self.encodeQueue, (seq, batch)):
+					break
+				seq += 1
+		except BaseException as e:
+			self.fail(e)
+		for i in range(0, self.nEncoders):
+			self.put(self.encodeQueue, _DONE)
+		for t in threads:
+			t.join()
+		if self.error is not None:
+			raise self.error
+
+# inserts new genotypes of a panel on one connection
+# summaries of the individuals inserted are kept per connection and written in the
+# same transaction as their genotypes, so each commit is consistent on its own
+class genotypeInserter:
+	def __init__(self, cnx : connector, panelName : str):
+		self.cnx = cnx
+		self.curs = cnx.cursor()
+		self.summary = locusSummary(cnx, panelName)
+		self.indQC = individualQC(panelName)
+		self.sqlState = "INSERT INTO `intDB%s_gt` (ind_id, genotypes) VALUES (%%s, %%s)" % panelName
+
+	# encoded : (list of ind_id, codes, called, het, list of BLOBs)
+	def write(self, encoded):
+		indIDs, codes, called, het, blobs = encoded
+		self.summary.add(codes, calledHet = (called, het))
+		self.indQC.add(indIDs, called, het)
+		self.curs.executemany(self.sqlState, list(zip(indIDs, blobs)))
+
+	def commit(self):
+		self.summary.flush(self.curs)
+		self.indQC.flush(self.curs)
+		self.cnx.commit()
+
+	def rollback(self):
+		self.summary.reset()
+		self.indQC.rows = []
+		self.cnx.rollback()
+
+	def close(self):
+		self.curs.close()
+
+# runs writers (e.g., genotypeInserter), each with its own connection, in their own threads
+# batches are handed to the writers in turn, so each connection inserts its own disjoint batches
+# commit() is a checkpoint: it waits until every writer has written all batches handed to
+# it so far, then commits each writer in turn (one at a time, b/c they update the same
+# summary rows). If an error happens part way through the commits, the individuals written
+# by the writers that committed stay in the database, so the import should be resumable
+# (see importJournal) rather than relying on one transaction
+class writerPool:
+	# writers : objects with write(item), commit(), and rollback() methods
+	# queueSize : maximum number of batches waiting for each writer
+	def __init__(self, writers : list, queueSize : int = 2):
+		self.writers = writers
+		self.queues = [queue.Queue(maxsize=queueSize) for w in writers]
+		self.error = None
+		self.stop = threading.Event()
+		self.next = 0
+		self.threads = [threading.Thread(target=self.run, args=(i,), daemon=True) for i in range(0, len(writers))]
+		for t in self.threads:
+			t.start()
+
+	# record the first error from any writer and tell all writers to stop
+	def fail(self, e):
+		if self.error is None:
+			self.error = e
+		self.stop.set()
+
+	# re-raise the first error from any writer
+	def check(self):
+		if self.error is not None:
+			raise self.error
+		if self.stop.is_set():
+			raise RuntimeError("Writers were stopped")
+
+	def run(self, i):
+		try:
+			while not self.stop.is_set():
+				try:
+					item = self.queues[i].get(timeout=0.1)
+				except queue.Empty:
+					continue
+				if item is _DONE:
+					break
+				if isinstance(item, threading.Event):
+					# commit request
+					self.writers[i].commit()
+					item.set()
+				else:
+					self.writers[i].write(item)
+		except BaseException as e:
+			self.fail(e)
+
+	def put(self, i, item):
+		while True:
+			self.check()
+			try:
+				self.queues[i].put(item, timeout=0.1)
+				return
+			except queue.Full:
+				pass
+
+	# hand an item to the next writer
+	def write(self, item):
+		self.put(self.next, item)
+		self.next = (self.next + 1) % len(self.writers)
+
+	# wait for all writers to finish the items handed to them, then commit each writer
+	def commit(self):
+		for i in range(0, len(self.writers)):
+			done = threading.Event()
+			self.put(i, done)
+			while not done.wait(timeout=0.1):
+				self.check()
+
+	# stop the writer threads
+	# abort : stop without waiting for the items already handed to the writers
+	def close(self, abort : bool = False):
+		if abort:
+			self.stop.set()
+		else:
+			for i in range(0, len(self.writers)):
+				self.put(i, _DONE)
+		for t in self.threads:
+			t.join()
+
+	# roll back uncommitted items of all writers, call after close()
+	def rollback(self):
+		for w in self.writers:
+			w.rollback()
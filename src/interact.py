@@ -3,7 +3,7 @@
 from PyQt6.QtCore import QSize, Qt
 from PyQt6.QtGui import QAction
 from PyQt6.QtWidgets import (
-	QMainWindow, QPushButton, QLabel, QLineEdit, QComboBox, 
+	QApplication, QMainWindow, QPushButton, QLabel, QLineEdit, QComboBox, 
 	 QGridLayout, QWidget, QCheckBox, QToolBar, QInputDialog,
 	 QFileDialog, QMessageBox
 )
@@ -12,10 +12,24 @@ import sys
 import mysql.connector as connector
 import sqlite3
 from .login import loginDialog
-from .utils import dlgError, saveInfo, identifier_syntax_check, getConnection, removePartialPanel
+from .utils import dlgError, saveInfo, identifier_syntax_check, getConnection, removePartialPanel, getPanelInfo, getIndIDdict, getIndNames
 from . import PACKAGEDIR
 from .newPanelWindow import newPanelWindow
+from .newPhenoTableWindow import newPhenoTableWindow
 from .importGenoWindow import importGenoWindow
+from .genotypeSummaries import writeLocusSummary
+from .appendLoci import appendLoci
+from .panelMigration import migratePanel, readLocusList, CONVERSIONS
+from .duplicateDetection import findDuplicates, writeDuplicateReport
+from .parentage import assignParents, getPedigreeParents, writeParentage, writeParentageReport
+from .relationshipMatrix import computeGRM
+from .pedigreeGraph import loadPedigree, writeInbreedingReport
+from .phenotypeTables import getPhenoTables, loadPhenotypes, exportPhenoTable
+from .compressedInput import openInputFile
+from .datasetBuilder import writeDataset
+from .geneticGroups import getGroupings, createGrouping, writeGroupFrequencies
+from .parquetExport import writeParquet
+from .rowVersions import addRowVersions, getWatermark, readWatermark, writeWatermark, exportPedigree
 
 
 class interactWindow(QMainWindow):
@@ -44,7 +58,83 @@ class interactWindow(QMainWindow):
 		removeEmptyPanel_button.setStatusTip("This can remove a genotype panel that does not have any genotypes in it")
 		removeEmptyPanel_button.triggered.connect(self.removeEmptyPanel)
 		
-		actionMenu.addActions([makeDB_button, switchDB_button, makePanel_button, removeEmptyPanel_button])
+		# write per-locus summary of a panel
+		locusSummary_button = QAction("Write locus summary report", self)
+		locusSummary_button.setStatusTip("This writes call rate, heterozygosity, and allele counts for each locus in a panel")
+		locusSummary_button.triggered.connect(self.locusSummaryReport)
+		
+		# add loci to an existing genotyping panel
+		appendLoci_button = QAction("Add loci to a genotype panel", self)
+		appendLoci_button.setStatusTip("This adds loci from a panel definition file to the end of an existing genotype panel")
+		appendLoci_button.triggered.connect(self.appendLociToPanel)
+		
+		# make a new panel from an existing panel
+		migratePanel_button = QAction("Subset or convert a genotype panel", self)
+		migratePanel_button.setStatusTip("This makes a new genotype panel from a selection of loci of an existing panel, optionally in a different panel type")
+		migratePanel_button.triggered.connect(self.migratePanel)
+		
+		# find duplicate individuals in a panel
+		duplicates_button = QAction("Find duplicate individuals", self)
+		duplicates_button.setStatusTip("This writes pairs of individuals in a genotype panel with nearly identical genotypes")
+		duplicates_button.triggered.connect(self.duplicateReport)
+		
+		# assign parents with genotypes
+		parentage_button = QAction("Assign parents from genotypes", self)
+		parentage_button.setStatusTip("This finds the sire and dam of individuals among candidate parents by counting Mendelian exclusions")
+		parentage_button.triggered.connect(self.parentageAssignment)
+		
+		# genomic relationship matrix
+		grm_button = QAction("Genomic relationship matrix", self)
+		grm_button.setStatusTip("This writes the genomic relationship matrix of all individuals in a genotype panel to a binary file")
+		grm_button.triggered.connect(self.relationshipMatrix)
+		
+		# inbreeding coefficients from the pedigree
+		inbreeding_button = QAction("Pedigree inbreeding coefficients", self)
+		inbreeding_button.setStatusTip("This writes the inbreeding coefficient of every individual in the pedigree")
+		inbreeding_button.triggered.connect(self.inbreedingReport)
+		
+		# phenotype tables
+		makePhenoTable_button = QAction("Make a new phenotype table", self)
+		makePhenoTable_button.setStatusTip("This makes a new phenotype table from a phenotype file")
+		makePhenoTable_button.triggered.connect(self.makePhenoTable)
+		loadPheno_button = QAction("Add individuals to a phenotype table", self)
+		loadPheno_button.setStatusTip("This adds the individuals in a phenotype file to an existing phenotype table")
+		loadPheno_button.triggered.connect(self.loadPhenoTable)
+		exportPheno_button = QAction("Export a phenotype table", self)
+		exportPheno_button.setStatusTip("This writes a phenotype table to a tab delimited file")
+		exportPheno_button.triggered.connect(self.exportPhenoTable)
+		
+		# joined pedigree, phenotype, and genotype dataset
+		dataset_button = QAction("Export an analysis dataset", self)
+		dataset_button.setStatusTip("This writes the pedigree, phenotypes, and genotypes of the individuals in a genotype panel to one file")
+		dataset_button.triggered.connect(self.exportDataset)
+		
+		# genetic groups
+		makeGrouping_button = QAction("Make a new genetic grouping", self)
+		makeGrouping_button.setStatusTip("This assigns individuals to genetic groups (e.g., hatchery stocks) from a tab delimited file")
+		makeGrouping_button.triggered.connect(self.makeGrouping)
+		groupFreq_button = QAction("Write allele frequencies by genetic group", self)
+		groupFreq_button.setStatusTip("This writes the allele frequencies and missingness of each genetic group for a genotype panel")
+		groupFreq_button.triggered.connect(self.groupFrequencyReport)
+		
+		# columnar export of genotypes
+		parquet_button = QAction("Export genotypes to Parquet", self)
+		parquet_button.setStatusTip("This writes the genotypes of a genotype panel to a directory of Parquet files (requires pyarrow)")
+		parquet_button.triggered.connect(self.exportParquet)
+		
+		# row versioning and incremental exports
+		rowVersions_button = QAction("Enable row versioning", self)
+		rowVersions_button.setStatusTip("This adds modification times to the pedigree, genotype, phenotype, and grouping tables of older databases")
+		rowVersions_button.triggered.connect(self.enableRowVersions)
+		deltaExport_button = QAction("Export changes since last export", self)
+		deltaExport_button.setStatusTip("This writes only the rows changed since a watermark (saved with each export)")
+		deltaExport_button.triggered.connect(self.exportChanges)
+		
+		actionMenu.addActions([makeDB_button, switchDB_button, makePanel_button, removeEmptyPanel_button, locusSummary_button,
+			appendLoci_button, migratePanel_button, duplicates_button, parentage_button, grm_button,
+			inbreeding_button, makePhenoTable_button, loadPheno_button, exportPheno_button,
+			dataset_button, makeGrouping_button, groupFreq_button, parquet_button, rowVersions_button,
+			deltaExport_button])
 
 		# define widgets
 		loginToServerButton = QPushButton("Login to server") # login button
@@ -184,6 +274,14 @@ class interactWindow(QMainWindow):
 		self.npWindow = newPanelWindow(cnx = self.cnx, userInfo = self.userInfo)
 		self.npWindow.exec()
 	
+	def makePhenoTable(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		# open the make a new phenotype table window
+		self.nptWindow = newPhenoTableWindow(cnx = self.cnx, userInfo = self.userInfo)
+		self.nptWindow.exec()
+	
 	# remove a partial or full panel with no genotypes, if it exists
 	def removeEmptyPanel(self):
 		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
@@ -211,3 +309,442 @@ class interactWindow(QMainWindow):
 		self.igWindow = importGenoWindow(cnx = self.cnx, userInfo = self.userInfo)
 		self.igWindow.exec()
 	
+
+	# ask the user to choose a genotype panel
+	# returns the panel name or None if cancelled
+	def choosePanel(self, title : str):
+		with self.cnx.cursor() as curs:
+			curs.execute("SELECT panel_name FROM intDBgeno_overview")
+			panels = [x[0] for x in curs]
+		if len(panels) == 0:
+			dlgError(parent=self, message="No genotype panels are defined in the database")
+			return None
+		panel = QInputDialog.getItem(self, title, "Panel name:", panels, editable=False)
+		if panel[1]:
+			return panel[0]
+		return None
+
+	# select a phenotype table
+	# returns table name or None if no table is selected
+	def choosePhenoTable(self, title : str):
+		tables = getPhenoTables(self.cnx)
+		if len(tables) == 0:
+			dlgError(parent=self, message="No phenotype tables are defined in the database")
+			return None
+		table = QInputDialog.getItem(self, title, "Phenotype table:", tables, editable=False)
+		if table[1]:
+			return table[0]
+		return None
+
+	# write per-locus summary report from the locus summary tables
+	def locusSummaryReport(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Locus summary report")
+		if panel is None:
+			return
+		fileName = QFileDialog.getSaveFileName(self, "Save locus summary report", "/home/")[0]
+		if fileName == "":
+			return
+		writeLocusSummary(self.cnx, panel, fileName)
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Locus summary report")
+		msgBox.setText("Locus summary report written")
+		msgBox.exec()
+
+	# add loci from a panel definition file to an existing panel
+	# the file must have the same columns, in the same order, as the file used to make the panel
+	def appendLociToPanel(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Add loci to a panel")
+		if panel is None:
+			return
+		fileName = QFileDialog.getOpenFileName(self, "Open panel definition file", "/home/")[0]
+		if fileName == "":
+			return
+		try:
+			nAdded = appendLoci(self.cnx, self.userInfo, panel, fileName)
+		except (ValueError, RuntimeError, connector.Error) as e:
+			dlgError(parent=self, message="Loci were not added: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Add loci to a panel")
+		msgBox.setText("%s loci added to %s" % (nAdded, panel))
+		msgBox.exec()
+
+	# make a new panel from a selection of loci of an existing panel, optionally converting the panel type
+	def migratePanel(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Subset or convert a panel")
+		if panel is None:
+			return
+		newPanel = QInputDialog.getText(self, "Subset or convert a panel", "New panel name:")
+		if not newPanel[1] or newPanel[0] == "":
+			return
+		newPanel = newPanel[0]
+		panelType = getPanelInfo(self.cnx, panel)[0]
+		newType = QInputDialog.getItem(self, "Subset or convert a panel", "New panel type:", [panelType] + list(CONVERSIONS[panelType]), editable=False)
+		if not newType[1]:
+			return
+		newType = newType[0]
+		# file with one locus name per line, all loci are kept if no file is chosen
+		lociFile = QFileDialog.getOpenFileName(self, "Open file of loci to keep (cancel to keep all loci)", "/home/")[0]
+		loci = None
+		try:
+			if lociFile != "":
+				loci = readLocusList(lociFile)
+			# report throughput while migrating
+			def progress(nInds, rate):
+				self.statusBar().showMessage("%s individuals migrated (%.0f individuals/s)" % (nInds, rate))
+				QApplication.processEvents()
+			nLoci, nInds, seconds = migratePanel(self.cnx, self.userInfo, panel, newPanel, loci, newType,
+				description="Made from panel %s" % panel, progress=progress)
+		except (ValueError, RuntimeError, connector.Error) as e:
+			self.statusBar().clearMessage()
+			dlgError(parent=self, message="Panel was not made: %s" % e)
+			return
+		self.statusBar().clearMessage()
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Subset or convert a panel")
+		msgBox.setText("Panel %s made with %s loci and %s individuals in %.1f seconds" % (newPanel, nLoci, nInds, seconds))
+		msgBox.exec()
+
+	# write pairs of individuals with nearly identical genotypes in a panel
+	def duplicateReport(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Find duplicate individuals")
+		if panel is None:
+			return
+		maxDiscordance = QInputDialog.getDouble(self, "Find duplicate individuals", "Maximum proportion of loci with different genotypes:",
+			value=0.01, min=0, max=1, decimals=4)
+		if not maxDiscordance[1]:
+			return
+		fileName = QFileDialog.getSaveFileName(self, "Save duplicate individual report", "/home/")[0]
+		if fileName == "":
+			return
+		try:
+			pairs = findDuplicates(self.cnx, panel, maxDiscordance[0], nThreads=os.cpu_count() or 1)
+		except ValueError as e:
+			dlgError(parent=self, message=str(e))
+			return
+		writeDuplicateReport(pairs, fileName)
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Find duplicate individuals")
+		msgBox.setText("%s pairs of individuals written" % len(pairs))
+		msgBox.exec()
+
+	# assign parents to individuals in a Biallelic panel
+	# offspring and candidate sires and dams are files with one individual name per line
+	# if no file of candidate sires (dams) is chosen, individuals recorded as sires (dams) in the pedigree are used
+	def parentageAssignment(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Assign parents from genotypes")
+		if panel is None:
+			return
+		offFile = QFileDialog.getOpenFileName(self, "Open file of offspring names", "/home/")[0]
+		if offFile == "":
+			return
+		sireFile = QFileDialog.getOpenFileName(self, "Open file of candidate sire names (cancel to use sires in the pedigree)", "/home/")[0]
+		damFile = QFileDialog.getOpenFileName(self, "Open file of candidate dam names (cancel to use dams in the pedigree)", "/home/")[0]
+		fileName = QFileDialog.getSaveFileName(self, "Save parentage report", "/home/")[0]
+		if fileName == "":
+			return
+		updatePedigree = QMessageBox.question(self, "Assign parents from genotypes",
+			"Enter assigned parents in the pedigree where the sire or dam is not entered?") == QMessageBox.StandardButton.Yes
+		try:
+			pedSires, pedDams = getPedigreeParents(self.cnx)
+			offspring = list(getIndIDdict(self.cnx, readLocusList(offFile)).values())
+			sires = pedSires if sireFile == "" else list(getIndIDdict(self.cnx, readLocusList(sireFile)).values())
+			dams = pedDams if damFile == "" else list(getIndIDdict(self.cnx, readLocusList(damFile)).values())
+			if len(offspring) == 0:
+				dlgError(parent=self, message="None of the offspring are in the pedigree")
+				return
+			results = assignParents(self.cnx, panel, offspring, sires, dams, nThreads=os.cpu_count() or 1)
+			writeParentage(self.cnx, panel, results, updatePedigree)
+		except (ValueError, connector.Error) as e:
+			self.cnx.rollback()
+			dlgError(parent=self, message="Parents were not assigned: %s" % e)
+			return
+		ids = set([x["ind_id"] for x in results])
+		for x in results:
+			ids.update([x[k] for k in ("sire", "dam", "recorded_sire", "recorded_dam") if x[k] is not None])
+		writeParentageReport(results, getIndNames(self.cnx, ids), fileName)
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Assign parents from genotypes")
+		msgBox.setText("Parents assigned for %s individuals" % len([x for x in results if x["sire"] is not None or x["dam"] is not None]))
+		msgBox.exec()
+
+	# write the genomic relationship matrix of a Biallelic panel
+	# the matrix is float32 in row major order, with individual names in the file with ".inds" appended
+	def relationshipMatrix(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Genomic relationship matrix")
+		if panel is None:
+			return
+		fileName = QFileDialog.getSaveFileName(self, "Save genomic relationship matrix", "/home/")[0]
+		if fileName == "":
+			return
+		def progress(done):
+			self.statusBar().showMessage("Genomic relationship matrix %.0f%% done" % (100 * done))
+			QApplication.processEvents()
+		try:
+			n = computeGRM(self.cnx, panel, fileName, nThreads=os.cpu_count() or 1, progress=progress)
+		except (ValueError, RuntimeError, OSError, connector.Error) as e:
+			self.statusBar().clearMessage()
+			dlgError(parent=self, message="Genomic relationship matrix was not made: %s" % e)
+			return
+		self.statusBar().clearMessage()
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Genomic relationship matrix")
+		msgBox.setText("Genomic relationship matrix of %s individuals written to %s, individual names written to %s" % (n, fileName, fileName + ".inds"))
+		msgBox.exec()
+
+	# write the inbreeding coefficients of all individuals in the pedigree
+	def inbreedingReport(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		fileName = QFileDialog.getSaveFileName(self, "Save inbreeding coefficients", "/home/")[0]
+		if fileName == "":
+			return
+		def progress(done):
+			self.statusBar().showMessage("Inbreeding coefficients %.0f%% done" % (100 * done))
+			QApplication.processEvents()
+		try:
+			ped = loadPedigree(self.cnx)
+			ped.inbreeding(progress=progress)
+			writeInbreedingReport(self.cnx, ped, fileName)
+		except (ValueError, RuntimeError, connector.Error) as e:
+			self.statusBar().clearMessage()
+			dlgError(parent=self, message="Inbreeding coefficients were not computed: %s" % e)
+			return
+		self.statusBar().clearMessage()
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Pedigree inbreeding coefficients")
+		msgBox.setText("Inbreeding coefficients of %s individuals written" % ped.n)
+		msgBox.exec()
+
+	# add individuals in a phenotype file to an existing phenotype table
+	def loadPhenoTable(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		table = self.choosePhenoTable("Add individuals to a phenotype table")
+		if table is None:
+			return
+		fileName = QFileDialog.getOpenFileName(self, "Open phenotype file", "/home/")[0]
+		if fileName == "":
+			return
+		with openInputFile(fileName) as f:
+			header = f.readline().rstrip("\n").split("\t")
+		indColumn = QInputDialog.getItem(self, "Add individuals to a phenotype table", "Individual name column:", header, editable=False)
+		if not indColumn[1]:
+			return
+		try:
+			nInds = loadPhenotypes(self.cnx, self.userInfo, table, fileName, indColumn[0])
+		except (ValueError, connector.Error) as e:
+			dlgError(parent=self, message="Phenotypes were not added: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Add individuals to a phenotype table")
+		msgBox.setText("%s individuals added to %s" % (nInds, table))
+		msgBox.exec()
+
+	# write a phenotype table to a tab delimited file
+	def exportPhenoTable(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		table = self.choosePhenoTable("Export a phenotype table")
+		if table is None:
+			return
+		fileName = QFileDialog.getSaveFileName(self, "Save phenotype table", "/home/")[0]
+		if fileName == "":
+			return
+		try:
+			nInds = exportPhenoTable(self.cnx, table, fileName)
+		except connector.Error as e:
+			dlgError(parent=self, message="Phenotypes were not exported: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Export a phenotype table")
+		msgBox.setText("%s individuals written" % nInds)
+		msgBox.exec()
+
+	# write the pedigree, phenotypes, and genotypes of the individuals in a panel to one file
+	def exportDataset(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Export an analysis dataset")
+		if panel is None:
+			return
+		phenoTable = QInputDialog.getItem(self, "Export an analysis dataset", "Phenotype table:", ["(none)"] + getPhenoTables(self.cnx), editable=False)
+		if not phenoTable[1]:
+			return
+		phenoTable = None if phenoTable[0] == "(none)" else phenoTable[0]
+		fileType = QInputDialog.getItem(self, "Export an analysis dataset", "File type:", ["text", "binary"], editable=False)
+		if not fileType[1]:
+			return
+		fileName = QFileDialog.getSaveFileName(self, "Save analysis dataset", "/home/")[0]
+		if fileName == "":
+			return
+		try:
+			n = writeDataset(self.cnx, panel, fileName, fileType[0], phenoTable)
+		except (ValueError, RuntimeError, connector.Error) as e:
+			dlgError(parent=self, message="Dataset was not written: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Export an analysis dataset")
+		msgBox.setText("%s individuals written" % n)
+		msgBox.exec()
+
+	# make a new genetic grouping from a file of individual and group names
+	def makeGrouping(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		groupingName = QInputDialog.getText(self, "Make a new genetic grouping", "Grouping name:")
+		if not groupingName[1]:
+			return
+		description = QInputDialog.getText(self, "Make a new genetic grouping", "Grouping description:")
+		if not description[1]:
+			return
+		fileName = QFileDialog.getOpenFileName(self, "Open grouping file (individual and group columns)", "/home/")[0]
+		if fileName == "":
+			return
+		try:
+			nInds, nGroups = createGrouping(self.cnx, self.userInfo, groupingName[0], fileName, description[0])
+		except (ValueError, connector.Error) as e:
+			dlgError(parent=self, message="Grouping was not made: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Make a new genetic grouping")
+		msgBox.setText("Grouping %s made with %s individuals in %s groups" % (groupingName[0], nInds, nGroups))
+		msgBox.exec()
+
+	# write allele frequencies and missingness of each genetic group for a panel
+	def groupFrequencyReport(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Allele frequencies by genetic group")
+		if panel is None:
+			return
+		groupings = getGroupings(self.cnx)
+		if len(groupings) == 0:
+			dlgError(parent=self, message="No genetic groupings are defined in the database")
+			return
+		grouping = QInputDialog.getItem(self, "Allele frequencies by genetic group", "Grouping:", groupings, editable=False)
+		if not grouping[1]:
+			return
+		fileName = QFileDialog.getSaveFileName(self, "Save allele frequencies by genetic group", "/home/")[0]
+		if fileName == "":
+			return
+		try:
+			nGroups = writeGroupFrequencies(self.cnx, panel, grouping[0], fileName)
+		except connector.Error as e:
+			dlgError(parent=self, message="Allele frequencies were not written: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Allele frequencies by genetic group")
+		msgBox.setText("Allele frequencies written for %s groups" % nGroups)
+		msgBox.exec()
+
+	# write the genotypes of a panel to Parquet files
+	def exportParquet(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		panel = self.choosePanel("Export genotypes to Parquet")
+		if panel is None:
+			return
+		directory = QFileDialog.getExistingDirectory(self, "Select output directory for Parquet files", "/home/")
+		if directory == "":
+			return
+		try:
+			n = writeParquet(self.cnx, panel, directory)
+		except (ValueError, RuntimeError, OSError, connector.Error) as e:
+			dlgError(parent=self, message="Genotypes were not exported: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Export genotypes to Parquet")
+		msgBox.setText("%s individuals written" % n)
+		msgBox.exec()
+
+	# add row versions to tables made before row versioning
+	def enableRowVersions(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		try:
+			changed = addRowVersions(self.cnx)
+		except connector.Error as e:
+			dlgError(parent=self, message="Row versioning was not enabled: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Enable row versioning")
+		msgBox.setText("Row versioning added to %s tables" % len(changed) if len(changed) > 0 else "Row versioning is already enabled for all tables")
+		msgBox.exec()
+
+	# write rows changed since a watermark, the watermark for the next export is saved next to the output
+	def exportChanges(self):
+		if (not hasattr(self, "cnx")) or self.cnx.database == "" or self.cnx.database is None:
+			dlgError(parent = self, message="Error, not connected to a database")
+			return
+		kinds = ["Pedigree", "Phenotype table", "Analysis dataset", "Genotypes (Parquet)"]
+		kind = QInputDialog.getItem(self, "Export changes since last export", "Export:", kinds, editable=False)
+		if not kind[1]:
+			return
+		kind = kind[0]
+		panel = None
+		table = None
+		if kind == "Phenotype table":
+			table = self.choosePhenoTable("Export changes since last export")
+			if table is None:
+				return
+		elif kind != "Pedigree":
+			panel = self.choosePanel("Export changes since last export")
+			if panel is None:
+				return
+		if kind == "Genotypes (Parquet)":
+			fileName = QFileDialog.getExistingDirectory(self, "Select output directory for Parquet files", "/home/")
+		else:
+			fileName = QFileDialog.getSaveFileName(self, "Save changes", "/home/")[0]
+		if fileName == "":
+			return
+		# default is the watermark saved by the last export to this file
+		since = QInputDialog.getText(self, "Export changes since last export", "Export rows changed since (blank for all rows):",
+			text=readWatermark(fileName) or "")
+		if not since[1]:
+			return
+		since = since[0].strip() or None
+		try:
+			watermark = getWatermark(self.cnx)
+			if kind == "Pedigree":
+				n = exportPedigree(self.cnx, fileName, since)
+			elif kind == "Phenotype table":
+				n = exportPhenoTable(self.cnx, table, fileName, since=since)
+			elif kind == "Analysis dataset":
+				n = writeDataset(self.cnx, panel, fileName, since=since)
+			else:
+				n = writeParquet(self.cnx, panel, fileName, since=since)
+		except (ValueError, RuntimeError, OSError, connector.Error) as e:
+			dlgError(parent=self, message="Changes were not exported: %s" % e)
+			return
+		writeWatermark(fileName, watermark)
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Export changes since last export")
+		msgBox.setText("%s individuals written, next export starts from %s" % (n, watermark))
+		msgBox.exec()
@@ -0,0 +1,127 @@
+# population of the lookup tables (intDB<panel>_lt) of Multiallelic and Hyperallelic panels
+# rows for many loci are built at once and sent as parameterized multi-row inserts
+# in batches of batchSize rows, rather than one statement per locus
+#   Multiallelic: (locus_id, genotype_id, allele_1, ..., allele_ploidy) one row per genotype
+#   Hyperallelic: (locus_id, allele_id, allele) one row per allele
+# genotype_id/allele_id 0 is reserved for missing
+
+import mysql.connector as connector
+from itertools import combinations_with_replacement
+from .utils import numGenotypes
+
+# column names of the lookup table
+def lookupColumns(panelType : str, ploidy : int) -> list:
+	if panelType == "Multiallelic":
+		return ["locus_id", "genotype_id"] + ["allele_%s" % i for i in range(1, ploidy + 1)]
+	return ["locus_id", "allele_id", "allele"]
+
+# execute inserts of rows into the lookup table in batches
+def insertLookupRows(curs, panelName : str, panelType : str, ploidy : int, rows : list, batchSize : int):
+	cols = lookupColumns(panelType, ploidy)
+	sqlState = "INSERT INTO `intDB%s_lt` (%s) VALUES (%s)" % (panelName, ",".join(cols), ",".join(["%s"] * len(cols)))
+	for i in range(0, len(rows), batchSize):
+		curs.executemany(sqlState, rows[i:(i + batchSize)])
+
+# lookup table rows for a locus being defined with a list of alleles
+# returns None if there are too many alleles to store
+def newLocusRows(locusID : int, alleles : list, panelType : str, ploidy : int):
+	if panelType == "Multiallelic":
+		if numGenotypes(len(alleles), ploidy) > 255:
+			return None
+		alleles = sorted(alleles) # sort to make comparison to user input data easy
+		# genotype_id starts at 1 b/c 0 is missing genotype
+		return [(locusID, i + 1) + tuple(sorted(geno)) for i, geno in enumerate(combinations_with_replacement(alleles, ploidy))]
+	if len(alleles) > 255:
+		return None
+	return [(locusID, i + 1, alleles[i]) for i in range(0, len(alleles))]
+
+# lookup table rows for new alleles added to a locus that already has curAlleles defined
+# genotype ids continue on from the existing ones so stored genotypes keep their meaning
+# returns None if there are too many alleles to store
+def addAlleleRows(locusID : int, curAlleles : list, newAlleles, panelType : str, ploidy : int):
+	curAlleles = list(curAlleles)
+	rows = []
+	if panelType == "Multiallelic":
+		if numGenotypes(len(curAlleles) + len(newAlleles), ploidy) > 255:
+			return None
+		newGeno_id = numGenotypes(len(curAlleles), ploidy) + 1
+		for a in newAlleles:
+			# all genotypes with one or more copies of the new allele and any of the alleles before it
+			for i in range(0, ploidy):
+				copiesNewA = [a for x in range(0, ploidy - i)]
+				genos = [sorted(copiesNewA + list(x)) for x in combinations_with_replacement(curAlleles, i)]
+				genos.sort()
+				for g in genos:
+					rows += [(locusID, newGeno_id) + tuple(g)]
+					newGeno_id += 1
+			curAlleles += [a]
+	else:
+		if len(curAlleles) + len(newAlleles) > 255:
+			return None
+		newAllele_id = len(curAlleles) + 1
+		for a in newAlleles:
+			rows += [(locusID, newAllele_id, a)]
+			newAllele_id += 1
+	return rows
+
+# fill the lookup table from the intDBalleles column of the panel table
+# for loci with intDBlocus_id > afterLocusID (all loci by default)
+# loci are read in batches of batchSize by locus id, so only one connection is needed
+# returns None on success, or the name and number of alleles of a locus that has too many alleles
+def populateLookupTable(cnx : connector, panelName : str, panelType : str, ploidy : int,
+						batchSize : int = 10000, afterLocusID : int = 0):
+	lastID = afterLocusID
+	with cnx.cursor() as curs:
+		while True:
+			curs.execute("SELECT intDBlocus_id, intDBlocus_name, intDBalleles FROM `%s` WHERE intDBlocus_id > %%s ORDER BY intDBlocus_id LIMIT %%s" % panelName,
+				(lastID, batchSize))
+			loci = curs.fetchall()
+			if len(loci) == 0:
+				break
+			rows = []
+			for loc in loci: # (id, name, alleles)
+				# remove any empty strings (can happen when user uploads with no value)
+				alleles = [x for x in loc[2].split(",") if len(x) > 0]
+				if len(alleles) < 1: # skip if no alleles given
+					continue
+				locusRows = newLocusRows(loc[0], alleles, panelType, ploidy)
+				if locusRows is None:
+					return (loc[1], len(alleles))
+				rows += locusRows
+			insertLookupRows(curs, panelName, panelType, ploidy, rows, batchSize)
+			lastID = loci[-1][0]
+	return None
+
+# add new alleles to loci in the lookup table
+# newAlleles : dict with key locus name, value iterable of new alleles
+# loci and their current alleles are read with a few queries of batchSize loci each
+# returns list of (locus name, total number of alleles) for loci skipped b/c of too many alleles
+def addAllelesToLookupTable(cnx : connector, panelName : str, panelType : str, ploidy : int,
+						newAlleles : dict, batchSize : int = 10000):
+	sqlSub = "allele_1" if panelType == "Multiallelic" else "allele"
+	skipped = []
+	locusNames = list(newAlleles)
+	with cnx.cursor() as curs:
+		for i in range(0, len(locusNames), batchSize):
+			batchNames = locusNames[i:(i + batchSize)]
+			# get locus_id
+			# may not be in lt if no alleles previously defined, so using the panel table
+			curs.execute("SELECT intDBlocus_name, intDBlocus_id FROM `%s` WHERE intDBlocus_name IN (%s)" % (panelName, ",".join(["%s"] * len(batchNames))),
+				batchNames)
+			locusIDs = {x[0] : x[1] for x in curs}
+			# get currently defined alleles, in order of allele/genotype id
+			curAlleles = {x : [] for x in locusIDs.values()}
+			idCol = "genotype_id" if panelType == "Multiallelic" else "allele_id"
+			curs.execute("SELECT locus_id, %s, MIN(%s) FROM `intDB%s_lt` WHERE locus_id IN (%s) GROUP BY locus_id, %s ORDER BY locus_id, MIN(%s)" %
+				(sqlSub, idCol, panelName, ",".join(["%s"] * len(locusIDs)), sqlSub, idCol), list(locusIDs.values()))
+			for x in curs:
+				curAlleles[x[0]] += [x[1]]
+			rows = []
+			for name in batchNames:
+				locusRows = addAlleleRows(locusIDs[name], curAlleles[locusIDs[name]], newAlleles[name], panelType, ploidy)
+				if locusRows is None:
+					skipped += [(name, len(curAlleles[locusIDs[name]]) + len(newAlleles[name]))]
+					continue
+				rows += locusRows
+			insertLookupRows(curs, panelName, panelType, ploidy, rows, batchSize)
+	return skipped
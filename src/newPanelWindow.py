@@ -1,16 +1,16 @@
 # make a new panel window
 import mysql.connector as connector
-import re
 from PyQt6.QtWidgets import (
 	QPushButton, QLabel, QLineEdit, QComboBox, 
 	 QGridLayout, 
 	 QFileDialog, QVBoxLayout, QSpinBox, QTextEdit, QDialog
 )
-from .utils import (dlgError, identifier_syntax_check, getCursLoci, 
-	getCursLociAlleles, getConnection, numBits, numGenotypes, removePartialPanel
-)
-from collections import deque
-from itertools import combinations_with_replacement
+from .utils import dlgError, identifier_syntax_check, removePartialPanel
+from .lookupTables import populateLookupTable
+from .genotypeSummaries import createLocusSummaryTables, createIndividualQCTable
+from .compressedInput import openInputFile
+from .bulkLoad import stagingFile, loadStagingFile
+from .panelDefinition import readDefinitionFile, maxLociInPanel, createGenotypeTables
 
 # using QDialog class and exec to block other windows - only one active window at a time
 class newPanelWindow(QDialog):
@@ -64,7 +64,7 @@ class newPanelWindow(QDialog):
 		self.panelDefFile = tempFile
 		self.curFileSelected.setText(self.panelDefFile)
 		# read in header line
-		with open(self.panelDefFile, "r") as f:
+		with openInputFile(self.panelDefFile) as f:
 			h = f.readline()
 		if h:
 			h = h.rstrip("\n").split("\t")
@@ -139,137 +139,81 @@ class newPanelWindow(QDialog):
 					dlgError(parent=self, message="A table with that name already exists, please pick a different panel name")
 					return
 		
-		# detect varchar sizes and more input checks
-		# this does NOT check whether locus names are unique
-		# this is not done b/c it would require storing all names in memory
+		# column names and types
 		colNames = [x.text() for x in self.columnType_labels]
 		colTypes = [x.currentText() for x in self.columnType_comboboxes]
-		vChar = [i for i in range(0,len(colTypes)) if colTypes[i] in ("Locus name", "VARCHAR", "Alt allele", "Ref allele", "Alleles")]
-		locName_pos = [i for i in range(0,len(colTypes)) if colTypes[i] == "Locus name"][0]
-		toCheck_pos = [i for i in range(0,len(colTypes)) if colTypes[i] in ("Alt allele", "Ref allele", "Alleles")]
-		maxLen = [0] * len(vChar)
-		locusNames = set()
-		locusCount = 0 # number of loci in panel definition file
-		with open(self.panelDefFile, "r") as f:
-			line = f.readline() # skip header
-			for l in f:
-				line = l.rstrip("\n").split("\t")
-				locusCount += 1
-				locusNames.add(line[locName_pos])
-				for i in range(0, len(vChar)):
-					if len(line[vChar[i]]) > maxLen[i]:
-						maxLen[i] = len(line[vChar[i]])
-				# make sure locus names are valid identifiers
-				if not identifier_syntax_check(line[locName_pos]):
-					dlgError(parent=self, message="Locus \"%s\" has an invalid name" % line[locName_pos])
+		# make sure user defined columns have valid names
+		for i in range(0, len(colNames)):
+			if colTypes[i] not in ("Locus name", "Alt allele", "Ref allele", "Alleles"):
+				if not identifier_syntax_check(colNames[i]):
+					dlgError(parent=self, message="\"%s\" is an invalid column name" % colNames[i])
 					return
-				# Make sure alt allele, ref allele, and alleles are valid values, if present (no whitespace, unique)
-				for j in toCheck_pos:
-					if re.search(r"\s", line[j]):
-						dlgError(parent=self, message="Locus \"%s\" has an invalid value (contains whitespace) for %s" % (line[locName_pos], colTypes[j]))
-						return
-				if len(toCheck_pos) == 2:
-					# ref and alt
-					if line[toCheck_pos[0]] == line[toCheck_pos[1]]:
-						dlgError(parent=self, message="Locus \"%s\" has the same ref and alt allele" % line[locName_pos])
-						return
-					elif line[toCheck_pos[0]] == "" or line[toCheck_pos[1]] == "":
-						dlgError(parent=self, message="Locus \"%s\" is missing either a ref or an alt allele" % line[locName_pos])
-						return
-				elif len(toCheck_pos) == 1:
-					# alleles
-					alleles = line[toCheck_pos[0]].split(",")
-					if len(alleles) > len(set(alleles)):
-						dlgError(parent=self, message="Locus \"%s\" has the same allele listed more than once" % line[locName_pos])
-						return
-		if len(locusNames) < locusCount:
-			dlgError(parent=self, message="Duplicate locus names found")
+
+		# check the definition file and detect varchar sizes
+		# validated rows are written to a staging file as they are read, so the
+		# definition file is only read once
+		staging = stagingFile()
+		try:
+			locusCount, maxLen = readDefinitionFile(self.panelDefFile, staging, colTypes)[:2]
+		except ValueError as e:
+			staging.remove()
+			dlgError(parent=self, message=str(e))
 			return
 		
 		# make sure number of loci is below maximum
-		# maximum allowed is a little below the hard maximum for MEDIUMBLOB
-		maxLoci = 16700000 # for Multi, max loci is same as max bytes
-		if self.panelTypeBox.currentText() == "Hyperallelic":
-			maxLoci = maxLoci // self.ploidySpinnerBox.value()
-		elif self.panelTypeBox.currentText() == "Biallelic":
-			maxLoci = (maxLoci * 8) // numBits(2, self.ploidySpinnerBox.value())
+		maxLoci = maxLociInPanel(self.panelTypeBox.currentText(), self.ploidySpinnerBox.value())
 		if locusCount > maxLoci:
+			staging.remove()
 			dlgError(parent=self, message="Too many loci to store in one panel. The maximum number of loci for this type and ploidy is %s." % maxLoci)
 			return
-
-		# make sure user defined columns have valid names
-		for i in range(0, len(colNames)):
-			if colTypes[i] not in ("Locus name", "Alt allele", "Ref allele", "Alleles"):
-				if not identifier_syntax_check(colNames[i]):
-					dlgError(parent=self, message="\"%s\" is an invalid column name" % colNames[i])
-					return
 				
 		# add panel to database
-		maxLen = deque(maxLen) # for efficient pop from left
-		# build sql statement and value insert string
+		# build sql statement
 		sqlState = "CREATE TABLE `%s` (intDBlocus_id INTEGER UNSIGNED PRIMARY KEY AUTO_INCREMENT," % self.panelNameBox.text()
-		insertString = "("
 		for i in range(0, len(colTypes)):
 			if i > 0:
 				sqlState += ", "
-				insertString += ","
 
 			if colTypes[i] == "Locus name":
-				sqlState += "intDBlocus_name VARCHAR(%s) UNIQUE NOT NULL" % maxLen.popleft()
+				sqlState += "intDBlocus_name VARCHAR(%s) UNIQUE NOT NULL" % maxLen[i]
 				colNames[i] = "intDBlocus_name" # recode column names
 			elif colTypes[i] == "Ref allele":
-				if maxLen[0] == 1: # save a bit of memory if all are one character long
+				if maxLen[i] == 1: # save a bit of memory if all are one character long
 					tempVarType = "CHAR"
 				else:
 					tempVarType = "VARCHAR"
-				sqlState += "intDBref_allele %s(%s) NOT NULL" % (tempVarType, maxLen.popleft())
+				sqlState += "intDBref_allele %s(%s) NOT NULL" % (tempVarType, maxLen[i])
 				colNames[i] = "intDBref_allele"
 			elif colTypes[i] == "Alt allele":
-				if maxLen[0] == 1: # save a bit of memory if all are one character long
+				if maxLen[i] == 1: # save a bit of memory if all are one character long
 					tempVarType = "CHAR"
 				else:
 					tempVarType = "VARCHAR"
-				sqlState += "intDBalt_allele %s(%s) NOT NULL" % (tempVarType, maxLen.popleft())
+				sqlState += "intDBalt_allele %s(%s) NOT NULL" % (tempVarType, maxLen[i])
 				colNames[i] = "intDBalt_allele"
 			elif colTypes[i] == "Alleles":
-				sqlState += "intDBalleles VARCHAR(%s) NOT NULL" % maxLen.popleft()
+				sqlState += "intDBalleles VARCHAR(%s) NOT NULL" % maxLen[i]
 				colNames[i] = "intDBalleles"
 			elif colTypes[i] == "VARCHAR":
-				sqlState += "`%s` VARCHAR(%s) NOT NULL" % (colNames[i], maxLen.popleft())
+				sqlState += "`%s` VARCHAR(%s) NOT NULL" % (colNames[i], maxLen[i])
 			else:
 				sqlState += "`%s` %s NOT NULL" % (colNames[i], colTypes[i])
-
-			if colTypes[i] in ("INTEGER", "DOUBLE"):
-				insertString += "%s" # no quotes for numbers
-			else:
-				insertString += "'%s'" # single quotes for string literals
 		sqlState += ")"
-		insertString += "),"
 		
 		# execute on MySQL server
 		with self.cnx.cursor() as curs:
 			# create panel information table
 			curs.execute(sqlState)
-			# load data - to best deal with new lines and LOCAL issues, not using LOAD DATA
-			with open(self.panelDefFile, "r") as f:
-				line = f.readline() # skip header
-				line = f.readline()
-				colNameString = "(" + ",".join(["`" + x + "`" for x in colNames]) + ")"
-				sqlState = "INSERT INTO `%s` %s VALUES " % (self.panelNameBox.text(), colNameString)
-				rowCounter = 0
-				while line:
-					line = line.rstrip("\n").split("\t")
-					sqlState += insertString % tuple(line)
-					rowCounter += 1
-					if rowCounter == self.batchSizeSpinnerBox.value():
-						# strip last comma and execute insert statement
-						curs.execute(sqlState.rstrip(","))
-						sqlState = "INSERT INTO `%s` %s VALUES " % (self.panelNameBox.text(), colNameString)
-						rowCounter = 0
-					line = f.readline()
-				if rowCounter > 0:
-					# strip last comma and execute insert statement
-					curs.execute(sqlState.rstrip(","))
+			# load data from the staging file
+			try:
+				loadStagingFile(self.cnx, self.userInfo, self.panelNameBox.text(), colNames, staging, self.batchSizeSpinnerBox.value())
+			except (connector.Error, ValueError) as e:
+				dlgError(parent=self, message="Error loading the panel definition: %s" % e)
+				self.cnx.rollback() # release locks before removing the tables
+				removePartialPanel(self.userInfo, self.panelNameBox.text())
+				return
+			finally:
+				staging.remove()
 			del sqlState
 
 			# add panel to overall genotype panel information table
@@ -277,89 +221,21 @@ class newPanelWindow(QDialog):
 			curs.execute("INSERT INTO intDBgeno_overview VALUES (%s, %s, %s, %s, %s)", 
 				(self.panelNameBox.text(), locusCount, self.ploidySpinnerBox.value(), self.panelDescBox.toPlainText(), self.panelTypeBox.currentText()))
 
-			# create genotype table
-			sqlState = "CREATE TABLE `%s` (ind_id INTEGER UNSIGNED PRIMARY KEY, genotypes MEDIUMBLOB NOT NULL, FOREIGN KEY (ind_id) REFERENCES intDBpedigree(ind_id))" % ("intDB" + self.panelNameBox.text() + "_gt")
-			curs.execute(sqlState)
-			
-			cnx2 = getConnection(self.userInfo)
-			# create lookup table
-			if self.panelTypeBox.currentText() == "Multiallelic":
-				# define table
-				sqlState = "CREATE TABLE `%s` (locus_id INTEGER UNSIGNED NOT NULL, genotype_id TINYINT UNSIGNED NOT NULL," % ("intDB" + self.panelNameBox.text() + "_lt")
-				alleleCols = []
-				for i in range(1, self.ploidySpinnerBox.value() + 1):
-					sqlState += " allele_%s VARCHAR(255) NOT NULL," % i
-					alleleCols += ["allele_%s" % i]
-				sqlState += " FOREIGN KEY (locus_id) REFERENCES %s (intDBlocus_id), PRIMARY KEY (locus_id, genotype_id), INDEX (%s))" % (self.panelNameBox.text(), ",".join(alleleCols))
-				del alleleCols # defensive
-				curs.execute(sqlState)
-				# populate with user supplied values, if any
-				if "intDBalleles" in colNames:
-					# get cursor for loci/alleles ordered by locus id
-					laCursor = getCursLociAlleles(cnx2, self.panelNameBox.text())
-					colNameString = "(" + ",".join(["locus_id", "genotype_id"] + ["allele_%s" % i for i in range(1, self.ploidySpinnerBox.value() + 1)]) + ")"
-					for loc in laCursor: # (id, name, alleles)
-						# split alleles
-						alleles = loc[2].split(",")
-						alleles = [x for x in alleles if len(x) > 0] # remove any empty strings (can happen when user uploads with no value)
-						if len(alleles) < 1: # skip if no alleles given
-							continue
-						# check that number of genotypes can be stored
-						if numGenotypes(len(alleles), self.ploidySpinnerBox.value()) > 255:
-							dlgError(parent=self, message="%s alleles for locus %s is too many to be stored in a Multiallelic panel." % (len(alleles), loc[1]))
-							removePartialPanel(self.userInfo, self.panelNameBox.text())
-							return
-						alleles.sort() # sort to make comparison to user input data easy (have to sort it on input as well)
-						geno_id = 1 # start at 1 b/c 0 is missing genotype
-						sqlState = "INSERT INTO `%s` %s VALUES " % ("intDB" + self.panelNameBox.text() + "_lt", colNameString)
-						for geno in combinations_with_replacement(alleles, self.ploidySpinnerBox.value()):
-							genoSort = list(geno) 
-							genoSort.sort() # should already be sorted, but double checking here just to make sure, and in case combin function changes
-							# add genotype to lookup table
-							sqlState += "(%s,%s,%s)," % (loc[0], geno_id, ",".join(["'%s'" % x for x in genoSort]))
-							geno_id += 1
-						# execute each locus at a time
-						curs.execute(sqlState.rstrip(","))
-					laCursor.close()
+			# create genotype and lookup tables
+			createGenotypeTables(self.cnx, self.panelNameBox.text(), self.panelTypeBox.currentText(), self.ploidySpinnerBox.value())
+			# populate lookup table with user supplied values, if any
+			if self.panelTypeBox.currentText() != "Biallelic" and "intDBalleles" in colNames:
+				tooMany = populateLookupTable(self.cnx, self.panelNameBox.text(), self.panelTypeBox.currentText(), 
+					self.ploidySpinnerBox.value(), self.batchSizeSpinnerBox.value())
+				if tooMany is not None:
+					dlgError(parent=self, message="%s alleles for locus %s is too many to be stored in a %s panel." % (tooMany[1], tooMany[0], self.panelTypeBox.currentText()))
+					self.cnx.rollback() # release locks before removing the tables
+					removePartialPanel(self.userInfo, self.panelNameBox.text())
+					return
 
-			elif self.panelTypeBox.currentText() == "Hyperallelic":
-				# define table
-				sqlState = """
-				CREATE TABLE `%s` (
-				locus_id INTEGER UNSIGNED NOT NULL, 
-				allele_id TINYINT UNSIGNED NOT NULL, 
-				allele VARCHAR(255) NOT NULL,
-				FOREIGN KEY (locus_id) REFERENCES %s (intDBlocus_id), 
-				PRIMARY KEY (locus_id, allele_id),
-				INDEX (allele))
-				""" % ("intDB" + self.panelNameBox.text() + "_lt", self.panelNameBox.text())
-				curs.execute(sqlState)
-				# populate with user supplied values, if any
-				if "intDBalleles" in colNames:
-					# get cursor for loci/alleles ordered by locus id
-					laCursor = getCursLociAlleles(cnx2, self.panelNameBox.text())
-					colNameString = "(" + ",".join(["locus_id", "allele_id", "allele"]) + ")"
-					for loc in laCursor: # (locus id, allele id, allele character string)
-						# split alleles
-						alleles = loc[2].split(",")
-						alleles = [x for x in alleles if len(x) > 0] # remove any empty strings (can happen when user uploads with no value)
-						if len(alleles) < 1: # skip if no alleles given
-							continue
-						if len(alleles) > 255:
-							dlgError(parent=self, message="%s alleles for locus %s is too many to be stored in a Hyperallelic panel." % (len(alleles), loc[1]))
-							removePartialPanel(self.userInfo, self.panelNameBox.text())
-							return
-						allele_id = 1 # start at 1 b/c 0 is missing genotype
-						sqlState = "INSERT INTO `%s` %s VALUES " % ("intDB" + self.panelNameBox.text() + "_lt", colNameString)
-						for a in alleles:
-							# add allele to lookup table
-							sqlState += "(%s,%s,'%s')," % (loc[0], allele_id, a)
-							allele_id += 1
-						# execute each locus at a time
-						curs.execute(sqlState.rstrip(","))
-					laCursor.close()
-			
-			cnx2.close() # close second connection
+			# create locus summary and individual QC tables
+			createLocusSummaryTables(self.cnx, self.panelNameBox.text())
+			createIndividualQCTable(self.cnx, self.panelNameBox.text())
 		
 		# commit changes
 		self.cnx.commit()
@@ -0,0 +1,106 @@
+# make a new phenotype table window
+import mysql.connector as connector
+from PyQt6.QtWidgets import (
+	QPushButton, QLabel, QLineEdit, QComboBox,
+	 QGridLayout,
+	 QFileDialog, QVBoxLayout, QSpinBox, QTextEdit, QDialog, QMessageBox
+)
+from .utils import dlgError
+from .compressedInput import openInputFile
+from .phenotypeTables import PHENO_COLUMN_TYPES, createPhenoTable
+
+# using QDialog class and exec to block other windows - only one active window at a time
+class newPhenoTableWindow(QDialog):
+	def __init__(self, cnx : connector, userInfo : dict):
+		super().__init__()
+		self.setWindowTitle("Make new phenotype table")
+		self.cnx = cnx
+		self.userInfo = userInfo
+
+		self.setMinimumSize(200, 200) # trying to avoid :"Unable to set geometry" warning
+
+		# table name, etc (info from user)
+		self.tableNameBox = QLineEdit()
+		self.selectPhenoFile = QPushButton("Select phenotype file")
+		self.selectPhenoFile.clicked.connect(self.onClickPhenoFile)
+		self.curFileSelected = QLabel("")
+		self.curFileSelected.setWordWrap(True)
+		self.batchSizeSpinnerBox = QSpinBox() # number of individuals to insert at once if LOAD DATA is not available
+		self.batchSizeSpinnerBox.setRange(1, 100000000)
+		self.batchSizeSpinnerBox.setValue(10000) # default is 10000
+		self.tableDescBox = QTextEdit()
+		self.tableDescBox.setAcceptRichText(False)
+
+		self.gridLayout = QGridLayout()
+		self.inputLabels = ["Table name", "Table description", "Batch size"]
+		for i in range(0, len(self.inputLabels)):
+			self.gridLayout.addWidget(QLabel(self.inputLabels[i]), i, 0)
+		self.gridLayout.addWidget(self.tableNameBox, 0, 1)
+		self.gridLayout.addWidget(self.tableDescBox, 1, 1)
+		self.gridLayout.addWidget(self.batchSizeSpinnerBox, 2, 1)
+		self.gridLayout.addWidget(self.selectPhenoFile, 3, 0)
+		self.gridLayout.addWidget(self.curFileSelected, 3, 1)
+
+		# add main selection items as top layout in main layout
+		self.mainLayout = QVBoxLayout()
+		self.mainLayout.addLayout(self.gridLayout)
+		self.setLayout(self.mainLayout)
+
+	def onClickPhenoFile(self):
+		tempFile = QFileDialog.getOpenFileName(self, "Select phenotype file", "/home/")[0]
+		if tempFile == "":
+			return
+		self.phenoFile = tempFile
+		self.curFileSelected.setText(self.phenoFile)
+		# read in header line
+		with openInputFile(self.phenoFile) as f:
+			h = f.readline()
+		if h:
+			h = h.rstrip("\n").split("\t")
+		else:
+			dlgError(self, "Error: Could not read specified file")
+			return
+		# delete old widgets if present
+		if hasattr(self, "columnType_comboboxes"):
+			for i in range(0, len(self.columnType_comboboxes)):
+				self.columnType_comboboxes[i].setParent(None)
+				self.columnType_labels[i].setParent(None)
+		# make combobox selection and label for each column
+		self.columnType_comboboxes = []
+		self.columnType_labels = []
+		self.columnType_subLayout = QGridLayout()
+		for i in range(0, len(h)):
+			self.columnType_comboboxes += [QComboBox()]
+			self.columnType_comboboxes[i].addItems(PHENO_COLUMN_TYPES)
+			# default is the first column is the individual name and the others are numbers
+			self.columnType_comboboxes[i].setCurrentText("Individual" if i == 0 else "DOUBLE")
+			self.columnType_labels += [QLabel(h[i])]
+			# add to layout
+			self.columnType_subLayout.addWidget(self.columnType_labels[i], i, 0)
+			self.columnType_subLayout.addWidget(self.columnType_comboboxes[i], i, 1)
+		# add sublayout to main layout
+		self.mainLayout.addLayout(self.columnType_subLayout)
+
+		# create submit button
+		# only create after a file is selected, don't create more than once
+		if not hasattr(self, "submitTable_button"):
+			self.submitTable_button = QPushButton("Add new phenotype table")
+			self.submitTable_button.clicked.connect(self.onSubmit)
+			self.gridLayout.addWidget(self.submitTable_button, len(self.inputLabels) + 1, 1)
+
+	def onSubmit(self):
+		colNames = [x.text() for x in self.columnType_labels]
+		colTypes = [x.currentText() for x in self.columnType_comboboxes]
+		try:
+			nInds = createPhenoTable(self.cnx, self.userInfo, self.tableNameBox.text(), self.phenoFile, colNames, colTypes,
+				self.tableDescBox.toPlainText(), self.batchSizeSpinnerBox.value())
+		except (ValueError, connector.Error) as e:
+			dlgError(parent=self, message="Phenotype table was not made: %s" % e)
+			return
+		msgBox = QMessageBox(parent=self)
+		msgBox.setWindowTitle("Make new phenotype table")
+		msgBox.setText("Phenotype table %s made with %s individuals" % (self.tableNameBox.text(), nInds))
+		msgBox.exec()
+
+		# close window
+		self.close()
@@ -0,0 +1,143 @@
+# reading and checking of panel definition files, and creation of the tables of a panel
+# shared by making a new panel, adding loci to an existing panel, and migrating panels
+# a panel definition file is tab delimited with a header line and one line per locus
+# column types are the ones chosen when the panel is made:
+#   "Locus name", "Ref allele", "Alt allele", "Alleles", "VARCHAR", "INTEGER", "DOUBLE", "DATE", "TEXT"
+
+import re
+import mysql.connector as connector
+from .utils import identifier_syntax_check, numBits
+from .compressedInput import openInputFile
+from .rowVersions import MODIFIED_COLUMN, MODIFIED_DEFINITION
+
+# column types that are stored as VARCHAR (and so need their maximum length)
+VARCHAR_TYPES = ("Locus name", "VARCHAR", "Alt allele", "Ref allele", "Alleles")
+
+# names of the panel table columns with special column types
+SPECIAL_COLUMNS = {"Locus name" : "intDBlocus_name", "Ref allele" : "intDBref_allele",
+	"Alt allele" : "intDBalt_allele", "Alleles" : "intDBalleles"}
+
+# maximum number of loci in a panel
+# maximum allowed is a little below the hard maximum for MEDIUMBLOB
+def maxLociInPanel(panelType : str, ploidy : int) -> int:
+	maxLoci = 16700000 # for Multi, max loci is same as max bytes
+	if panelType == "Hyperallelic":
+		maxLoci = maxLoci // ploidy
+	elif panelType == "Biallelic":
+		maxLoci = (maxLoci * 8) // numBits(2, ploidy)
+	return maxLoci
+
+# column names and types of an existing panel table, in the order of the panel definition file
+# returns (list of column names, list of column types)
+def panelColumnTypes(cnx : connector, panelName : str):
+	special = {v : k for k, v in SPECIAL_COLUMNS.items()}
+	colNames = []
+	colTypes = []
+	with cnx.cursor() as curs:
+		curs.execute("SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+			(panelName,))
+		for x in curs:
+			if x[0] == "intDBlocus_id":
+				continue
+			colNames += [x[0]]
+			colTypes += [special.get(x[0], x[1].upper())]
+	return (colNames, colTypes)
+
+# check one line of a panel definition file
+# returns an error message or None if the line is valid
+def checkDefinitionLine(line : list, colTypes : list, locName_pos : int, toCheck_pos : list):
+	# make sure locus names are valid identifiers
+	if not identifier_syntax_check(line[locName_pos]):
+		return "Locus \"%s\" has an invalid name" % line[locName_pos]
+	# Make sure alt allele, ref allele, and alleles are valid values, if present (no whitespace, unique)
+	for j in toCheck_pos:
+		if re.search(r"\s", line[j]):
+			return "Locus \"%s\" has an invalid value (contains whitespace) for %s" % (line[locName_pos], colTypes[j])
+	if len(toCheck_pos) == 2:
+		# ref and alt
+		if line[toCheck_pos[0]] == line[toCheck_pos[1]]:
+			return "Locus \"%s\" has the same ref and alt allele" % line[locName_pos]
+		elif line[toCheck_pos[0]] == "" or line[toCheck_pos[1]] == "":
+			return "Locus \"%s\" is missing either a ref or an alt allele" % line[locName_pos]
+	elif len(toCheck_pos) == 1:
+		# alleles
+		alleles = line[toCheck_pos[0]].split(",")
+		if len(alleles) > len(set(alleles)):
+			return "Locus \"%s\" has the same allele listed more than once" % line[locName_pos]
+	return None
+
+# read and check a panel definition file, writing each row to a staging file (bulkLoad.stagingFile)
+# also detects varchar sizes
+# returns (number of loci, list of max lengths of each column (0 for non-VARCHAR columns), set of locus names)
+# raises ValueError with a message for the user if an error is found
+def readDefinitionFile(fileName : str, staging, colTypes : list):
+	vChar = [i for i in range(0, len(colTypes)) if colTypes[i] in VARCHAR_TYPES]
+	locName_pos = colTypes.index("Locus name")
+	toCheck_pos = [i for i in range(0, len(colTypes)) if colTypes[i] in ("Alt allele", "Ref allele", "Alleles")]
+	maxLen = [0] * len(colTypes)
+	locusNames = set()
+	locusCount = 0 # number of loci in panel definition file
+	with openInputFile(fileName) as f:
+		line = f.readline() # skip header
+		for l in f:
+			line = l.rstrip("\n").split("\t")
+			locusCount += 1
+			if len(line) != len(colTypes):
+				raise ValueError("Line %s of the panel definition file has %s columns, expected %s" % (locusCount + 1, len(line), len(colTypes)))
+			locusNames.add(line[locName_pos])
+			for i in vChar:
+				if len(line[i]) > maxLen[i]:
+					maxLen[i] = len(line[i])
+			message = checkDefinitionLine(line, colTypes, locName_pos, toCheck_pos)
+			if message is not None:
+				raise ValueError(message)
+			staging.write(line)
+	if len(locusNames) < locusCount:
+		raise ValueError("Duplicate locus names found")
+	return (locusCount, maxLen, locusNames)
+
+# widen the VARCHAR columns of an existing panel table to hold values of up to maxLen characters
+# maxLen : list of max lengths of each column in colNames, as returned by readDefinitionFile
+# note that ALTER TABLE causes an implicit commit in MySQL
+def widenVarcharColumns(cnx : connector, panelName : str, colNames : list, maxLen : list):
+	with cnx.cursor() as curs:
+		curs.execute("SELECT COLUMN_NAME, CHARACTER_MAXIMUM_LENGTH FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND DATA_TYPE IN ('char', 'varchar')",
+			(panelName,))
+		curLen = {x[0] : x[1] for x in curs}
+		toWiden = ["MODIFY `%s` VARCHAR(%s) NOT NULL" % (colNames[i], maxLen[i]) for i in range(0, len(colNames))
+			if colNames[i] in curLen and maxLen[i] > curLen[colNames[i]]]
+		if len(toWiden) > 0:
+			curs.execute("ALTER TABLE `%s` %s" % (panelName, ", ".join(toWiden)))
+
+# create the genotype table and (for Multiallelic and Hyperallelic panels) the lookup table of a panel
+# the panel table must already exist
+# note that CREATE TABLE causes an implicit commit in MySQL
+def createGenotypeTables(cnx : connector, panelName : str, panelType : str, ploidy : int):
+	with cnx.cursor() as curs:
+		# create genotype table
+		sqlState = "CREATE TABLE `%s` (ind_id INTEGER UNSIGNED PRIMARY KEY, genotypes MEDIUMBLOB NOT NULL, %s, INDEX (%s), FOREIGN KEY (ind_id) REFERENCES intDBpedigree(ind_id))" % (
+			"intDB" + panelName + "_gt", MODIFIED_DEFINITION, MODIFIED_COLUMN)
+		curs.execute(sqlState)
+		
+		# create lookup table
+		if panelType == "Multiallelic":
+			# define table
+			sqlState = "CREATE TABLE `%s` (locus_id INTEGER UNSIGNED NOT NULL, genotype_id TINYINT UNSIGNED NOT NULL," % ("intDB" + panelName + "_lt")
+			alleleCols = []
+			for i in range(1, ploidy + 1):
+				sqlState += " allele_%s VARCHAR(255) NOT NULL," % i
+				alleleCols += ["allele_%s" % i]
+			sqlState += " FOREIGN KEY (locus_id) REFERENCES %s (intDBlocus_id), PRIMARY KEY (locus_id, genotype_id), INDEX (%s))" % (panelName, ",".join(alleleCols))
+			curs.execute(sqlState)
+		elif panelType == "Hyperallelic":
+			# define table
+			sqlState = """
+			CREATE TABLE `%s` (
+			locus_id INTEGER UNSIGNED NOT NULL, 
+			allele_id TINYINT UNSIGNED NOT NULL, 
+			allele VARCHAR(255) NOT NULL,
+			FOREIGN KEY (locus_id) REFERENCES %s (intDBlocus_id), 
+			PRIMARY KEY (locus_id, allele_id),
+			INDEX (allele))
+			""" % ("intDB" + panelName + "_lt", panelName)
+			curs.execute(sqlState)
@@ -0,0 +1,253 @@
+# panel migration
+# makes a new panel from an existing panel by selecting loci (e.g., dropping failed
+# loci or splitting a panel) and/or re-encoding the genotypes in a different panel type
+# the genotypes are streamed from the old panel in batches on their own connection and
+# run through an importPipeline: encoder threads select and re-encode the codes and pack
+# the new BLOBs, and the writer inserts them and updates the summary tables
+# re-encoding uses a code map built once from the lookup tables: an array of
+# (loci x old codes [x ploidy]) with the new code(s) for each old code of each locus,
+# so a batch is re-encoded with one array lookup
+# supported conversions (besides keeping the same type):
+#   Biallelic -> Multiallelic or Hyperallelic
+#   Multiallelic -> Hyperallelic
+# genotypes are only committed after all individuals are migrated, and the new panel
+# is removed if an error is encountered
+
+import time
+import numpy as np
+import mysql.connector as connector
+from .utils import getPanelInfo, getConnection, removePartialPanel, identifier_syntax_check
+from .genotypeCodec import codeDtype, codesToBlobs, iterGenotypeBatches
+from .genotypeSummaries import createLocusSummaryTables, createIndividualQCTable, locusSummary, individualQC
+from .lookupTables import lookupColumns, newLocusRows, insertLookupRows
+from .panelDefinition import panelColumnTypes, createGenotypeTables
+from .importPipeline import importPipeline
+from .compressedInput import openInputFile
+
+# panel types that each panel type can be converted into
+CONVERSIONS = {"Biallelic" : ("Multiallelic", "Hyperallelic"), "Multiallelic" : ("Hyperallelic",), "Hyperallelic" : ()}
+
+# read a file with one locus name per line
+def readLocusList(fileName : str) -> list:
+	with openInputFile(fileName) as f:
+		return [x.strip() for x in f if x.strip() != ""]
+
+class panelMigration:
+	# loci : locus names to keep, or None to keep all loci. Loci keep their order in the old panel
+	# newType : panel type of the new panel, or None to keep the same type
+	def __init__(self, cnx : connector, userInfo : dict, oldPanel : str, newPanel : str,
+				loci = None, newType : str = None):
+		self.cnx = cnx
+		self.userInfo = userInfo
+		self.oldPanel = oldPanel
+		self.newPanel = newPanel
+		self.oldType, self.ploidy, nLoci = getPanelInfo(cnx, oldPanel)
+		self.newType = self.oldType if newType is None else newType
+		if self.newType != self.oldType and self.newType not in CONVERSIONS[self.oldType]:
+			raise ValueError("A %s panel can't be converted into a %s panel" % (self.oldType, self.newType))
+		if self.newType == "Multiallelic" and self.ploidy + 1 > 255:
+			raise ValueError("Ploidy is too high to store genotypes in a Multiallelic panel")
+		if not identifier_syntax_check(newPanel):
+			raise ValueError("Invalid panel name")
+		with cnx.cursor() as curs:
+			curs.execute("SHOW TABLES")
+			if newPanel in [x[0] for x in curs]:
+				raise ValueError("A table with that name already exists, please pick a different panel name")
+			curs.execute("SELECT intDBlocus_id, intDBlocus_name FROM `%s` ORDER BY intDBlocus_id" % oldPanel)
+			rows = curs.fetchall()
+		self.oldIDs = [x[0] for x in rows]
+		self.names = [x[1] for x in rows]
+		if loci is None:
+			self.keepIdx = np.arange(len(rows), dtype=np.int64)
+		else:
+			loci = set(loci)
+			missing = loci.difference(self.names)
+			if len(missing) > 0:
+				raise ValueError("Locus \"%s\" is not in panel %s" % (next(iter(missing)), oldPanel))
+			self.keepIdx = np.array([i for i in range(0, len(rows)) if self.names[i] in loci], dtype=np.int64)
+		if len(self.keepIdx) == 0:
+			raise ValueError("No loci selected")
+		self.codeMap = None
+		self.cols = None
+
+	# make the panel table, overview row, and genotype, lookup, and summary tables of the new panel
+	# commits (CREATE TABLE causes implicit commits)
+	def createPanel(self, description : str, batchSize : int = 10000):
+		oldCols = panelColumnTypes(self.cnx, self.oldPanel)[0]
+		fromBiallelic = self.oldType == "Biallelic" and self.newType != "Biallelic"
+		keepIDs = [self.oldIDs[i] for i in self.keepIdx]
+		with self.cnx.cursor() as curs:
+			# panel table with the same columns, except that ref and alt alleles become
+			# the list of alleles when converting from Biallelic
+			curs.execute("CREATE TABLE `%s` LIKE `%s`" % (self.newPanel, self.oldPanel))
+			newCols = list(oldCols)
+			if fromBiallelic:
+				newCols = [x for x in oldCols if x not in ("intDBref_allele", "intDBalt_allele")] + ["intDBalleles"]
+				curs.execute("SELECT COALESCE(MAX(CHAR_LENGTH(intDBref_allele) + CHAR_LENGTH(intDBalt_allele)), 0) + 1 FROM `%s`" % self.oldPanel)
+				maxLen = curs.fetchone()[0]
+				curs.execute("ALTER TABLE `%s` DROP COLUMN intDBref_allele, DROP COLUMN intDBalt_allele, ADD COLUMN intDBalleles VARCHAR(%s) NOT NULL AFTER intDBlocus_name" %
+					(self.newPanel, maxLen))
+			sqlState = "INSERT INTO `%s` (%s) VALUES (%s)" % (self.newPanel, ",".join(["`%s`" % x for x in newCols]), ",".join(["%s"] * len(newCols)))
+			selectState = "SELECT intDBlocus_id, %s FROM `%s` WHERE intDBlocus_id IN (%%s)" % (",".join(["`%s`" % x for x in oldCols]), self.oldPanel)
+			for i in range(0, len(keepIDs), batchSize):
+				batchIDs = keepIDs[i:(i + batchSize)]
+				curs.execute(selectState % ",".join(["%s"] * len(batchIDs)), batchIDs)
+				rows = {x[0] : dict(zip(oldCols, x[1:])) for x in curs}
+				if fromBiallelic:
+					for x in rows.values():
+						x["intDBalleles"] = x["intDBref_allele"] + "," + x["intDBalt_allele"]
+				# insert in the order of the old panel so the new intDBlocus_id keep the same order
+				curs.executemany(sqlState, [[rows[x][c] for c in newCols] for x in batchIDs])
+			curs.execute("SELECT intDBlocus_name, intDBlocus_id FROM `%s`" % self.newPanel)
+			newIDs = {x[0] : x[1] for x in curs}
+			self.newIDs = [newIDs[self.names[i]] for i in self.keepIdx]
+
+			# add panel to overall genotype panel information table
+			curs.execute("INSERT INTO intDBgeno_overview VALUES (%s, %s, %s, %s, %s)",
+				(self.newPanel, len(self.keepIdx), self.ploidy, description, self.newType))
+		createGenotypeTables(self.cnx, self.newPanel, self.newType, self.ploidy)
+		with self.cnx.cursor() as curs:
+			if self.newType == self.oldType:
+				self.copyLookupTable(curs, batchSize)
+			else:
+				self.buildCodeMap(curs, batchSize)
+		createLocusSummaryTables(self.cnx, self.newPanel)
+		createIndividualQCTable(self.cnx, self.newPanel)
+		self.cnx.commit()
+
+	# copy the lookup table rows of the kept loci, with the new locus ids
+	def copyLookupTable(self, curs, batchSize : int):
+		if self.newType == "Biallelic":
+			return
+		cols = lookupColumns(self.newType, self.ploidy)
+		newID = dict(zip([self.oldIDs[i] for i in self.keepIdx], self.newIDs))
+		keepIDs = list(newID)
+		for i in range(0, len(keepIDs), batchSize):
+			batchIDs = keepIDs[i:(i + batchSize)]
+			curs.execute("SELECT %s FROM `intDB%s_lt` WHERE locus_id IN (%s)" % (",".join(cols), self.oldPanel, ",".join(["%s"] * len(batchIDs))),
+				batchIDs)
+			rows = [(newID[x[0]],) + tuple(x[1:]) for x in curs]
+			insertLookupRows(curs, self.newPanel, self.newType, self.ploidy, rows, batchSize)
+
+	# make the lookup table of the new panel and the code map from old to new codes
+	def buildCodeMap(self, curs, batchSize : int):
+		nKeep = len(self.keepIdx)
+		width = self.ploidy if self.newType == "Hyperallelic" else 1
+		rows = []
+		if self.oldType == "Biallelic":
+			curs.execute("SELECT intDBref_allele, intDBalt_allele FROM `%s` ORDER BY intDBlocus_id" % self.oldPanel)
+			alleles = curs.fetchall()
+			# old code is the number of copies of the alt allele
+			self.codeMap = np.zeros((nKeep, self.ploidy + 2, width), dtype=np.uint8)
+			for k in range(0, nKeep):
+				ref, alt = alleles[self.keepIdx[k]]
+				locusRows = newLocusRows(self.newIDs[k], [ref, alt], self.newType, self.ploidy)
+				rows += locusRows
+				genoIDs = {x[2:] : x[1] for x in locusRows}
+				for c in range(0, self.ploidy + 1):
+					if self.newType == "Multiallelic":
+						self.codeMap[k, c, 0] = genoIDs[tuple(sorted([ref] * (self.ploidy - c) + [alt] * c))]
+					else:
+						# allele_id 1 is ref and 2 is alt
+						self.codeMap[k, c] = [1] * (self.ploidy - c) + [2] * c
+		else:
+			# Multiallelic to Hyperallelic, old code is genotype_id
+			oldCols = lookupColumns(self.oldType, self.ploidy)
+			genotypes = {}
+			keepIDs = [self.oldIDs[i] for i in self.keepIdx]
+			for i in range(0, len(keepIDs), batchSize):
+				batchIDs = keepIDs[i:(i + batchSize)]
+				curs.execute("SELECT %s FROM `intDB%s_lt` WHERE locus_id IN (%s) ORDER BY locus_id, genotype_id" % (",".join(oldCols), self.oldPanel, ",".join(["%s"] * len(batchIDs))),
+					batchIDs)
+				for x in curs:
+					genotypes.setdefault(x[0], []).append((x[1], x[2:]))
+			self.codeMap = np.zeros((nKeep, 256, width), dtype=np.uint8)
+			for k in range(0, nKeep):
+				locusGenos = genotypes.get(keepIDs[k], [])
+				# alleles in order of first appearance, which is the order they were added to the locus
+				alleleList = list(dict.fromkeys([a for x in locusGenos for a in x[1]]))
+				if len(alleleList) == 0:
+					continue
+				rows += newLocusRows(self.newIDs[k], alleleList, self.newType, self.ploidy)
+				alleleIDs = {alleleList[j] : j + 1 for j in range(0, len(alleleList))}
+				for genoID, geno in locusGenos:
+					# Hyperallelic alleles are stored in the order of their allele strings
+					self.codeMap[k, genoID] = [alleleIDs[a] for a in sorted(geno)]
+		if width == 1:
+			self.codeMap = self.codeMap[:, :, 0]
+		insertLookupRows(curs, self.newPanel, self.newType, self.ploidy, rows, batchSize)
+
+	# new codes from a 2D array of old codes (individuals x codes)
+	def recode(self, codes):
+		if self.codeMap is None:
+			if self.cols is None:
+				if self.oldType == "Hyperallelic":
+					self.cols = (self.keepIdx[:, None] * self.ploidy + np.arange(self.ploidy)).ravel()
+				else:
+					self.cols = self.keepIdx
+			return codes[:, self.cols]
+		newCodes = self.codeMap[np.arange(len(self.keepIdx))[None, :], codes[:, self.keepIdx]]
+		return newCodes.reshape(codes.shape[0], -1).astype(codeDtype(self.newType, self.ploidy), copy=False)
+
+	# migrate the genotypes of all individuals
+	# progress : optional function called in this thread after each batch is read with
+	#   (number of individuals read, individuals per second)
+	# commits after all individuals are migrated
+	# returns (number of individuals, seconds taken)
+	def migrateGenotypes(self, batchSize : int = 1000, nEncoders : int = 2, progress = None):
+		summary = locusSummary(self.cnx, self.newPanel)
+		indQC = individualQC(self.newPanel)
+		start = time.perf_counter()
+		nInds = 0
+
+		# encoder stage: select and re-encode codes, and pack BLOBs
+		def encode(batch):
+			indIDs, codes = batch
+			codes = self.recode(codes)
+			called, het = summary.calledHet(codes)
+			return (indIDs, codes, called, het, codesToBlobs(codes, self.newType, self.ploidy))
+
+		# reader stage, on its own connection b/c the cursor stays open while iterating
+		def read(cnxRead):
+			nonlocal nInds
+			for indIDs, codes in iterGenotypeBatches(cnxRead, self.oldPanel, batchSize):
+				yield (indIDs, codes)
+				nInds += len(indIDs)
+				if progress is not None:
+					progress(nInds, nInds / max(time.perf_counter() - start, 1e-9))
+
+		cnxRead = getConnection(self.userInfo)
+		try:
+			with self.cnx.cursor() as curs:
+				sqlState = "INSERT INTO `intDB%s_gt` (ind_id, genotypes) VALUES (%%s, %%s)" % self.newPanel
+				# writer stage: add the batch to the summaries and the database
+				def write(encoded):
+					indIDs, codes, called, het, blobs = encoded
+					summary.add(codes, calledHet = (called, het))
+					indQC.add(indIDs, called, het)
+					curs.executemany(sqlState, [(int(indIDs[i]), blobs[i]) for i in range(0, len(blobs))])
+
+				pipeline = importPipeline(encode, write, nEncoders = nEncoders)
+				pipeline.run(read(cnxRead))
+				summary.flush(curs)
+				indQC.flush(curs)
+			self.cnx.commit()
+		finally:
+			cnxRead.close()
+		return (nInds, time.perf_counter() - start)
+
+# make a new panel from an existing panel, see panelMigration
+# on error, the new panel is removed and the error is re-raised
+# returns (number of loci, number of individuals, seconds taken)
+def migratePanel(cnx : connector, userInfo : dict, oldPanel : str, newPanel : str, loci = None,
+				newType : str = None, description : str = "", batchSize : int = 1000, nEncoders : int = 2,
+				progress = None):
+	migration = panelMigration(cnx, userInfo, oldPanel, newPanel, loci, newType)
+	try:
+		migration.createPanel(description)
+		nInds, seconds = migration.migrateGenotypes(batchSize, nEncoders, progress)
+	except BaseException:
+		cnx.rollback() # release locks before removing the tables
+		removePartialPanel(userInfo, newPanel)
+		raise
+	return (len(migration.keepIdx), nInds, seconds)
@@ -0,0 +1,294 @@
+# parentage assignment with genotypes of a Biallelic panel
+# offspring are compared to candidate sires and dams by counting Mendelian exclusions:
+# loci where the offspring genotype can't be produced by the parent (single parent
+# exclusions) or by the sire and dam together (trio exclusions)
+# genotypes are numbers of alt allele copies, so for ploidy p (even) a parent with c copies
+# passes k = max(0, p/2 - (p - c)), ..., min(p/2, c) copies to an offspring
+#   single parent: for each offspring code b, the parent codes that exclude it are a set S_b,
+#     so exclusions for all offspring x candidate pairs are sum_b [offspring == b] @ [candidate in S_b]^T,
+#     computed with BLAS matrix multiplies over blocks of offspring and loci
+#   trio: the best nTop sires and dams of each offspring by single parent exclusion rate are
+#     combined and the trios are checked with a lookup table of (sire, dam, offspring) codes,
+#     in blocks of offspring spread over a thread pool
+# loci missing in either (any) individual are not compared
+# results are stored in intDBparentage (one row per offspring and panel), and can optionally
+# be used to fill in sires and dams that are not entered in the pedigree
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as connector
+from .utils import getPanelInfo
+from .genotypeCodec import getGenotypeCodes
+
+# range of alt allele copies a parent with c copies can pass on, as arrays (low, high) for c = 0, ..., ploidy
+def gameteRange(ploidy : int):
+	h = ploidy // 2
+	c = np.arange(0, ploidy + 1)
+	return (np.maximum(0, h - (ploidy - c)), np.minimum(h, c))
+
+# boolean array [parent code, offspring code], True if the parent excludes the offspring
+# missing codes (ploidy + 1) never exclude
+def exclusionTable(ploidy : int):
+	low, high = gameteRange(ploidy)
+	o = np.arange(0, ploidy + 1)
+	table = np.zeros((ploidy + 2, ploidy + 2), dtype=bool)
+	table[:(ploidy + 1), :(ploidy + 1)] = (o[None, :] < low[:, None]) | (o[None, :] > high[:, None] + ploidy // 2)
+	return table
+
+# boolean array [sire code, dam code, offspring code], True if the parents exclude the offspring
+# missing codes (ploidy + 1) never exclude
+def trioTable(ploidy : int):
+	low, high = gameteRange(ploidy)
+	o = np.arange(0, ploidy + 1)
+	table = np.zeros((ploidy + 2, ploidy + 2, ploidy + 2), dtype=bool)
+	table[:(ploidy + 1), :(ploidy + 1), :(ploidy + 1)] = ((o[None, None, :] < (low[:, None] + low[None, :])[:, :, None]) |
+		(o[None, None, :] > (high[:, None] + high[None, :])[:, :, None]))
+	return table
+
+# recorded sire and dam of individuals
+# returns dictionary of key = ind_id, value = (sire, dam), with None for unknown (0 or NULL)
+def getRecordedParents(cnx : connector, indIDs, batchSize : int = 10000) -> dict:
+	indIDs = [int(x) for x in indIDs]
+	parents = {}
+	with cnx.cursor() as curs:
+		for i in range(0, len(indIDs), batchSize):
+			batchIDs = indIDs[i:(i + batchSize)]
+			curs.execute("SELECT ind_id, sire, dam FROM intDBpedigree WHERE ind_id IN (%s)" % ",".join(["%s"] * len(batchIDs)), batchIDs)
+			for x in curs:
+				parents[x[0]] = (x[1] or None, x[2] or None)
+	return parents
+
+# individuals recorded as a sire (or dam) of any individual in the pedigree
+# returns (list of sire ind_id, list of dam ind_id)
+def getPedigreeParents(cnx : connector):
+	with cnx.cursor() as curs:
+		curs.execute("SELECT DISTINCT sire FROM intDBpedigree WHERE sire IS NOT NULL AND sire != 0")
+		sires = [x[0] for x in curs]
+		curs.execute("SELECT DISTINCT dam FROM intDBpedigree WHERE dam IS NOT NULL AND dam != 0")
+		dams = [x[0] for x in curs]
+	return (sires, dams)
+
+# single parent exclusions and loci compared for all offspring x candidate pairs
+# returns two float32 arrays (offspring x candidates), exact for counts < 2^24
+def singleParentExclusions(offCodes, candCodes, ploidy : int, blockSize : int = 2048, lociBlock : int = 4096):
+	table = exclusionTable(ploidy)
+	miss = ploidy + 1
+	excl = np.zeros((offCodes.shape[0], candCodes.shape[0]), dtype=np.float32)
+	compared = np.zeros((offCodes.shape[0], candCodes.shape[0]), dtype=np.float32)
+	for l in range(0, offCodes.shape[1], lociBlock):
+		cand = candCodes[:, l:(l + lociBlock)]
+		# candidate indicators for each offspring code
+		candExcl = [table[cand, b].astype(np.float32) for b in range(0, ploidy + 1)]
+		candCalled = (cand != miss).astype(np.float32)
+		for i in range(0, offCodes.shape[0], blockSize):
+			off = offCodes[i:(i + blockSize), l:(l + lociBlock)]
+			for b in range(0, ploidy + 1):
+				excl[i:(i + blockSize)] += (off == b).astype(np.float32) @ candExcl[b].T
+			compared[i:(i + blockSize)] += (off != miss).astype(np.float32) @ candCalled.T
+	return (excl, compared)
+
+# find the best sire and dam of each offspring
+# offspring, sires, dams : ind_id of offspring and candidate parents
+#   recorded parents of the offspring are added to the candidates
+# nTop : number of best sires and dams (by single parent exclusion rate) combined into trios
+# minCompared : minimum proportion of loci compared for a candidate to be considered
+# returns list of dicts with keys: ind_id, sire, dam, sire_exclusions, sire_compared, dam_exclusions,
+#   dam_compared, trio_exclusions, trio_compared, recorded_sire, recorded_sire_exclusions,
+#   recorded_dam, recorded_dam_exclusions (None where not available)
+def assignParents(cnx : connector, panelName : str, offspring, sires, dams, nTop : int = 3,
+					minCompared : float = 0.5, nThreads : int = 4, batchSize : int = 1000):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	if panelType != "Biallelic":
+		raise ValueError("Parentage assignment is only available for Biallelic panels")
+	if ploidy % 2 != 0:
+		raise ValueError("Parentage assignment is only available for even ploidy")
+	recorded = getRecordedParents(cnx, offspring)
+	sires = set([int(x) for x in sires] + [x[0] for x in recorded.values() if x[0] is not None])
+	dams = set([int(x) for x in dams] + [x[1] for x in recorded.values() if x[1] is not None])
+	ids, codes = getGenotypeCodes(cnx, panelName, set([int(x) for x in offspring]) | sires | dams, batchSize)
+	rowOf = {ids[k] : k for k in range(0, len(ids))}
+	offIDs = np.array([x for x in sorted(set([int(x) for x in offspring])) if x in rowOf], dtype=np.int64)
+	sireIDs = np.array([x for x in sorted(sires) if x in rowOf], dtype=np.int64)
+	damIDs = np.array([x for x in sorted(dams) if x in rowOf], dtype=np.int64)
+	offCodes = codes[[rowOf[x] for x in offIDs]]
+	sireCodes = codes[[rowOf[x] for x in sireIDs]]
+	damCodes = codes[[rowOf[x] for x in damIDs]]
+	del codes
+
+	# single parent exclusion rates, an individual can't be its own parent
+	def rates(candIDs, candCodes):
+		excl, compared = singleParentExclusions(offCodes, candCodes, ploidy)
+		with np.errstate(invalid="ignore", divide="ignore"):
+			rate = excl / compared
+		rate[(compared < minCompared * nLoci) | (offIDs[:, None] == candIDs[None, :])] = np.inf
+		return (excl, compared, rate)
+	sireExcl, sireComp, sireRate = rates(sireIDs, sireCodes)
+	damExcl, damComp, damRate = rates(damIDs, damCodes)
+	topSires = np.argsort(sireRate, axis=1, kind="stable")[:, :nTop]
+	topDams = np.argsort(damRate, axis=1, kind="stable")[:, :nTop]
+
+	# trios of the top candidates
+	trio = trioTable(ploidy)
+	miss = ploidy + 1
+	def trioBlock(start):
+		end = min(start + 256, len(offIDs))
+		best = []
+		for i in range(start, end):
+			s = topSires[i][np.isfinite(sireRate[i, topSires[i]])]
+			d = topDams[i][np.isfinite(damRate[i, topDams[i]])]
+			if len(s) == 0 or len(d) == 0:
+				best += [None]
+				continue
+			sc = sireCodes[s][:, None, :]
+			dc = damCodes[d][None, :, :]
+			oc = offCodes[i][None, None, :]
+			excl = trio[sc, dc, oc].sum(axis=2)
+			compared = ((sc != miss) & (dc != miss) & (oc != miss)).sum(axis=2)
+			with np.errstate(invalid="ignore", divide="ignore"):
+				rate = np.where(compared > 0, excl / np.maximum(compared, 1), np.inf)
+			k = np.unravel_index(np.argmin(rate), rate.shape)
+			best += [(s[k[0]], d[k[1]], int(excl[k]), int(compared[k]))]
+		return best
+	with ThreadPoolExecutor(max_workers=max(1, nThreads)) as pool:
+		trios = [x for block in pool.map(trioBlock, range(0, len(offIDs), 256)) for x in block]
+
+	sireCol = {sireIDs[k] : k for k in range(0, len(sireIDs))}
+	damCol = {damIDs[k] : k for k in range(0, len(damIDs))}
+	results = []
+	for i in range(0, len(offIDs)):
+		res = dict.fromkeys(["sire", "dam", "sire_exclusions", "sire_compared", "dam_exclusions", "dam_compared",
+			"trio_exclusions", "trio_compared", "recorded_sire_exclusions", "recorded_dam_exclusions"])
+		res["ind_id"] = int(offIDs[i])
+		if trios[i] is not None:
+			s, d, res["trio_exclusions"], res["trio_compared"] = trios[i]
+		else:
+			# no trio, best single parents
+			s = topSires[i][0] if len(sireIDs) > 0 and np.isfinite(sireRate[i, topSires[i][0]]) else None
+			d = topDams[i][0] if len(damIDs) > 0 and np.isfinite(damRate[i, topDams[i][0]]) else None
+		if s is not None:
+			res["sire"], res["sire_exclusions"], res["sire_compared"] = int(sireIDs[s]), int(sireExcl[i, s]), int(sireComp[i, s])
+		if d is not None:
+			res["dam"], res["dam_exclusions"], res["dam_compared"] = int(damIDs[d]), int(damExcl[i, d]), int(damComp[i, d])
+		res["recorded_sire"], res["recorded_dam"] = recorded.get(res["ind_id"], (None, None))
+		if res["recorded_sire"] in sireCol:
+			res["recorded_sire_exclusions"] = int(sireExcl[i, sireCol[res["recorded_sire"]]])
+		if res["recorded_dam"] in damCol:
+			res["recorded_dam_exclusions"] = int(damExcl[i, damCol[res["recorded_dam"]]])
+		results += [res]
+	return results
+
+# store results of assignParents in intDBparentage, replacing previous results for the panel
+# updatePedigree : fill in sires and dams that are not entered (NULL) in the pedigree with
+#   the assigned parents of trios with a trio exclusion rate <= maxTrioRate
+# commits
+def writeParentage(cnx : connector, panelName : str, results : list, updatePedigree : bool = False,
+					maxTrioRate : float = 0.01, batchSize : int = 10000):
+	cols = ["sire", "dam", "sire_exclusions", "sire_compared", "dam_exclusions", "dam_compared", "trio_exclusions", "trio_compared"]
+	with cnx.cursor() as curs:
+		curs.execute("""
+		CREATE TABLE IF NOT EXISTS intDBparentage (
+		ind_id INTEGER UNSIGNED NOT NULL,
+		panel_name VARCHAR(64) NOT NULL,
+		sire INTEGER UNSIGNED,
+		dam INTEGER UNSIGNED,
+		sire_exclusions INTEGER UNSIGNED,
+		sire_compared INTEGER UNSIGNED,
+		dam_exclusions INTEGER UNSIGNED,
+		dam_compared INTEGER UNSIGNED,
+		trio_exclusions INTEGER UNSIGNED,
+		trio_compared INTEGER UNSIGNED,
+		PRIMARY KEY (ind_id, panel_name),
+		FOREIGN KEY (ind_id) REFERENCES intDBpedigree(ind_id))
+		""")
+		rows = [[x["ind_id"], panelName] + [x[c] for c in cols] for x in results]
+		sqlState = "REPLACE INTO intDBparentage (ind_id, panel_name, %s) VALUES (%s)" % (",".join(cols), ",".join(["%s"] * (len(cols) + 2)))
+		for i in range(0, len(rows), batchSize):
+			curs.executemany(sqlState, rows[i:(i + batchSize)])
+		if updatePedigree:
+			assigned = [x for x in results if x["trio_compared"] and x["trio_exclusions"] <= maxTrioRate * x["trio_compared"]]
+			for parent in ("sire", "dam"):
+				rows = [(x[parent], x["ind_id"]) for x in assigned]
+				for i in range(0, len(rows), batchSize):
+					curs.executemany("UPDATE intDBpedigree SET %s = %%s WHERE ind_id = %%s AND %s IS NULL" % (parent, parent), rows[i:(i + batchSize)])
+	cnx.commit()
+
+# write results of assignParents to a tab delimited file, with individual names
+def writeParentageReport(results : list, names : dict, fileName : str):
+	cols = ["sire", "dam", "sire_exclusions", "sire_compared", "dam_exclusions", "dam_compared", "trio_exclusions", "trio_compared",
+		"recorded_sire", "recorded_sire_exclusions", "recorded_dam", "recorded_dam_exclusions"]
+	nameCols = ("sire", "dam", "recorded_sire", "recorded_dam")
+	with open(fileName, "w") as fout:
+		fout.write("\t".join(["ind"] + cols) + "\n")
+		for x in results:
+			values = [names.get(x["ind_id"])] + [names.get(x[c]) if c in nameCols else x[c] for c in cols]
+			fout.write("\t".join(["NA" if v is None else str(v) for v in values]) + "\n")
+
+# Mendelian consistency of genotypes being imported with the stored genotypes of their recorded parents
+# parents are those entered in the pedigree for the individuals being imported, and their
+# genotypes are read from the panel in batches when the check is made (so parents imported
+# in the same file are not checked against)
+# count() is thread safe and can be called from the encoder stage of an import
+class mendelianCheck:
+	# indIDs : ind_id of the individuals being imported
+	def __init__(self, cnx : connector, panelName : str, indIDs, batchSize : int = 1000):
+		panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+		if panelType != "Biallelic":
+			raise ValueError("Mendelian checks are only available for Biallelic panels")
+		if ploidy % 2 != 0:
+			raise ValueError("Mendelian checks are only available for even ploidy")
+		self.parents = getRecordedParents(cnx, indIDs)
+		parentIDs = set([y for x in self.parents.values() for y in x if y is not None])
+		ids, codes = getGenotypeCodes(cnx, panelName, parentIDs, batchSize)
+		# last row is all missing, used for parents that are not known or not genotyped
+		self.codes = np.full((len(ids) + 1, nLoci), ploidy + 1, dtype=np.uint8)
+		self.codes[:len(ids)] = codes
+		self.rowOf = {ids[k] : k for k in range(0, len(ids))}
+		self.nGenotyped = len(ids)
+		# genotypes of a trio are combined into one index, (sire * m + dam) * m + offspring,
+		# so each individual's errors come from a histogram of its indices
+		self.m = ploidy + 2
+		self.indexType = np.uint8 if self.m ** 3 <= 256 else np.uint16
+		single = exclusionTable(ploidy)
+		trio = trioTable(ploidy)
+		s, d, o = np.meshgrid(np.arange(self.m), np.arange(self.m), np.arange(self.m), indexing="ij")
+		miss = self.m - 1
+		# columns of self.stats, rows are the index values
+		self.statNames = ["sire_errors", "sire_compared", "dam_errors", "dam_compared", "trio_errors", "trio_compared"]
+		self.stats = np.stack([single[s, o], (s != miss) & (o != miss), single[d, o], (d != miss) & (o != miss),
+			trio, (s != miss) & (d != miss) & (o != miss)], axis=-1).reshape(self.m ** 3, len(self.statNames)).astype(np.int64)
+
+	# rows of self.codes of the sire and dam of each individual
+	def parentRows(self, indIDs):
+		none = len(self.codes) - 1
+		rows = [self.parents.get(x, (None, None)) for x in indIDs]
+		return (np.array([self.rowOf.get(x[0], none) for x in rows], dtype=np.int64),
+			np.array([self.rowOf.get(x[1], none) for x in rows], dtype=np.int64))
+
+	# count Mendelian errors of individuals (codes: individuals x loci)
+	# returns dict of arrays (one value per individual) with keys sire_errors, sire_compared,
+	#   dam_errors, dam_compared, trio_errors, trio_compared, and checked (True if a parent is genotyped)
+	def count(self, indIDs, codes):
+		sireRows, damRows = self.parentRows(indIDs)
+		none = len(self.codes) - 1
+		index = self.codes[sireRows].astype(self.indexType)
+		index *= self.m
+		index += self.codes[damRows]
+		index *= self.m
+		index += codes
+		hist = np.zeros((len(indIDs), self.m ** 3), dtype=np.int64)
+		for i in range(0, len(indIDs)):
+			hist[i] = np.bincount(index[i], minlength=self.m ** 3)
+		stats = hist @ self.stats
+		res = {self.statNames[k] : stats[:, k] for k in range(0, len(self.statNames))}
+		res["checked"] = (sireRows != none) | (damRows != none)
+		return res
+
+	# Mendelian error rate of each individual from the results of count()
+	# trio error rate if both parents are genotyped, otherwise the single parent error rate
+	# nan if no loci were compared
+	@staticmethod
+	def errorRate(res):
+		errors = np.where(res["trio_compared"] > 0, res["trio_errors"], res["sire_errors"] + res["dam_errors"])
+		compared = np.where(res["trio_compared"] > 0, res["trio_compared"], res["sire_compared"] + res["dam_compared"])
+		with np.errstate(invalid="ignore", divide="ignore"):
+			return errors / compared
@@ -0,0 +1,121 @@
+# export of decoded genotypes of a panel to Parquet files for columnar tools
+# one row per genotyped individual with columns ind_id, ind, and one column per locus
+#   Biallelic: uint8 alt allele copies
+#   Multiallelic: dictionary encoded genotypes (alleles separated by "/")
+#   Hyperallelic: ploidy dictionary encoded allele columns per locus (<locus>_1, <locus>_2, ...)
+#   missing genotypes are null
+# the BLOBs are decoded a batch at a time (genotypeCodec.blobsToCodes) and each batch of codes is turned
+# into an Arrow record batch directly from numpy arrays: codes are remapped to dictionary indices with one
+# lookup per batch and each column is built from a contiguous row of the transposed batch with a null mask
+# output is a directory of files (part-00000.parquet, ...) with up to rowsPerFile individuals each and
+# one row group per batch, the directory must not already contain part files
+# pyarrow is an optional dependency, only needed for this export
+
+import os
+import glob
+import numpy as np
+import mysql.connector as connector
+from .utils import getPanelInfo, getLocusIDsInBlob
+from .genotypeCodec import missingCode, blobsToCodes
+from .rowVersions import requireRowVersions, changedSince
+
+# dictionaries of the loci of a Multiallelic or Hyperallelic panel
+# returns (list (one per locus) of dictionary values, array of dictionary index (-1 for missing) [locus, code])
+def parquetDictionaries(cnx : connector, panelName : str):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	locusPos = {x : i for i, x in enumerate(getLocusIDsInBlob(cnx, panelName))}
+	values = [[] for j in range(0, nLoci)]
+	remap = np.full((nLoci, 256), -1, dtype=np.int16)
+	with cnx.cursor() as curs:
+		if panelType == "Multiallelic":
+			curs.execute("SELECT locus_id, genotype_id, %s FROM `intDB%s_lt` ORDER BY locus_id, genotype_id" %
+				(",".join(["allele_%s" % i for i in range(1, ploidy + 1)]), panelName))
+			entries = [(locusPos[x[0]], x[1], "/".join(x[2:])) for x in curs]
+		else:
+			curs.execute("SELECT locus_id, allele_id, allele FROM `intDB%s_lt` ORDER BY locus_id, allele_id" % panelName)
+			entries = [(locusPos[x[0]], x[1], x[2]) for x in curs]
+	for j, code, value in entries:
+		remap[j, code] = len(values[j])
+		values[j] += [value]
+	remap[:, missingCode(panelType, ploidy)] = -1
+	return (values, remap)
+
+# write the genotypes of a panel to a directory of Parquet files
+# since : only individuals with genotypes changed since a watermark (see rowVersions)
+# returns number of individuals written
+def writeParquet(cnx : connector, panelName : str, directory : str, rowsPerFile : int = 100000, batchSize : int = 1000,
+				compression : str = "zstd", progress = None, since : str = None) -> int:
+	# optional dependency, only needed for Parquet export
+	try:
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+	except ImportError:
+		raise RuntimeError("The pyarrow package is required to write Parquet files")
+	if rowsPerFile < 1 or batchSize < 1:
+		raise ValueError("rowsPerFile and batchSize must be at least 1")
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	miss = missingCode(panelType, ploidy)
+	with cnx.cursor() as curs:
+		curs.execute("SELECT intDBlocus_name FROM `%s` ORDER BY intDBlocus_id" % panelName)
+		loci = [x[0] for x in curs]
+	# schema and the locus index of each column of codes
+	fields = [pa.field("ind_id", pa.uint32(), nullable=False), pa.field("ind", pa.string(), nullable=False)]
+	if panelType == "Biallelic":
+		fields += [pa.field(x, pa.uint8()) for x in loci]
+		locusIndex = np.arange(nLoci)
+	else:
+		values, remap = parquetDictionaries(cnx, panelName)
+		dictionaries = [pa.array(x, type=pa.string()) for x in values]
+		if panelType == "Multiallelic":
+			fields += [pa.field(x, pa.dictionary(pa.int16(), pa.string())) for x in loci]
+			locusIndex = np.arange(nLoci)
+		else:
+			fields += [pa.field("%s_%s" % (x, k), pa.dictionary(pa.int16(), pa.string())) for x in loci for k in range(1, ploidy + 1)]
+			locusIndex = np.repeat(np.arange(nLoci), ploidy)
+	schema = pa.schema(fields)
+	where = ""
+	params = []
+	if since is not None:
+		requireRowVersions(cnx, ["intDB%s_gt" % panelName])
+		condition, params = changedSince(["g"], since)
+		where = "WHERE " + condition
+	# part files of an earlier export would be mixed with (or partly replaced by) this one
+	if os.path.isdir(directory) and len(glob.glob(os.path.join(glob.escape(directory), "part-*.parquet"))) > 0:
+		raise ValueError("%s already contains Parquet files, choose an empty directory" % directory)
+	os.makedirs(directory, exist_ok=True)
+	n = 0
+	nFile = 0
+	writer = None
+	try:
+		with cnx.cursor() as curs:
+			curs.execute("SELECT g.ind_id, p.ind, g.genotypes FROM `intDB%s_gt` AS g INNER JOIN intDBpedigree AS p ON g.ind_id = p.ind_id %s ORDER BY g.ind_id" %
+				(panelName, where), params)
+			# batches never cross a file boundary
+			rows = curs.fetchmany(min(batchSize, rowsPerFile))
+			while rows:
+				# codes x individuals, so that each column is contiguous
+				codes = np.ascontiguousarray(blobsToCodes([x[2] for x in rows], panelType, ploidy, nLoci).T)
+				arrays = [pa.array(np.array([x[0] for x in rows], dtype=np.uint32)), pa.array([x[1] for x in rows], type=pa.string())]
+				if panelType == "Biallelic":
+					isMissing = codes == miss
+					arrays += [pa.array(codes[j], type=pa.uint8(), mask=isMissing[j]) for j in range(0, codes.shape[0])]
+				else:
+					indices = remap[locusIndex[:, None], codes]
+					isMissing = indices < 0
+					arrays += [pa.DictionaryArray.from_arrays(pa.array(indices[j], mask=isMissing[j]), dictionaries[locusIndex[j]])
+						for j in range(0, codes.shape[0])]
+				if writer is None:
+					writer = pq.ParquetWriter(os.path.join(directory, "part-%05d.parquet" % nFile), schema, compression=compression)
+				writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+				n += len(rows)
+				if n >= (nFile + 1) * rowsPerFile:
+					writer.close()
+					writer = None
+					nFile += 1
+				if progress is not None:
+					progress(n)
+				rows = curs.fetchmany(min(batchSize, (nFile + 1) * rowsPerFile - n))
+	finally:
+		if writer is not None:
+			writer.close()
+	return n
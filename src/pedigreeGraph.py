@@ -0,0 +1,262 @@
+# pedigree as a graph of int32 parent arrays
+# individuals are stored by position in order of ind_id, with the position of the sire and dam
+# of each individual (-1 for unknown: 0, NULL, or an ind_id not in the pedigree)
+# the arrays are cached in the interface_db folder and reloaded if the pedigree has not changed
+# (checked with a checksum computed by the server)
+# inbreeding coefficients use the algorithm of Meuwissen and Luo (1992): with A = T D T', where
+# T_i = (T_sire + T_dam) / 2 + e_i and D is the within family variance (depends on the
+# inbreeding of the parents), F_i = sum_j T_ij^2 D_j - 1 over the ancestors j of i
+# the rows of T are computed for all individuals of a generation at once as (row, ancestor, value)
+# arrays, expanded from the youngest ancestors to the oldest so that every ancestor's value is
+# complete when it is passed on to its parents. Full sibs share one row.
+
+import os
+import hashlib
+import numpy as np
+import mysql.connector as connector
+from . import PACKAGEDIR
+
+# checksum of the pedigree table, changes if any individual, sire, or dam changes
+def pedigreeChecksum(cnx : connector):
+	with cnx.cursor() as curs:
+		curs.execute("SELECT COUNT(*), MAX(ind_id), BIT_XOR(CRC32(CONCAT_WS(',', ind_id, IFNULL(sire, 0), IFNULL(dam, 0)))) FROM intDBpedigree")
+		return ",".join([str(x) for x in curs.fetchone()])
+
+# file the pedigree of a database is cached in
+def pedigreeCacheFile(host : str, dbName : str) -> str:
+	return os.path.join(PACKAGEDIR, "interface_db", "pedigree_%s.npz" % hashlib.sha1(("%s/%s" % (host, dbName)).encode()).hexdigest())
+
+# load the pedigree of the database cnx is connected to
+# useCache : use (and update) the locally cached pedigree
+def loadPedigree(cnx : connector, useCache : bool = True, batchSize : int = 100000):
+	checksum = pedigreeChecksum(cnx)
+	cacheFile = pedigreeCacheFile(cnx.server_host, cnx.database)
+	if useCache and os.path.exists(cacheFile):
+		with np.load(cacheFile) as f:
+			if str(f["checksum"]) == checksum:
+				ped = pedigreeGraph(f["ind_id"], f["sire"], f["dam"], positions=True)
+				if "inbreeding" in f:
+					ped.F = f["inbreeding"]
+				ped.checksum = checksum
+				ped.cacheFile = cacheFile
+				return ped
+	indIDs = []
+	sires = []
+	dams = []
+	with cnx.cursor() as curs:
+		curs.execute("SELECT ind_id, IFNULL(sire, 0), IFNULL(dam, 0) FROM intDBpedigree ORDER BY ind_id")
+		rows = curs.fetchmany(batchSize)
+		while rows:
+			x = np.array(rows, dtype=np.int64)
+			indIDs += [x[:, 0]]
+			sires += [x[:, 1]]
+			dams += [x[:, 2]]
+			rows = curs.fetchmany(batchSize)
+	if len(indIDs) == 0:
+		ped = pedigreeGraph(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+	else:
+		ped = pedigreeGraph(np.concatenate(indIDs), np.concatenate(sires), np.concatenate(dams))
+	ped.checksum = checksum
+	if useCache:
+		ped.cacheFile = cacheFile
+		ped.save()
+	return ped
+
+class pedigreeGraph:
+	# indIDs : ind_id of each individual, sorted
+	# sire, dam : ind_id of the parents (0 for unknown), or positions (-1 for unknown) if positions is True
+	def __init__(self, indIDs, sire, dam, positions : bool = False):
+		self.indIDs = np.asarray(indIDs, dtype=np.int64)
+		if positions:
+			self.sire = np.asarray(sire, dtype=np.int32)
+			self.dam = np.asarray(dam, dtype=np.int32)
+		else:
+			self.sire = self.positions(sire)
+			self.dam = self.positions(dam)
+		self.n = len(self.indIDs)
+		self.F = None
+		self.checksum = None
+		self.cacheFile = None
+		self.order()
+
+	# write the pedigree (and inbreeding coefficients if computed) to the cache file
+	def save(self):
+		if self.cacheFile is None:
+			return
+		if not os.path.isdir(os.path.dirname(self.cacheFile)):
+			os.mkdir(os.path.dirname(self.cacheFile))
+		arrays = {"ind_id" : self.indIDs, "sire" : self.sire, "dam" : self.dam, "checksum" : np.array(self.checksum)}
+		if self.F is not None:
+			arrays["inbreeding"] = self.F
+		# write to a temporary file so an interrupted save doesn't leave a broken cache
+		tempFile = self.cacheFile + ".tmp.npz"
+		np.savez(tempFile, **arrays)
+		os.replace(tempFile, self.cacheFile)
+
+	# positions of ind_id (-1 for those not in the pedigree)
+	def positions(self, indIDs):
+		indIDs = np.asarray(indIDs, dtype=np.int64)
+		if len(self.indIDs) == 0:
+			return np.full(len(indIDs), -1, dtype=np.int32)
+		pos = np.minimum(np.searchsorted(self.indIDs, indIDs), len(self.indIDs) - 1)
+		return np.where(self.indIDs[pos] == indIDs, pos, -1).astype(np.int32)
+
+	# generation number of each individual (0 for founders, otherwise 1 + generation of the
+	# younger parent) and the children of each individual (CSR arrays childStart, children)
+	def order(self):
+		gen = np.zeros(self.n + 1, dtype=np.int32)
+		gen[self.n] = -1 # unknown parent
+		sire = np.where(self.sire < 0, self.n, self.sire)
+		dam = np.where(self.dam < 0, self.n, self.dam)
+		for i in range(0, self.n + 1):
+			newGen = np.maximum(gen[sire], gen[dam]) + 1
+			if np.array_equal(newGen, gen[:self.n]):
+				break
+			gen[:self.n] = newGen
+		else:
+			raise ValueError("The pedigree has an individual that is its own ancestor")
+		self.gen = gen[:self.n]
+		parents = np.concatenate([self.sire, self.dam])
+		children = np.concatenate([np.arange(self.n, dtype=np.int32)] * 2)
+		keep = parents >= 0
+		parents = parents[keep]
+		children = children[keep]
+		o = np.argsort(parents, kind="stable")
+		self.children = children[o]
+		self.childStart = np.concatenate([[0], np.cumsum(np.bincount(parents, minlength=self.n))]).astype(np.int64)
+
+	# positions of the ancestors (maxGenerations = None) or descendants of positions pos
+	# not including pos, unless an individual is an ancestor (descendant) of another in pos
+	def traverse(self, pos, up : bool, maxGenerations : int = None):
+		found = np.zeros(self.n, dtype=bool)
+		frontier = np.unique(np.asarray(pos, dtype=np.int64))
+		frontier = frontier[frontier >= 0]
+		g = 0
+		while len(frontier) > 0 and (maxGenerations is None or g < maxGenerations):
+			if up:
+				nxt = np.concatenate([self.sire[frontier], self.dam[frontier]])
+				nxt = nxt[nxt >= 0]
+			else:
+				start = self.childStart[frontier]
+				count = self.childStart[frontier + 1] - start
+				# indices into children of each frontier individual's range
+				offsets = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+				nxt = self.children[np.repeat(start, count) + offsets]
+			nxt = np.unique(nxt)
+			nxt = nxt[~found[nxt]]
+			found[nxt] = True
+			frontier = nxt
+			g += 1
+		return np.nonzero(found)[0]
+
+	# ind_id of the ancestors of individuals, up to maxGenerations back (None for all)
+	def ancestors(self, indIDs, maxGenerations : int = None):
+		return self.indIDs[self.traverse(self.positions(indIDs), True, maxGenerations)]
+
+	# ind_id of the descendants of individuals, up to maxGenerations forward (None for all)
+	def descendants(self, indIDs, maxGenerations : int = None):
+		return self.indIDs[self.traverse(self.positions(indIDs), False, maxGenerations)]
+
+	# within family variance (diagonal of D) of positions pos, the inbreeding of their parents must be known
+	def withinFamilyVariance(self, pos, F):
+		s = self.sire[pos]
+		d = self.dam[pos]
+		Fs = np.where(s >= 0, F[s], -1.0)
+		Fd = np.where(d >= 0, F[d], -1.0)
+		# unknown parents count as F = -1, giving 1 with no known parents and 0.75 - F / 4 with one
+		return 0.5 - 0.25 * (Fs + Fd)
+
+	# rows of T for positions pos, as arrays (row, ancestor position, value) including each individual itself
+	def tRows(self, pos):
+		rows = np.arange(len(pos), dtype=np.int64)
+		cols = np.asarray(pos, dtype=np.int64)
+		vals = np.ones(len(pos), dtype=np.float64)
+		outRows = []
+		outCols = []
+		outVals = []
+		while len(rows) > 0:
+			# all contributions to the entries of the youngest generation are made, so they are complete
+			level = self.gen[cols].max()
+			atLevel = self.gen[cols] == level
+			key = rows[atLevel] * self.n + cols[atLevel]
+			key, inverse = np.unique(key, return_inverse=True)
+			v = np.bincount(inverse, weights=vals[atLevel])
+			r = key // self.n
+			c = key % self.n
+			outRows += [r]
+			outCols += [c]
+			outVals += [v]
+			# pass half of each value to each known parent
+			s = self.sire[c]
+			d = self.dam[c]
+			rows = np.concatenate([rows[~atLevel], r[s >= 0], r[d >= 0]])
+			cols = np.concatenate([cols[~atLevel], s[s >= 0], d[d >= 0]])
+			vals = np.concatenate([vals[~atLevel], 0.5 * v[s >= 0], 0.5 * v[d >= 0]])
+		return (np.concatenate(outRows), np.concatenate(outCols), np.concatenate(outVals))
+
+	# inbreeding coefficients of all individuals (array in order of position)
+	# maxEntries : limit on the number of (row, ancestor) entries computed at once, to bound memory
+	# progress : optional function called with the proportion of generations done
+	def inbreeding(self, maxEntries : int = 20000000, progress = None):
+		if self.F is not None:
+			return self.F
+		F = np.zeros(self.n, dtype=np.float64)
+		D = np.ones(self.n, dtype=np.float64)
+		nGen = int(self.gen.max()) + 1 if self.n > 0 else 0
+		for g in range(0, nGen):
+			pos = np.nonzero(self.gen == g)[0]
+			D[pos] = self.withinFamilyVariance(pos, F)
+			# generation 0 individuals have no known parents, so are not inbred
+			if g == 0:
+				continue
+			# one representative of each full sib family
+			family, first, inverse = np.unique(self.sire[pos].astype(np.int64) * (self.n + 1) + self.dam[pos], return_index=True, return_inverse=True)
+			rep = pos[first]
+			famF = np.zeros(len(rep), dtype=np.float64)
+			# chunks of families so that the entries stay below maxEntries (estimated from the
+			# number of ancestors of the first family of each chunk)
+			start = 0
+			while start < len(rep):
+				est = max(1, len(self.traverse(rep[start:(start + 1)], True)) + 1)
+				end = min(len(rep), start + max(1, maxEntries // est))
+				r, c, v = self.tRows(rep[start:end])
+				famF[start:end] = np.bincount(r, weights=v * v * D[c], minlength=end - start) - 1
+				start = end
+			F[pos] = famF[inverse.ravel()]
+			if progress is not None:
+				progress(g / (nGen - 1))
+		self.F = F
+		self.save()
+		return F
+
+	# additive relationship matrix of individuals (ind_id), with rows and columns in the order given
+	def relationships(self, indIDs):
+		pos = self.positions(indIDs)
+		if (pos < 0).any():
+			raise ValueError("Individuals not in the pedigree")
+		F = self.inbreeding()
+		r, c, v = self.tRows(pos)
+		D = self.withinFamilyVariance(np.arange(self.n), F)
+		# dense T for the individuals and their ancestors
+		anc, col = np.unique(c, return_inverse=True)
+		T = np.zeros((len(pos), len(anc)), dtype=np.float64)
+		T[r, col] = v
+		return (T * D[anc]) @ T.T
+
+# write the inbreeding coefficients of all individuals in the pedigree to a tab delimited file
+def writeInbreedingReport(cnx : connector, ped : pedigreeGraph, fileName : str, batchSize : int = 100000):
+	F = ped.inbreeding()
+	names = []
+	with cnx.cursor() as curs:
+		curs.execute("SELECT ind FROM intDBpedigree ORDER BY ind_id")
+		rows = curs.fetchmany(batchSize)
+		while rows:
+			names += [x[0] for x in rows]
+			rows = curs.fetchmany(batchSize)
+	if len(names) != ped.n:
+		raise RuntimeError("The pedigree changed while the report was written")
+	with open(fileName, "w") as fout:
+		fout.write("ind\tsire\tdam\tinbreeding\n")
+		for i in range(0, ped.n):
+			fout.write("%s\t%s\t%s\t%s\n" % (names[i], names[ped.sire[i]] if ped.sire[i] >= 0 else "NA",
+				names[ped.dam[i]] if ped.dam[i] >= 0 else "NA", F[i]))
@@ -0,0 +1,268 @@
+# phenotype tables
+# each phenotype table has one row per individual, keyed by ind_id (linked to the pedigree), and one
+# column per phenotype. Tables are listed in intDBpheno_overview.
+# phenotype files are tab delimited with a header line of column names and one line per individual,
+# one column is the individual name and the others are phenotypes with the types chosen
+# when the table is made: "VARCHAR", "INTEGER", "DOUBLE", "DATE", "TEXT"
+# missing values are empty or NA and are stored as NULL
+# individuals are matched to the pedigree (and added to it if not present) by name, with the names
+# found by scanning the individual column of the file, then the rows are checked and written to a
+# staging file and bulk loaded (see bulkLoad). Individuals added to the pedigree are removed again
+# if the file can't be loaded
+# tables are exported in batches of rows, which are converted to one array per column
+
+import numpy as np
+import mysql.connector as connector
+from .utils import identifier_syntax_check, indsInPedigree, indsInTable, addToPedigree, getIndIDdict, removeIndsNotInTable
+from .fieldScanner import scanField
+from .compressedInput import openInputFile
+from .bulkLoad import stagingFile, loadStagingFile
+from .rowVersions import MODIFIED_COLUMN, MODIFIED_DEFINITION, requireRowVersions, changedSince
+
+# column types that can be chosen for a phenotype file, "Individual" is the individual name
+PHENO_COLUMN_TYPES = ("Individual", "VARCHAR", "INTEGER", "DOUBLE", "DATE", "TEXT")
+
+# values that are read as missing
+MISSING_VALUES = ("", "NA")
+
+# phenotype tables in the database
+def getPhenoTables(cnx : connector) -> list:
+	with cnx.cursor() as curs:
+		curs.execute("SELECT table_name FROM intDBpheno_overview")
+		return [x[0] for x in curs]
+
+# names and types (as in PHENO_COLUMN_TYPES) of the phenotype columns of a table
+# returns (list of column names, list of column types)
+def phenoColumnTypes(cnx : connector, tableName : str):
+	with cnx.cursor() as curs:
+		curs.execute("SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+			(tableName,))
+		cols = [(x[0], "INTEGER" if x[1].upper() == "INT" else x[1].upper()) for x in curs if x[0] not in ("ind_id", MODIFIED_COLUMN)]
+	return ([x[0] for x in cols], [x[1] for x in cols])
+
+# check a value of a phenotype column, returns the value to store (None for missing)
+# raises ValueError if the value can't be stored in the column type
+def checkPhenoValue(value : str, colType : str):
+	if value in MISSING_VALUES:
+		return None
+	if colType == "INTEGER":
+		int(value)
+	elif colType == "DOUBLE":
+		float(value)
+	return value
+
+# read and check a phenotype file, writing rows of (ind_id, phenotypes) to a staging file
+# colTypes : types of the columns of the file, one of which is "Individual"
+# indIDlookup : dictionary of individual name to ind_id
+# returns list of max lengths of each column (0 for non-VARCHAR columns)
+# raises ValueError with a message for the user if an error is found
+def readPhenoFile(fileName : str, staging, colTypes : list, indIDlookup : dict):
+	indPos = colTypes.index("Individual")
+	phenoPos = [i for i in range(0, len(colTypes)) if i != indPos]
+	maxLen = [0] * len(colTypes)
+	with openInputFile(fileName) as f:
+		header = f.readline().rstrip("\n").split("\t")
+		lineNum = 1
+		for l in f:
+			lineNum += 1
+			line = l.rstrip("\n").split("\t")
+			if line == [""]:
+				continue # skip blank lines
+			if len(line) != len(colTypes):
+				raise ValueError("Line %s of the phenotype file has %s columns, expected %s" % (lineNum, len(line), len(colTypes)))
+			row = [str(indIDlookup[line[indPos]])]
+			for i in phenoPos:
+				try:
+					row += [checkPhenoValue(line[i], colTypes[i])]
+				except ValueError:
+					raise ValueError("Line %s of the phenotype file has an invalid %s value for %s: \"%s\"" % (lineNum, colTypes[i], header[i], line[i]))
+				if colTypes[i] == "VARCHAR" and len(line[i]) > maxLen[i]:
+					maxLen[i] = len(line[i])
+			staging.write(row)
+	return maxLen
+
+# individuals of a phenotype file, added to the pedigree (and committed) if not present
+# returns (dictionary of individual name to ind_id, list of ind_id added to the pedigree)
+# the individuals added should be removed (removeIndsNotInTable) if the file is not loaded
+def reconcileIndividuals(cnx : connector, fileName : str, indPos : int):
+	inds, dups = scanField(fileName, indPos, b"\t", skipHeader=True)
+	if dups:
+		raise ValueError("Duplicate individual names in the phenotype file")
+	if "" in inds or "NA" in inds:
+		raise ValueError("Missing individual name in the phenotype file")
+	newInds = indsInPedigree(cnx, inds)[1]
+	addToPedigree(cnx, newInds)
+	cnx.commit()
+	indIDlookup = getIndIDdict(cnx, inds)
+	return (indIDlookup, [indIDlookup[x] for x in newInds])
+
+# make a new phenotype table from a phenotype file
+# colNames, colTypes : name and type of each column of the file
+# returns number of individuals loaded
+def createPhenoTable(cnx : connector, userInfo : dict, tableName : str, fileName : str, colNames : list,
+					colTypes : list, description : str = "", batchSize : int = 10000) -> int:
+	if not identifier_syntax_check(tableName):
+		raise ValueError("Invalid table name")
+	if colTypes.count("Individual") != 1:
+		raise ValueError("(Only) One column must be \"Individual\"")
+	for i in range(0, len(colNames)):
+		if colTypes[i] != "Individual" and (not identifier_syntax_check(colNames[i]) or colNames[i].lower() == "ind_id"):
+			raise ValueError("\"%s\" is an invalid column name" % colNames[i])
+	with cnx.cursor() as curs:
+		curs.execute("SHOW TABLES LIKE %s", (tableName,))
+		if curs.fetchone() is not None:
+			raise ValueError("A table with that name already exists, please pick a different table name")
+
+	indIDlookup, newIDs = reconcileIndividuals(cnx, fileName, colTypes.index("Individual"))
+	staging = stagingFile()
+	try:
+		maxLen = readPhenoFile(fileName, staging, colTypes, indIDlookup)
+		phenoPos = [i for i in range(0, len(colTypes)) if colTypes[i] != "Individual"]
+		cols = []
+		for i in phenoPos:
+			if colTypes[i] == "VARCHAR":
+				cols += ["`%s` VARCHAR(%s)" % (colNames[i], max(1, maxLen[i]))]
+			else:
+				cols += ["`%s` %s" % (colNames[i], colTypes[i])]
+		with cnx.cursor() as curs:
+			curs.execute("CREATE TABLE `%s` (ind_id INTEGER UNSIGNED PRIMARY KEY, %s, %s, INDEX (%s), FOREIGN KEY (ind_id) REFERENCES intDBpedigree(ind_id))" %
+				(tableName, ", ".join(cols), MODIFIED_DEFINITION, MODIFIED_COLUMN))
+			try:
+				loadStagingFile(cnx, userInfo, tableName, ["ind_id"] + [colNames[i] for i in phenoPos], staging, batchSize)
+				curs.execute("INSERT INTO intDBpheno_overview VALUES (%s, %s, %s)", (tableName, len(phenoPos), description))
+				cnx.commit()
+			except BaseException:
+				cnx.rollback()
+				curs.execute("DROP TABLE `%s`" % tableName)
+				raise
+	except BaseException:
+		# the table was not made, so none of the individuals added to the pedigree are used
+		cnx.rollback()
+		removeIndsNotInTable(cnx, None, newIDs)
+		cnx.commit()
+		raise
+	finally:
+		staging.remove()
+	return len(indIDlookup)
+
+# add individuals to an existing phenotype table
+# the header of the file must have the individual column (named indColumn) and the same phenotype
+# columns as the table, in any order
+# individuals already in the table are not allowed
+# returns number of individuals loaded
+def loadPhenotypes(cnx : connector, userInfo : dict, tableName : str, fileName : str, indColumn : str,
+					batchSize : int = 10000) -> int:
+	tableCols, tableTypes = phenoColumnTypes(cnx, tableName)
+	with openInputFile(fileName) as f:
+		header = f.readline().rstrip("\n").split("\t")
+	if header.count(indColumn) != 1:
+		raise ValueError("The phenotype file must have one \"%s\" column" % indColumn)
+	phenoCols = [x for x in header if x != indColumn]
+	if sorted(phenoCols) != sorted(tableCols):
+		raise ValueError("The columns of the phenotype file do not match the columns of %s" % tableName)
+	colTypes = ["Individual" if x == indColumn else tableTypes[tableCols.index(x)] for x in header]
+	indPos = header.index(indColumn)
+
+	inds = scanField(fileName, indPos, b"\t", skipHeader=True)[0]
+	if len(indsInTable(cnx, inds, tableName)[0]) > 0:
+		raise ValueError("One or more individuals are already in %s" % tableName)
+	indIDlookup, newIDs = reconcileIndividuals(cnx, fileName, indPos)
+	staging = stagingFile()
+	try:
+		maxLen = readPhenoFile(fileName, staging, colTypes, indIDlookup)
+		# widen VARCHAR columns if needed
+		with cnx.cursor() as curs:
+			curs.execute("SELECT COLUMN_NAME, CHARACTER_MAXIMUM_LENGTH FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND DATA_TYPE = 'varchar'",
+				(tableName,))
+			curLen = {x[0] : x[1] for x in curs}
+			toWiden = ["MODIFY `%s` VARCHAR(%s)" % (header[i], maxLen[i]) for i in range(0, len(header))
+				if header[i] in curLen and maxLen[i] > curLen[header[i]]]
+			if len(toWiden) > 0:
+				curs.execute("ALTER TABLE `%s` %s" % (tableName, ", ".join(toWiden)))
+		loadStagingFile(cnx, userInfo, tableName, ["ind_id"] + [header[i] for i in range(0, len(header)) if i != indPos], staging, batchSize)
+		cnx.commit()
+	except BaseException:
+		cnx.rollback()
+		removeIndsNotInTable(cnx, tableName, newIDs)
+		cnx.commit()
+		raise
+	finally:
+		staging.remove()
+	return len(indIDlookup)
+
+# convert a list of values of a column to an array
+# INTEGER and DOUBLE columns are float64 with nan for NULL, others are object arrays with None for NULL
+def columnArray(values : list, colType : str):
+	if colType in ("INTEGER", "DOUBLE"):
+		return np.array([np.nan if x is None else x for x in values], dtype=np.float64)
+	return np.array(values, dtype=object)
+
+# format an array of a column (see columnArray) as a list of str, NA for missing
+def formatColumn(values, colType : str) -> list:
+	if values.dtype == object:
+		return ["NA" if x is None else str(x) for x in values]
+	s = np.full(len(values), "NA", dtype=object)
+	called = ~np.isnan(values)
+	s[called] = (values[called].astype(np.int64) if colType == "INTEGER" else values[called]).astype(str)
+	return s.tolist()
+
+# stream a phenotype table in batches of rows
+# columns : phenotype columns to read, None for all
+# indIDs : optional ind_id to read, otherwise all individuals in the table
+# since : only rows changed since a watermark (see rowVersions)
+# yields (list of individual names, array of ind_id, dict of column name to array (see columnArray))
+def iterPhenoBatches(cnx : connector, tableName : str, columns : list = None, indIDs = None, batchSize : int = 10000,
+					since : str = None):
+	tableCols, tableTypes = phenoColumnTypes(cnx, tableName)
+	if columns is None:
+		columns = tableCols
+	for x in columns:
+		if x not in tableCols:
+			raise ValueError("%s is not a column of %s" % (x, tableName))
+	types = [tableTypes[tableCols.index(x)] for x in columns]
+	sqlState = "SELECT p.ind, t.ind_id%s FROM `%s` AS t INNER JOIN intDBpedigree AS p ON t.ind_id = p.ind_id" % (
+		"".join([", t.`%s`" % x for x in columns]), tableName)
+	# only rows changed since a watermark (see rowVersions)
+	params = []
+	sqlState += " WHERE 1 = 1"
+	if since is not None:
+		requireRowVersions(cnx, [tableName])
+		condition, params = changedSince(["t"], since)
+		sqlState += " AND " + condition
+	def toArrays(rows):
+		return ([x[0] for x in rows], np.array([x[1] for x in rows], dtype=np.int64),
+			{columns[j] : columnArray([x[j + 2] for x in rows], types[j]) for j in range(0, len(columns))})
+	with cnx.cursor() as curs:
+		if indIDs is None:
+			curs.execute(sqlState + " ORDER BY t.ind_id", params)
+			rows = curs.fetchmany(batchSize)
+			while rows:
+				yield toArrays(rows)
+				rows = curs.fetchmany(batchSize)
+		else:
+			indIDs = sorted(set([int(x) for x in indIDs]))
+			for i in range(0, len(indIDs), batchSize):
+				batch = indIDs[i:(i + batchSize)]
+				curs.execute(sqlState + " AND t.ind_id IN (%s) ORDER BY t.ind_id" % ",".join(["%s"] * len(batch)), params + batch)
+				rows = curs.fetchall()
+				if len(rows) > 0:
+					yield toArrays(rows)
+
+# write a phenotype table to a tab delimited file, missing values are NA
+# since : only individuals changed since a watermark (see rowVersions)
+# returns number of individuals written
+def exportPhenoTable(cnx : connector, tableName : str, fileName : str, columns : list = None, batchSize : int = 10000,
+					since : str = None) -> int:
+	tableCols, tableTypes = phenoColumnTypes(cnx, tableName)
+	if columns is None:
+		columns = tableCols
+	types = {x : tableTypes[tableCols.index(x)] for x in columns if x in tableCols}
+	n = 0
+	with open(fileName, "w") as fout:
+		fout.write("\t".join(["ind"] + columns) + "\n")
+		for names, ids, values in iterPhenoBatches(cnx, tableName, columns, batchSize=batchSize, since=since):
+			# each column is formatted as a whole, then the lines are joined
+			cols = [names] + [formatColumn(values[x], types[x]) for x in columns]
+			fout.writelines(["\t".join(row) + "\n" for row in zip(*cols)])
+			n += len(names)
+	return n
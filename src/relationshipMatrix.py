@@ -0,0 +1,114 @@
+# genomic relationship matrix (VanRaden method 1) from a Biallelic panel
+#   G = Z Z' / (ploidy * sum_j p_j (1 - p_j))
+# where Z is the matrix of alt allele copies centered by ploidy * p_j (alt allele frequency of
+# locus j among the genotyped individuals), with missing genotypes set to 0 (the mean)
+# computed out of core so panels with more individuals or loci than fit in memory work:
+#   1. genotypes are read from the database in batches and their codes are written to a temporary
+#      memory-mapped file (one byte per genotype) while allele frequencies are accumulated
+#   2. G is computed in tiles of blockSize x blockSize individuals (upper triangle), each the sum over
+#      blocks of lociBlock loci of Z_I Z_J' (BLAS matrix multiplies of centered blocks made from the codes)
+#      tiles are spread over a thread pool (numpy releases the GIL in BLAS calls) and written, with
+#      their transpose, to the output memory-mapped file
+# output is a binary file of float32 in row major order (individuals x individuals) and a text file
+# (fileName + ".inds") with the individual names of the rows, in order
+
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import mysql.connector as connector
+from .utils import getPanelInfo, getIndNames
+from .genotypeCodec import missingCode, getGenotypeCodes
+
+# read genotype codes of a panel into a memory-mapped file
+# returns (array of ind_id, codes memmap (individuals x loci), alt allele frequency of each locus)
+def codesToMemmap(cnx : connector, panelName : str, fileName : str, batchSize : int = 1000):
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	miss = missingCode(panelType, ploidy)
+	with cnx.cursor() as curs:
+		curs.execute("SELECT ind_id FROM `intDB%s_gt` ORDER BY ind_id" % panelName)
+		indIDs = np.array([x[0] for x in curs], dtype=np.int64)
+	codes = np.memmap(fileName, dtype=np.uint8, mode="w+", shape=(max(1, len(indIDs)), nLoci))
+	altCopies = np.zeros(nLoci, dtype=np.int64)
+	nCalled = np.zeros(nLoci, dtype=np.int64)
+	for i in range(0, len(indIDs), batchSize):
+		ids, batch = getGenotypeCodes(cnx, panelName, indIDs[i:(i + batchSize)], batchSize)
+		if not np.array_equal(ids, indIDs[i:(i + batchSize)]):
+			raise RuntimeError("Genotypes were removed from panel %s while they were being read" % panelName)
+		codes[i:(i + batchSize)] = batch
+		called = batch != miss
+		altCopies += np.where(called, batch, 0).sum(axis=0, dtype=np.int64)
+		nCalled += called.sum(axis=0)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		freq = np.where(nCalled > 0, altCopies / (ploidy * nCalled), 0)
+	return (indIDs, codes, freq)
+
+# centered alt allele copies of a block of codes, missing genotypes are 0
+def centerCodes(codes, center, miss : int):
+	z = codes.astype(np.float32)
+	z -= center
+	z[codes == miss] = 0
+	return z
+
+# compute the genomic relationship matrix of all genotyped individuals of a Biallelic panel
+# fileName : output file, the individual names are written to fileName + ".inds"
+# blockSize : number of individuals in each tile
+# lociBlock : number of loci in each matrix multiply
+# progress : optional function called (in this thread) with the proportion of tiles done
+# returns number of individuals
+def computeGRM(cnx : connector, panelName : str, fileName : str, blockSize : int = 2048, lociBlock : int = 4096,
+				nThreads : int = 4, batchSize : int = 1000, progress = None) -> int:
+	panelType, ploidy, nLoci = getPanelInfo(cnx, panelName)
+	if panelType != "Biallelic":
+		raise ValueError("Genomic relationship matrices are only available for Biallelic panels")
+	miss = missingCode(panelType, ploidy)
+	fd, codesFile = tempfile.mkstemp(suffix=".codes", dir=os.path.dirname(os.path.abspath(fileName)))
+	os.close(fd)
+	try:
+		indIDs, codes, freq = codesToMemmap(cnx, panelName, codesFile, batchSize)
+		n = len(indIDs)
+		if n == 0:
+			raise ValueError("No individuals are genotyped in panel %s" % panelName)
+		scale = ploidy * np.sum(freq * (1 - freq))
+		if scale == 0:
+			raise ValueError("No loci are polymorphic in panel %s" % panelName)
+		center = (ploidy * freq).astype(np.float32)
+		grm = np.memmap(fileName, dtype=np.float32, mode="w+", shape=(n, n))
+
+		def tile(rowStart, colStart):
+			rows = slice(rowStart, min(rowStart + blockSize, n))
+			cols = slice(colStart, min(colStart + blockSize, n))
+			acc = np.zeros((rows.stop - rows.start, cols.stop - cols.start), dtype=np.float64)
+			for l in range(0, nLoci, lociBlock):
+				loci = slice(l, min(l + lociBlock, nLoci))
+				zr = centerCodes(codes[rows, loci], center[loci], miss)
+				zc = zr if rowStart == colStart else centerCodes(codes[cols, loci], center[loci], miss)
+				acc += zr @ zc.T
+			acc /= scale
+			grm[rows, cols] = acc
+			if rowStart != colStart:
+				grm[cols, rows] = acc.T
+
+		tiles = [(r, c) for r in range(0, n, blockSize) for c in range(r, n, blockSize)]
+		with ThreadPoolExecutor(max_workers=max(1, nThreads)) as pool:
+			futures = [pool.submit(tile, r, c) for r, c in tiles]
+			for k, f in enumerate(as_completed(futures)):
+				f.result()
+				if progress is not None:
+					progress((k + 1) / len(tiles))
+		grm.flush()
+		del grm, codes
+	finally:
+		os.remove(codesFile)
+	names = getIndNames(cnx, indIDs)
+	with open(fileName + ".inds", "w") as fout:
+		for x in indIDs:
+			fout.write(names[x] + "\n")
+	return n
+
+# open a matrix written by computeGRM
+# returns (list of individual names, read only memmap of the matrix)
+def readGRM(fileName : str):
+	with open(fileName + ".inds", "r") as f:
+		names = [x.rstrip("\n") for x in f]
+	return (names, np.memmap(fileName, dtype=np.float32, mode="r", shape=(len(names), len(names))))
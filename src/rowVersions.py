@@ -0,0 +1,121 @@
+# row versioning for incremental (delta) exports
+# the pedigree, genotype (intDB<panel>_gt), phenotype, and genetic grouping tables have a column
+# intDBmodified that the server sets to the time a row is inserted or changed
+# (DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)), so every import and update path maintains it
+# an export is made incremental by a watermark (getWatermark) taken before an export and used as "since"
+# for the next one, and only rows with intDBmodified >= since are exported
+# intDBmodified is set when a statement runs, not when its transaction commits, so rows written by an
+# import that is still open during an export are older than the export's server time but not yet visible.
+# The watermark is therefore the start of the oldest open transaction (if earlier than now) minus a safety
+# margin, so those rows are exported next time (or now minus a wider margin if the user can't see other
+# connections' transactions, see getWatermark). Rows can be exported more than once (the next export
+# repeats rows changed after the watermark), but are not missed. Deleted rows are not tracked.
+# databases made before row versioning are upgraded with addRowVersions
+
+import mysql.connector as connector
+
+MODIFIED_COLUMN = "intDBmodified"
+MODIFIED_DEFINITION = "intDBmodified TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"
+
+# tables that carry row versions
+def versionedTables(cnx : connector) -> list:
+	tables = ["intDBpedigree"]
+	with cnx.cursor() as curs:
+		curs.execute("SELECT panel_name FROM intDBgeno_overview")
+		tables += ["intDB%s_gt" % x[0] for x in curs]
+		curs.execute("SELECT table_name FROM intDBpheno_overview")
+		tables += [x[0] for x in curs]
+		curs.execute("SELECT grouping_name FROM intDBgen_group_overview")
+		tables += [x[0] for x in curs]
+	return tables
+
+# tables (of tableNames) that have the row version column
+def tablesWithRowVersions(cnx : connector, tableNames : list) -> set:
+	if len(tableNames) == 0:
+		return set()
+	with cnx.cursor() as curs:
+		curs.execute("SELECT TABLE_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_NAME = %%s AND TABLE_NAME IN (%s)" %
+			",".join(["%s"] * len(tableNames)), [MODIFIED_COLUMN] + list(tableNames))
+		return set([x[0] for x in curs])
+
+# raise ValueError if any of tableNames doesn't have row versions
+def requireRowVersions(cnx : connector, tableNames : list):
+	missing = [x for x in tableNames if x not in tablesWithRowVersions(cnx, tableNames)]
+	if len(missing) > 0:
+		raise ValueError("Row versioning is not enabled for %s, enable it before exporting changes" % ", ".join(missing))
+
+# add the row version column to all versioned tables that don't have it
+# existing rows get the current time
+# returns list of tables changed
+def addRowVersions(cnx : connector) -> list:
+	tables = versionedTables(cnx)
+	have = tablesWithRowVersions(cnx, tables)
+	changed = []
+	with cnx.cursor() as curs:
+		for x in tables:
+			if x in have:
+				continue
+			curs.execute("ALTER TABLE `%s` ADD COLUMN %s, ADD INDEX (%s)" % (x, MODIFIED_DEFINITION, MODIFIED_COLUMN))
+			changed += [x]
+	return changed
+
+# error when the user doesn't have a privilege the statement needs (ER_SPECIFIC_ACCESS_DENIED_ERROR)
+ACCESS_DENIED_ERRORS = (1227,)
+
+# watermark string for the next export: the current server time, or the start of the oldest transaction
+# open on another connection if that is earlier, minus margin seconds (trx_started is only to the second)
+# trx_started is in the server's system time zone, so it is converted to the session time zone that
+# intDBmodified and NOW(6) are compared in
+# reading information_schema.innodb_trx requires the PROCESS privilege. Without it open transactions
+# can't be seen, so the watermark is the current time minus fallbackMargin seconds, which only covers
+# imports whose open transactions started less than fallbackMargin seconds ago
+def getWatermark(cnx : connector, margin : int = 5, fallbackMargin : int = 3600) -> str:
+	with cnx.cursor() as curs:
+		try:
+			curs.execute("""SELECT DATE_FORMAT(LEAST(NOW(6), IFNULL((SELECT CONVERT_TZ(MIN(trx_started), 'SYSTEM', @@session.time_zone)
+				FROM information_schema.innodb_trx WHERE trx_mysql_thread_id <> CONNECTION_ID()), NOW(6))) - INTERVAL %s SECOND,
+				'%%Y-%%m-%%d %%H:%%i:%%s.%%f')""", (int(margin),))
+		except connector.Error as e:
+			if e.errno not in ACCESS_DENIED_ERRORS:
+				raise
+			curs.execute("SELECT DATE_FORMAT(NOW(6) - INTERVAL %s SECOND, '%%Y-%%m-%%d %%H:%%i:%%s.%%f')", (int(fallbackMargin),))
+		return curs.fetchone()[0]
+
+# condition selecting rows of tables (aliases) changed since a watermark
+# returns (SQL condition to add with AND, parameters)
+def changedSince(aliases : list, since : str):
+	return ("(%s)" % " OR ".join(["%s.%s >= %%s" % (x, MODIFIED_COLUMN) for x in aliases]), [since] * len(aliases))
+
+# save the watermark of an export next to the exported file
+def writeWatermark(fileName : str, watermark : str):
+	with open(fileName + ".watermark", "w") as fout:
+		fout.write(watermark + "\n")
+
+# watermark saved with writeWatermark, None if there is none
+def readWatermark(fileName : str):
+	try:
+		with open(fileName + ".watermark", "r") as f:
+			return f.readline().strip()
+	except FileNotFoundError:
+		return None
+
+# write individuals, sires, and dams of the pedigree (only those changed since a watermark if since is given)
+# to a tab delimited file, unknown parents are NA
+# returns number of individuals written
+def exportPedigree(cnx : connector, fileName : str, since : str = None, batchSize : int = 10000) -> int:
+	sqlState = "SELECT p.ind, ps.ind, pd.ind FROM intDBpedigree AS p LEFT JOIN intDBpedigree AS ps ON p.sire = ps.ind_id LEFT JOIN intDBpedigree AS pd ON p.dam = pd.ind_id"
+	params = []
+	if since is not None:
+		requireRowVersions(cnx, ["intDBpedigree"])
+		condition, params = changedSince(["p"], since)
+		sqlState += " WHERE " + condition
+	n = 0
+	with open(fileName, "w") as fout, cnx.cursor() as curs:
+		fout.write("\t".join(["ind", "sire", "dam"]) + "\n")
+		curs.execute(sqlState + " ORDER BY p.ind_id", params)
+		rows = curs.fetchmany(batchSize)
+		while rows:
+			fout.writelines(["\t".join(["NA" if y is None else y for y in x]) + "\n" for x in rows])
+			n += len(rows)
+			rows = curs.fetchmany(batchSize)
+	return n
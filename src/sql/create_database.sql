@@ -23,11 +23,14 @@ CREATE TABLE intDBgen_group_overview (
 
 -- create pedigree table
 -- for sire and dam: 0 means founder, NULL means not entered
+-- intDBmodified is the time the row was last changed (for incremental exports)
 CREATE TABLE intDBpedigree (
 	ind_id INTEGER UNSIGNED PRIMARY KEY AUTO_INCREMENT,
 	ind VARCHAR (255) UNIQUE NOT NULL,
 	sire INTEGER UNSIGNED,
 	dam INTEGER UNSIGNED,
+	intDBmodified TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
 	INDEX (sire), -- indexing all columns for fast joins and searches
-	INDEX (dam)
+	INDEX (dam),
+	INDEX (intDBmodified)
 );
@@ -0,0 +1,20 @@
+/* Progress of genotype imports, used to resume a failed import
+host, db_name, panel_name where the genotypes are being imported
+fingerprint identifies the input file (size and hash of its start and end)
+import_mode "add" or "update"
+n_done number of individuals from the start of the file that are committed
+status "running", "failed", or "complete"
+updated time of the last change to this row
+*/
+CREATE TABLE IF NOT EXISTS import_journal (
+	host TEXT NOT NULL,
+	db_name TEXT NOT NULL,
+	panel_name TEXT NOT NULL,
+	fingerprint TEXT NOT NULL,
+	import_mode TEXT NOT NULL,
+	file_name TEXT,
+	n_done INTEGER NOT NULL DEFAULT 0,
+	status TEXT NOT NULL,
+	updated TEXT NOT NULL,
+	PRIMARY KEY (host, db_name, panel_name, fingerprint, import_mode)
+);
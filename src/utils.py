@@ -8,6 +8,7 @@ from PyQt6.QtWidgets import (
 	QMessageBox
 )
 from . import PACKAGEDIR
+from .fieldScanner import scanField
 
 class dlgError(QMessageBox):
 	def __init__(self, parent = None, message = ""):
@@ -16,7 +17,8 @@ class dlgError(QMessageBox):
 		self.setText(message)
 		self.exec()
 
-def saveInfo(userInfo : dict):
+# open the local gui database, creating it if it does not exist
+def getGuiDB():
 	# check if directory exists and make if not
 	if not os.path.isdir(os.path.join(PACKAGEDIR, "interface_db")):
 		os.mkdir(os.path.join(PACKAGEDIR, "interface_db"))
@@ -30,6 +32,10 @@ def saveInfo(userInfo : dict):
 		# create empty tables
 		with open(os.path.join(PACKAGEDIR, "sql/gui_initialize.sql"), mode="r", encoding = "utf-8") as f:
 			gui_db.executescript(f.read())
+	return gui_db
+
+def saveInfo(userInfo : dict):
+	gui_db = getGuiDB()
 	
 	# add info to gui database
 	curs_host = gui_db.execute("SELECT host_id FROM server_info WHERE host = ? LIMIT 1", (userInfo["host"],))
@@ -94,10 +100,19 @@ def getNumLoci(cnx : connector, panelName : str) -> int:
 		curs.execute("SELECT number_of_loci FROM intDBgeno_overview where panel_name = %s", (panelName,))
 		return curs.fetchone()[0]
 
+# get panel type, ploidy, and number of loci in a panel
+# returns tuple of (panel type, ploidy, number of loci)
+def getPanelInfo(cnx : connector, panelName : str):
+	with cnx.cursor() as curs:
+		curs.execute("SELECT panel_type, ploidy, number_of_loci FROM intDBgeno_overview WHERE panel_name = %s", (panelName,))
+		return curs.fetchone()
+
 # function to start a new connection
-def getConnection(userInfo : dict):
+# allowLocalInfile: allow LOAD DATA LOCAL INFILE on this connection (only used for bulk loads)
+def getConnection(userInfo : dict, allowLocalInfile : bool = False):
 	cnx = connector.connect(user=userInfo["un"], password=userInfo["pw"], 
-						 host=userInfo["host"], database=userInfo["db"], autocommit=False)
+						 host=userInfo["host"], database=userInfo["db"], autocommit=False,
+						 allow_local_infile=allowLocalInfile)
 	return cnx
 
 # return a cursor with locus names in a panel ordered by auto_incrementing id number
@@ -128,6 +143,11 @@ def removePartialPanel(userInfo : dict, panelName : str):
 				return 1
 			# remove genotype table
 			curs.execute("DROP TABLE `intdb%s_gt`" % panelName)
+		# remove summary tables, if they exist
+		for suffix in ("_iq", "_lc", "_ls"):
+			curs.execute("SHOW TABLES LIKE 'intdb%s%s'" % (panelName, suffix))
+			if next(curs, [None])[0] is not None:
+				curs.execute("DROP TABLE `intdb%s%s`" % (panelName, suffix))
 		# remove lookup table, if it exists
 		curs.execute("SHOW TABLES LIKE 'intdb%s_lt'" % panelName)
 		if next(curs, [None])[0] is not None:
@@ -145,11 +165,15 @@ def removePartialPanel(userInfo : dict, panelName : str):
 # checking which inds are in the pedigree already
 # returns a tuple of two tuples, first has inds in 
 # the pedigree, second has inds not in the pedigree
-def indsInPedigree(cnx : connector, inds : list):
+def indsInPedigree(cnx : connector, inds : list, batchSize : int = 10000):
+	inPed = []
 	with cnx.cursor() as curs:
-		curs.execute("SELECT ind FROM intDBpedigree WHERE ind IN (%s)" % ",".join(["'%s'" % x for x in inds]))
-		inPed = [x[0] for x in curs]
-	outPed = [x for x in inds if x not in inPed]
+		for i in range(0, len(inds), batchSize):
+			batch = list(inds[i:(i + batchSize)])
+			curs.execute("SELECT ind FROM intDBpedigree WHERE ind IN (%s)" % ",".join(["%s"] * len(batch)), batch)
+			inPed += [x[0] for x in curs]
+	inSet = set(inPed)
+	outPed = [x for x in inds if x not in inSet]
 	return (tuple(inPed), tuple(outPed))
 
 # checking which inds are in a table already
@@ -157,55 +181,52 @@ def indsInPedigree(cnx : connector, inds : list):
 # the table, second has inds not in the table
 # assumes table has ind_id column which
 # should be linked as foreign key to pedigree table
-def indsInTable(cnx : connector, inds : list, tableName : str):
+def indsInTable(cnx : connector, inds : list, tableName : str, batchSize : int = 10000):
+	inTable = []
 	with cnx.cursor() as curs:
-		sqlState = """
-		SELECT intDBpedigree.ind
-		FROM intDBpedigree
-		INNER JOIN `%s` AS panel ON intDBpedigree.ind_id=panel.ind_id
-		WHERE intDBpedigree.ind IN (%s)
-		""" % (tableName, ",".join(["'%s'" % x for x in inds]))
-		curs.execute(sqlState)
-		inTable = [x[0] for x in curs]
-	outTable = [x for x in inds if x not in inTable]
+		for i in range(0, len(inds), batchSize):
+			batch = list(inds[i:(i + batchSize)])
+			sqlState = """
+			SELECT intDBpedigree.ind
+			FROM intDBpedigree
+			INNER JOIN `%s` AS panel ON intDBpedigree.ind_id=panel.ind_id
+			WHERE intDBpedigree.ind IN (%s)
+			""" % (tableName, ",".join(["%s"] * len(batch)))
+			curs.execute(sqlState, batch)
+			inTable += [x[0] for x in curs]
+	inSet = set(inTable)
+	outTable = [x for x in inds if x not in inSet]
 	return (tuple(inTable), tuple(outTable))
 
-# return a list of individual names from a 2col format file
+# return a list of individual names from a genotype file (each name once, in file order)
 # and a boolean of whether there are duplicate ind names
 def getIndsFromFile(fileName : str, fileType : str) -> list:
 	if fileType == "2col" or fileType == "long":
-		with open(fileName, "r") as f:
-			header = f.readline() # skip header
-			inds = [line.rstrip("\n").split("\t")[0] for line in f]
+		inds, dups = scanField(fileName, 0, b"\t", skipHeader=True)
 	elif fileType == "PLINK ped":
-		with open(fileName, "r") as f:
-			# using within family ID
-			inds = [re.split("\t| ", line.rstrip("\n"))[1] for line in f]
+		# using within family ID
+		inds, dups = scanField(fileName, 1, b"\t ")
 	else:
 		raise Exception("Internal error: file type not supported by getIndsFromFile")
-	
-	# check for duplicates
-	if len(inds) > len(set(inds)):
-		dups = True
-	else:
-		dups = False
 	return [tuple(inds), dups]
 
 # add individuals to the pedigree (optionally sire and dam information as well)
 # inds, sire, dam are either tuples or lists
-def addToPedigree(cnx: connector, inds, sire = None, dam = None):
+# does not commit
+def addToPedigree(cnx: connector, inds, sire = None, dam = None, batchSize : int = 10000):
 	if len(inds) == 0:
 		return 0
 	with cnx.cursor() as curs:
 		if sire is None and dam is None:
 			# just add inds
-			sqlState = "INSERT INTO intDBpedigree (ind) VALUES"
 			for name in inds:
 				if name == "":
 					dlgError(message="Invalid individual name (empty string) found.")
 					raise ValueError("Empty string cannot be an individual name.")
-				sqlState += " ('%s')," % name
-			curs.execute(sqlState.rstrip(","))
+			# insert in batches to keep statements a reasonable size
+			inds = [(x,) for x in inds]
+			for i in range(0, len(inds), batchSize):
+				curs.executemany("INSERT INTO intDBpedigree (ind) VALUES (%s)", inds[i:(i + batchSize)])
 		elif sire is None:
 			if len(inds) != len(dam):
 				return 1
@@ -220,16 +241,51 @@ def addToPedigree(cnx: connector, inds, sire = None, dam = None):
 			pass
 	return 0
 
+# remove individuals (ind_id) from the pedigree that have no row in a table (e.g., a genotype table),
+# or all of them if tableName is None
+# used to remove individuals added to the pedigree for an import but not imported
+# (failed QC thresholds, the file had an error, or the import stopped before they were written)
+# does not commit
+def removeIndsNotInTable(cnx : connector, tableName, indIDs : list, batchSize : int = 10000):
+	indIDs = [int(x) for x in indIDs]
+	with cnx.cursor() as curs:
+		for i in range(0, len(indIDs), batchSize):
+			batch = indIDs[i:(i + batchSize)]
+			if tableName is None:
+				curs.execute("DELETE FROM intDBpedigree WHERE ind_id IN (%s)" % ",".join(["%s"] * len(batch)), batch)
+				continue
+			sqlState = """
+			DELETE intDBpedigree FROM intDBpedigree
+			LEFT JOIN `%s` AS panel ON intDBpedigree.ind_id=panel.ind_id
+			WHERE panel.ind_id IS NULL AND intDBpedigree.ind_id IN (%s)
+			""" % (tableName, ",".join(["%s"] * len(batch)))
+			curs.execute(sqlState, batch)
+
 # get ind_id from database and return dict
 # key of ind name, value of ind_id
-def getIndIDdict(cnx : connector, inds : list):
+def getIndIDdict(cnx : connector, inds : list, batchSize : int = 10000):
+	indID = {}
 	with cnx.cursor() as curs:
-		curs.execute("SELECT ind, ind_id FROM intDBpedigree WHERE ind IN (%s)" % ",".join(["'%s'" % x for x in inds]))
-		indID = {}
-		for x in curs:
-			indID[x[0]] = x[1]
+		for i in range(0, len(inds), batchSize):
+			batch = list(inds[i:(i + batchSize)])
+			curs.execute("SELECT ind, ind_id FROM intDBpedigree WHERE ind IN (%s)" % ",".join(["%s"] * len(batch)), batch)
+			for x in curs:
+				indID[x[0]] = x[1]
 	return indID
 
+# names of individuals from their ind_id
+# returns dictionary of key = ind_id, value = individual name
+def getIndNames(cnx : connector, indIDs, batchSize : int = 10000) -> dict:
+	indIDs = [int(x) for x in indIDs]
+	names = {}
+	with cnx.cursor() as curs:
+		for i in range(0, len(indIDs), batchSize):
+			batchIDs = indIDs[i:(i + batchSize)]
+			curs.execute("SELECT ind_id, ind FROM intDBpedigree WHERE ind_id IN (%s)" % ",".join(["%s"] * len(batchIDs)), batchIDs)
+			for x in curs:
+				names[x[0]] = x[1]
+	return names
+
 # get the dictionary object used to convert input genotypes from a file into
 # the representation in the database
 # returns dictionary of key = locus name, 
@@ -297,6 +353,14 @@ def getLocusOrderInBlob(cnx : connector, panelName : str):
 		locusOrder = tuple([x[0] for x in curs])
 	return locusOrder
 
+# returns a tuple of locus ids in the order that
+# they are stored in the BLOB within the database
+def getLocusIDsInBlob(cnx : connector, panelName : str):
+	with cnx.cursor() as curs:
+		curs.execute("SELECT intDBlocus_id FROM `%s` ORDER BY intDBlocus_id" % panelName)
+		locusIDs = tuple([x[0] for x in curs])
+	return locusIDs
+
 # geno : iterable with each element being an allele, e.g. ("A", "C") represents a heterozygous diploid genotype
 # refAlt : tuple of (refAllele, altAllele), e.g., element of list returned by getRefAlt
 # missing allele is empty string "" (only checks first allele - assumes either all missing or none missing)